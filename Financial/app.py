@@ -3,14 +3,18 @@ import pandas as pd
 import os
 import base64
 import io
+import time
 from PIL import Image
 from components.dashboard import render_dashboard
 from components.product_form import render_product_form
 from components.product_list import render_product_list
 from components.login import render_login_page
 from components.user_management import render_user_management
-from utils.data_manager import load_data
+from utils.data_manager import load_data_cached
+from utils.migrations import ensure_schema
+from utils.notifications import start_listener
 from utils.auth import is_logged_in, is_admin, logout
+from utils.metrics import record_rerun
 
 # Importazione del logo incorporato
 from app_logo import LOGO_BASE64
@@ -23,7 +27,20 @@ st.set_page_config(
     initial_sidebar_state="expanded"  # Cambiato a expanded per mostrare la sidebar del login
 )
 
-# Funzione per caricare il logo
+# Inizio dell'esecuzione completa dello script, per misurarne la durata
+run_started = time.perf_counter()
+
+# Aggiorna lo schema del database una sola volta per processo: senza le tabelle
+# indispensabili (es. gli aggregati del portafoglio) ogni salvataggio fallirebbe
+if not ensure_schema():
+    st.error("Impossibile aggiornare lo schema del database. Controlla la connessione e i log delle migrazioni, poi ricarica la pagina.")
+    st.stop()
+
+# Thread in ascolto delle modifiche fatte da altre repliche, per invalidare le cache
+start_listener()
+
+# Funzione per caricare il logo (decodificato una sola volta per processo)
+@st.cache_resource(show_spinner=False)
 def get_logo():
     """
     Restituisce il logo come immagine PIL, usando la versione base64 incorporata
@@ -105,8 +122,10 @@ if 'edit_product' not in st.session_state:
 if 'duplicate_product' not in st.session_state:
     st.session_state.duplicate_product = None
 
+# Forza la rilettura del portafoglio ignorando la cache (la validità della cache
+# è già verificata a ogni rerun tramite la versione dei dati)
 if 'reload_data' not in st.session_state:
-    st.session_state.reload_data = True
+    st.session_state.reload_data = False
     
 # Stato per gestire quale tab è attiva - default: "dashboard"
 if 'active_tab' not in st.session_state:
@@ -132,8 +151,14 @@ user_logged_in = render_login_page()
 
 # Prosegui solo se l'utente è loggato
 if user_logged_in:
-    # Load data - always reload from database on page load
-    df = load_data()
+    # Load data - la cache viene riletta dal database solo se la versione dei dati
+    # è cambiata (o se è stato richiesto esplicitamente un ricaricamento).
+    # L'elenco prodotti legge dal database solo la pagina visibile: lì non serve;
+    # la dashboard mostra prima i totali calcolati dal database e legge i prodotti dopo
+    df = None
+    if st.session_state.active_tab == "add" or (st.session_state.active_tab == "dashboard" and st.session_state.reload_data):
+        df = load_data_cached(force_reload=st.session_state.reload_data)
+        st.session_state.reload_data = False
     
     # Layout con logo sopra e pulsanti di navigazione in linea
     st.markdown("<div style='margin-top: 0;'></div>", unsafe_allow_html=True)
@@ -255,7 +280,7 @@ if user_logged_in:
             st.rerun()
             
     elif st.session_state.active_tab == "list":
-        render_product_list(df)
+        render_product_list()
         
     elif st.session_state.active_tab == "users" and is_admin():
         render_user_management()
@@ -263,6 +288,9 @@ if user_logged_in:
     # Footer
     st.divider()
     st.caption("© 2025 My $av€ DC")
+    
+    # Durata dell'esecuzione completa (i frammenti misurano le proprie riesecuzioni)
+    record_rerun("Pagina completa", time.perf_counter() - run_started)
 else:
     # Se l'utente non è loggato, mostra il logo e un messaggio di benvenuto con il login form
     # Aggiungiamo spazio extra in alto solo per la pagina di login
@@ -0,0 +1,99 @@
+import json
+import sys
+from utils.db import get_db_connection
+
+# Query frequenti dell'applicazione e indici che devono poter usare
+HOT_QUERIES = [
+    (
+        "Elenco prodotti (prima pagina)",
+        "SELECT id FROM prodotti_finanziari ORDER BY data_inserimento DESC, id DESC LIMIT 50",
+        {"idx_prodotti_inserimento_id"}
+    ),
+    (
+        "Elenco prodotti (pagina successiva)",
+        "SELECT id FROM prodotti_finanziari WHERE (data_inserimento, id) < (CURRENT_DATE, 'ZZZZZZZZZZ') "
+        "ORDER BY data_inserimento DESC, id DESC LIMIT 50",
+        {"idx_prodotti_inserimento_id"}
+    ),
+    (
+        "Filtro per vincolo",
+        "SELECT id FROM prodotti_finanziari WHERE vincolo = 'Liquido'",
+        {"idx_prodotti_vincolo_scadenza"}
+    ),
+    (
+        "Vincolati in scadenza dopo oggi",
+        "SELECT sum(capitale_finale) FROM prodotti_finanziari "
+        "WHERE vincolo = 'Vincolato' AND data_scadenza > CURRENT_DATE",
+        {"idx_prodotti_vincolati_in_scadenza", "idx_prodotti_vincolo_scadenza"}
+    ),
+    (
+        "Scadenze del mese in corso (totali della dashboard)",
+        "SELECT sum(capitale_finale) FROM prodotti_finanziari "
+        "WHERE data_scadenza > CURRENT_DATE AND data_scadenza < CURRENT_DATE + 31 AND vincolo <> 'Liquido'",
+        {"idx_prodotti_scadenza"}
+    ),
+    (
+        "Filtro per tipologia",
+        "SELECT id FROM prodotti_finanziari WHERE tipologia = 'ETF'",
+        {"idx_prodotti_tipologia"}
+    ),
+    (
+        "Filtro per fornitore",
+        "SELECT id FROM prodotti_finanziari WHERE fornitore = 'Banca'",
+        {"idx_prodotti_fornitore"}
+    ),
+    (
+        "Ricerca testuale",
+        "SELECT id FROM prodotti_finanziari WHERE search_vector @@ to_tsquery('italian', 'conto:*')",
+        {"idx_prodotti_search_vector"}
+    ),
+]
+
+def _plan_indexes(plan):
+    # Raccoglie i nomi degli indici usati in tutti i nodi del piano
+    indexes = set()
+    if "Index Name" in plan:
+        indexes.add(plan["Index Name"])
+    for child in plan.get("Plans", []):
+        indexes |= _plan_indexes(child)
+    return indexes
+
+def check_query_plans():
+    """
+    Verifica con EXPLAIN che le query frequenti possano usare gli indici previsti.
+    Le scansioni sequenziali vengono disabilitate per la sola transazione di verifica:
+    su tabelle piccole il planner le preferirebbe comunque agli indici.
+    
+    Returns:
+    - Boolean: True se tutte le query usano uno degli indici attesi
+    """
+    conn = get_db_connection()
+    if conn is None:
+        print("Impossibile connettersi al database")
+        return False
+    
+    all_ok = True
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SET LOCAL enable_seqscan = off;")
+        for description, query, expected in HOT_QUERIES:
+            cursor.execute("EXPLAIN (FORMAT JSON) " + query)
+            plan = cursor.fetchone()[0]
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            used = _plan_indexes(plan[0]["Plan"])
+            ok = bool(used & expected)
+            all_ok = all_ok and ok
+            print(f"{'OK ' if ok else 'NO '} {description}: {', '.join(sorted(used)) or 'nessun indice'}")
+    except Exception as e:
+        print(f"Errore durante la verifica dei piani di esecuzione: {e}")
+        all_ok = False
+    finally:
+        conn.rollback()
+        cursor.close()
+        conn.close()
+    
+    return all_ok
+
+if __name__ == "__main__":
+    sys.exit(0 if check_query_plans() else 1)
@@ -4,35 +4,132 @@ import datetime
 import plotly.express as px
 import plotly.graph_objects as go
 from PIL import Image
-from utils.plotting import plot_product_distribution, plot_maturity_timeline, plot_capital_over_time
-from utils.financial import calculate_total_values, calculate_current_values, calculate_future_values, project_values_over_time
+from utils.plotting import plot_distribution_totals, plot_maturity_timeline, plot_capital_over_time, figure_nbytes
+from utils.financial import calculate_portfolio_totals, calculate_future_values, project_values_over_time
+from utils.data_manager import get_portfolio_totals, load_data_cached
 import datetime as dt  # Importiamo esplicitamente il modulo datetime per l'uso diretto
+from config import get_cache_config
+from utils.cache import LRUCache
+from utils.notifications import register_listener
+from utils.metrics import timed
 
-def render_dashboard(df):
+def _entry_nbytes(entry):
+    # Dimensione approssimativa: dati delle tabelle più le serie copiate nelle figure
+    if isinstance(entry, tuple):
+        return sum(_entry_nbytes(item) for item in entry)
+    if isinstance(entry, pd.DataFrame):
+        return int(entry.memory_usage(deep=True).sum())
+    if isinstance(entry, go.Figure):
+        return figure_nbytes(entry)
+    return 0
+
+_cache_config = get_cache_config()
+# Proiezioni e grafici già calcolati, condivisi tra le sessioni del processo
+_projection_cache = LRUCache(
+    max_entries=_cache_config['projection_max_entries'],
+    max_bytes=int(_cache_config['projection_max_mb'] * 1024 * 1024),
+    sizeof=_entry_nbytes
+)
+
+def _on_data_changed(payload):
+    # Qualsiasi scrittura sui prodotti rende obsolete le proiezioni in cache
+    if payload.get('table') in (None, 'prodotti_finanziari'):
+        _projection_cache.clear()
+
+register_listener(_on_data_changed)
+
+def _cached(df, name, compute):
     """
-    Renders the main dashboard with financial overview and charts
+    Returns compute(), reusing the result computed for the same portfolio
+    version, day and name
     
     Parameters:
-    - df: DataFrame containing financial products data
+    - df: DataFrame containing financial products data (from load_data_cached)
+    - name: Hashable identifier of the result (e.g. ('projection', 60))
+    - compute: function without arguments producing the result
     """
+    version = df.attrs.get('data_version')
+    if version is None:
+        # Dati non versionati (es. database non raggiungibile): nessuna cache
+        return compute()
+    
+    key = (version, dt.date.today(), name)
+    entry = _projection_cache.get(key)
+    if entry is None:
+        # Le voci di versioni o giorni precedenti non verranno più richieste
+        _projection_cache.discard_if(lambda k: k[0] != version or k[1] != key[1])
+        entry = compute()
+        _projection_cache.put(key, entry)
+    return entry
+
+def get_projection(df, months_horizon):
+    """
+    Returns the projection and its figure for the given horizon, reusing the
+    results computed for the same portfolio version, horizon and day
     
-    if df.empty:
-        st.info("Nessun prodotto finanziario registrato. Utilizza la tab 'Aggiungi Prodotto' per iniziare.")
-        return
+    Parameters:
+    - df: DataFrame containing financial products data (from load_data_cached)
+    - months_horizon: Number of months to project
     
-    st.header("📊 Dashboard Finanziaria")
+    Returns:
+    - tuple: (projection DataFrame, Plotly figure)
+    """
+    def compute():
+        projection_df = project_values_over_time(df, months_horizon)
+        return projection_df, plot_capital_over_time(projection_df)
     
-    # Assicura che le colonne esistano
-    if 'capitale_investito' not in df.columns or 'capitale_finale' not in df.columns:
-        st.error("Dati mancanti o in formato non corretto.")
-        return
+    return _cached(df, ('projection', months_horizon), compute)
+
+def get_projection_cache_stats():
+    """
+    Returns the statistics of the projection cache (see LRUCache.stats)
+    """
+    return _projection_cache.stats()
+
+def _portfolio_totals(df):
+    """
+    Returns the figures of VALUE NOW and of the pie charts, aggregated by the
+    database without reading the products; if the database cannot compute them
+    they are calculated in pandas from the portfolio
     
-    # Assicura che la colonna vincolo esista
-    if 'vincolo' not in df.columns:
-        df['vincolo'] = 'Liquidità'
+    Parameters:
+    - df: DataFrame containing financial products data, or None to load it only if needed
     
-    # Calcola i valori attuali
-    current_values = calculate_current_values(df)
+    Returns:
+    - dict: as returned by calculate_portfolio_totals
+    """
+    totals = get_portfolio_totals()
+    if totals is None:
+        df = load_data_cached() if df is None else df
+        totals = _cached(df, 'totals', lambda: calculate_portfolio_totals(df))
+    return totals
+
+def _distribution_figures(totals):
+    # Grafici a torta per tipologia e per vincolo (None se non ci sono vincoli)
+    fig_distribution_invested = plot_distribution_totals(
+        totals['by_tipologia'], 
+        value_column='capitale_investito', 
+        title='Capitale per Tipologia'
+    )
+    fig_vincolo = None
+    if not totals['by_vincolo'].empty:
+        fig_vincolo = plot_distribution_totals(
+            totals['by_vincolo'], 
+            group_column='vincolo',
+            value_column='capitale_finale', 
+            title='Distribuzione per Vincolo'
+        )
+    return fig_distribution_invested, fig_vincolo
+
+@st.fragment
+@timed("Dashboard · Valore attuale")
+def _render_value_now(current_values):
+    """
+    Renders the VALUE NOW indicators
+    
+    Parameters:
+    - current_values: dict with liquid_value, bound_value and total_value at today
+    """
     
     # Primo indicatore: VALUE NOW
     st.subheader("VALUE NOW - Valore Attuale")
@@ -52,7 +149,17 @@ def render_dashboard(df):
         bound_percent = f"{current_values['bound_value']/current_values['total_value']*100:.1f}%" if current_values['total_value'] > 0 else "0.0%"
         st.markdown(f"<h5>Vincolato <span style='color:#1E90FF;'>{bound_percent}</span></h5>", unsafe_allow_html=True)
         st.markdown(f"<h2>{current_values['bound_value']:,.2f} €</h2>", unsafe_allow_html=True)
+
+@st.fragment
+@timed("Dashboard · Valore futuro")
+def _render_future_value(df):
+    """
+    Renders the VALUE FUTURE date selector and indicators.
+    Changing the date reruns only this section
     
+    Parameters:
+    - df: DataFrame containing financial products data
+    """
     # Secondo indicatore: VALUE FUTURE
     st.subheader("VALUE FUTURE - Valore Prospettico")
     
@@ -165,32 +272,42 @@ def render_dashboard(df):
         bound_percent = f"{future_values['bound_value']/future_values['total_value']*100:.1f}%" if future_values['total_value'] > 0 else "0.0%"
         st.markdown(f"<h5>Vincolato <span style='color:#1E90FF;'>{bound_percent}</span></h5>", unsafe_allow_html=True)
         st.markdown(f"<h2>{future_values['bound_value']:,.2f} €</h2>", unsafe_allow_html=True)
+
+@st.fragment
+@timed("Dashboard · Distribuzioni")
+def _render_distribution(totals):
+    """
+    Renders the distribution pie charts
     
+    Parameters:
+    - totals: dict with the by_tipologia and by_vincolo amounts
+    """
     # Distribuzione per tipologia
     st.subheader("Distribuzione per Tipologia")
     
+    fig_distribution_invested, fig_vincolo = _distribution_figures(totals)
+    
     col1, col2 = st.columns(2)
     
     with col1:
         # Distribution by invested capital
-        fig_distribution_invested = plot_product_distribution(
-            df, 
-            value_column='capitale_investito', 
-            title='Capitale per Tipologia'
-        )
         st.plotly_chart(fig_distribution_invested, use_container_width=True)
     
     with col2:
         # Distribution by vincolo
-        if 'vincolo' in df.columns:
-            fig_vincolo = plot_product_distribution(
-                df, 
-                group_column='vincolo',
-                value_column='capitale_finale', 
-                title='Distribuzione per Vincolo'
-            )
+        if fig_vincolo is not None:
             st.plotly_chart(fig_vincolo, use_container_width=True)
+
+@st.fragment
+@timed("Dashboard · Proiezione")
+def _render_projection(df):
+    """
+    Renders the projection over time.
+    Moving the horizon slider reruns only this section
     
+    Parameters:
+    - df: DataFrame containing financial products data
+    """
     # Proiezione nel tempo
     st.subheader("Proiezione nel Tempo")
     
@@ -209,19 +326,60 @@ def render_dashboard(df):
         # Convertiamo gli anni in mesi per il calcolo della proiezione
         months_horizon = years_horizon * 12
     
-    # Generate projection
-    projection_df = project_values_over_time(df, months_horizon)
-    
-    # Plot projection con il nuovo grafico che mostra capitale liquido, vincolato e totale
-    fig_projection = plot_capital_over_time(projection_df)
+    # Generate projection con il nuovo grafico che mostra capitale liquido, vincolato e totale
+    # (servito dalla cache se già calcolato per questa versione dei dati e orizzonte)
+    projection_df, fig_projection = get_projection(df, months_horizon)
     st.plotly_chart(fig_projection, use_container_width=True)
     
     # Aggiungiamo una descrizione per spiegare il nuovo grafico
     st.info(f"Il grafico mostra l'evoluzione nel tempo su un orizzonte di {years_horizon} anni ({months_horizon} mesi). Sono visualizzati il capitale liquido (verde chiaro), il capitale vincolato (arancione) e il capitale totale (verde scuro), mantenendo sempre visibile la linea del capitale iniziale (blu) come riferimento.")
+
+@st.fragment
+@timed("Dashboard · Scadenze")
+def _render_maturity_timeline(df):
+    """
+    Renders the maturity timeline of the products with an expiry date
     
+    Parameters:
+    - df: DataFrame containing financial products data
+    """
     # Show maturity timeline for products with expiry date
     has_expiry_products = not df[~pd.isna(df['data_scadenza'])].empty if 'data_scadenza' in df.columns else False
     if has_expiry_products:
         st.subheader("Timeline delle Scadenze")
         fig_timeline = plot_maturity_timeline(df)
-        st.plotly_chart(fig_timeline, use_container_width=True)
\ No newline at end of file
+        st.plotly_chart(fig_timeline, use_container_width=True)
+
+def render_dashboard(df=None):
+    """
+    Renders the main dashboard with financial overview and charts.
+    VALUE NOW and the pie charts are drawn from totals aggregated by the
+    database; the products are read only for the sections that need them.
+    
+    Parameters:
+    - df: DataFrame containing financial products data, or None to load it after the totals
+    """
+    totals = _portfolio_totals(df)
+    
+    if totals['count'] == 0:
+        st.info("Nessun prodotto finanziario registrato. Utilizza la tab 'Aggiungi Prodotto' per iniziare.")
+        return
+    
+    st.header("📊 Dashboard Finanziaria")
+    
+    # Ogni sezione è un frammento: i widget di una sezione rieseguono solo quella
+    _render_value_now(totals)
+    
+    # Le sezioni successive lavorano sui singoli prodotti
+    if df is None:
+        df = load_data_cached()
+    
+    # Assicura che le colonne esistano
+    if 'capitale_investito' not in df.columns or 'capitale_finale' not in df.columns:
+        st.error("Dati mancanti o in formato non corretto.")
+        return
+    
+    _render_future_value(df)
+    _render_distribution(totals)
+    _render_projection(df)
+    _render_maturity_timeline(df)
@@ -1,7 +1,7 @@
 import streamlit as st
 import pandas as pd
 from datetime import datetime
-from utils.data_manager import load_data, save_data
+from utils.data_manager import ChangeTracker
 
 def render_inline_edit_form(df, product_id, on_cancel):
     """
@@ -74,12 +74,15 @@ def render_inline_edit_form(df, product_id, on_cancel):
             format="%.2f"
         )
         
+        # Per i prodotti liquidi il valore attuale si aggiorna solo con "Aggiorna Valore",
+        # che ne registra lo storico: qui è in sola lettura
         capitale_finale = st.number_input(
-            "Capitale Finale Previsto (€)",
+            "Valore Attuale (€)" if vincolo == "Liquido" else "Capitale Finale Previsto (€)",
             min_value=0.0,
             value=float(product['capitale_finale']),
             step=100.0,
-            format="%.2f"
+            format="%.2f",
+            disabled=vincolo == "Liquido"
         )
         
         # Data di scadenza (mostrata solo se il prodotto è vincolato)
@@ -202,44 +205,37 @@ def render_inline_edit_form(df, product_id, on_cancel):
                 st.error("Per salvare un prodotto con perdita, devi confermare spuntando la casella sopra.")
                 return False
         
-        # Preparazione dati per il salvataggio
-        updated_product = product.copy()
-        updated_product['nome'] = nome
-        updated_product['fornitore'] = fornitore
-        updated_product['tipologia'] = tipologia
-        updated_product['vincolo'] = vincolo
-        updated_product['capitale_investito'] = capitale_investito
+        # Preparazione dati per il salvataggio: registriamo solo i campi del form
+        updated_fields = {
+            'nome': nome,
+            'fornitore': fornitore,
+            'tipologia': tipologia,
+            'vincolo': vincolo,
+            'capitale_investito': capitale_investito,
+            'note': note,
+            'data_aggiornamento': datetime.now()
+        }
         
-        # Se il prodotto è liquido, forziamo il capitale finale uguale al capitale investito
-        if vincolo == "Liquido":
-            updated_product['capitale_finale'] = capitale_investito
-        else:
-            updated_product['capitale_finale'] = capitale_finale
-            
-        updated_product['note'] = note
-        updated_product['data_aggiornamento'] = datetime.now()
+        # Il valore di un prodotto liquido non viene sovrascritto: se il prodotto
+        # diventa liquido ora, ChangeTracker lo fa partire dal capitale investito
+        if vincolo != "Liquido":
+            updated_fields['capitale_finale'] = capitale_finale
         
         # Aggiorna la data di scadenza solo se il prodotto è vincolato
         if vincolo == "Vincolato" and data_scadenza is not None:
-            updated_product['data_scadenza'] = data_scadenza
+            updated_fields['data_scadenza'] = data_scadenza
         elif vincolo == "Liquido":
-            updated_product['data_scadenza'] = None
-        
-        # Ottieni l'indice della riga da aggiornare
-        index_to_update = df.index[df['id'] == product_id].tolist()
+            updated_fields['data_scadenza'] = None
         
-        if len(index_to_update) > 0:
-            # Aggiorna solo le colonne specifiche
-            for column in df.columns:
-                if column in updated_product:
-                    df.loc[index_to_update[0], column] = updated_product[column]
-            
-            # Salva i dati aggiornati
-            save_data(df)
-            
-            # Non abbiamo più bisogno di resettare lo stato di conferma
-        else:
+        # Scriviamo nel database solo la riga modificata
+        changes = ChangeTracker(df)
+        if not changes.update(product_id, updated_fields):
             st.error("Errore: prodotto non trovato nel database.")
+            return False
+        
+        if not changes.commit():
+            st.error("Errore durante il salvataggio delle modifiche.")
+            return False
         
         # Successo!
         return True
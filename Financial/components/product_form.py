@@ -1,7 +1,7 @@
 import streamlit as st
 import pandas as pd
 import datetime
-from utils.data_manager import save_data, load_data, generate_id
+from utils.data_manager import ChangeTracker, generate_id
 
 def render_product_form(df, edit_id=None, is_duplicate=False, force_save=False):
     """
@@ -110,6 +110,9 @@ def render_product_form(df, edit_id=None, is_duplicate=False, force_save=False):
         # Mostriamo sempre tutti i campi, ma disabilitiamo quelli non applicabili in base al tipo di vincolo
         st.subheader("Dettagli Investimento")
         
+        # Prodotto già liquido (modifica o duplicazione): il suo valore non va sovrascritto
+        was_liquid = is_edit_mode and product_to_edit.get('vincolo') == "Liquido"
+        
         # Gestiamo il cambiamento del capitale investito tramite session_state
         if "capitale_investito_last" not in st.session_state:
             st.session_state.capitale_investito_last = float(product_to_edit.get('capitale_investito', 0))
@@ -129,18 +132,19 @@ def render_product_form(df, edit_id=None, is_duplicate=False, force_save=False):
         # Capitale a scadenza (sempre visibile, ma attivo solo per prodotti vincolati)
         with col2:
             if vincolo == "Liquido":
-                # Per prodotti liquidi, mostriamo il campo ma è disabilitato e uguale al capitale investito
-                capitale_finale = st.number_input(
-                    "Capitale a scadenza (€)",
+                # Per prodotti liquidi il campo è disabilitato: un nuovo prodotto parte dal
+                # capitale investito, uno già liquido mantiene il valore rivalutato
+                # (aggiornabile solo con "Aggiorna Valore", che ne registra lo storico)
+                capitale_finale = float(product_to_edit.get('capitale_finale', 0)) if was_liquid else capitale_investito
+                st.number_input(
+                    "Valore attuale (€)",
                     min_value=0.0,
-                    value=capitale_investito,  # Uguale al capitale investito
+                    value=capitale_finale,
                     step=100.0,
                     format="%.2f",
                     key="capitale_finale_input",
                     disabled=True  # Disabilitato
                 )
-                # Impostiamo capitale_finale = capitale_investito
-                capitale_finale = capitale_investito
             else:
                 # Per prodotti vincolati, il campo è attivo e modificabile
                 capitale_finale = st.number_input(
@@ -172,7 +176,7 @@ def render_product_form(df, edit_id=None, is_duplicate=False, force_save=False):
             data_scadenza = None  # Per prodotti liquidi, impostiamo None
             
             # Show info message
-            st.info("Per i prodotti di tipo 'Liquido', il capitale finale è uguale al capitale investito e la data di scadenza non è applicabile")
+            st.info("Per i prodotti di tipo 'Liquido' la data di scadenza non è applicabile e il valore attuale si aggiorna con 'Aggiorna Valore' dalla lista prodotti")
         else:
             # Per prodotti vincolati, implementiamo un selettore di data personalizzato
             # che permette di inserire date molto lontane nel futuro
@@ -326,30 +330,32 @@ def render_product_form(df, edit_id=None, is_duplicate=False, force_save=False):
                     return False
         
         # Create product data
-        # Per i prodotti liquidi, forziamo il capitale finale uguale al capitale investito
-        capitale_finale_effettivo = capitale_investito if vincolo == "Liquido" else capitale_finale
-        
         new_product = {
             'nome': nome,
             'fornitore': fornitore,
             'tipologia': tipologia,
             'vincolo': vincolo,
             'capitale_investito': capitale_investito,
-            'capitale_finale': capitale_finale_effettivo,  # Usiamo il valore aggiornato
+            'capitale_finale': capitale_finale,
             'data_scadenza': data_scadenza,
             'note': note,
             'data_aggiornamento': datetime.datetime.now().strftime("%Y-%m-%d")
         }
         
+        # Modificando un prodotto già liquido non si tocca il suo valore: potrebbe
+        # essere stato rivalutato nel frattempo (storico dei valori)
+        if was_liquid and vincolo == "Liquido" and not is_duplicate_mode:
+            del new_product['capitale_finale']
+        
+        # Registriamo solo la modifica effettiva: al commit viene scritta una sola riga
+        changes = ChangeTracker(df)
+        
         if is_edit_mode and not is_duplicate_mode:
             # Solo se siamo in modalità modifica ma NON in modalità duplicazione
             # Update existing product
-            new_product['id'] = edit_id
-            new_product['data_inserimento'] = product_to_edit.get('data_inserimento', datetime.datetime.now().strftime("%Y-%m-%d"))
-            
-            # Find and update the row
-            df_copy = df.copy()
-            df_copy.loc[df_copy['id'] == edit_id] = pd.Series(new_product)
+            if not changes.update(edit_id, new_product):
+                st.error("Errore: prodotto non trovato nel database.")
+                return False
             
             success_message = "✅ Prodotto aggiornato con successo!"
         elif is_duplicate_mode:
@@ -359,10 +365,7 @@ def render_product_form(df, edit_id=None, is_duplicate=False, force_save=False):
             
             # Aggiungi un ID univoco per il nuovo prodotto
             new_product['id'] = generate_id()
-            
-            # Add to dataframe
-            new_df = pd.DataFrame([new_product])
-            df_copy = pd.concat([df, new_df], ignore_index=True) if not df.empty else new_df
+            changes.insert(new_product)
             
             success_message = "✅ Prodotto duplicato con successo!"
         else:
@@ -371,20 +374,14 @@ def render_product_form(df, edit_id=None, is_duplicate=False, force_save=False):
             
             # Aggiungi un ID univoco per il nuovo prodotto
             new_product['id'] = generate_id()
-            
-            # Add to dataframe
-            new_df = pd.DataFrame([new_product])
-            df_copy = pd.concat([df, new_df], ignore_index=True) if not df.empty else new_df
+            changes.insert(new_product)
             
             success_message = "✅ Nuovo prodotto aggiunto con successo!"
         
         # Save to database
-        save_data(df_copy)
-        
-        # Reload the data from database to ensure we have all the products
-        reloaded_df = load_data()
-        
-        # Non abbiamo più bisogno di resettare lo stato
+        if not changes.commit():
+            st.error("Errore durante il salvataggio del prodotto. Riprova.")
+            return False, ""
         
         # Return True e il messaggio di successo
         return True, success_message
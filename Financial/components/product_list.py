@@ -1,53 +1,48 @@
 import streamlit as st
 import pandas as pd
-from utils.data_manager import delete_product, duplicate_product, load_data
+import threading
+from utils.data_manager import (
+    delete_product, duplicate_product, list_products, count_products, get_product,
+    get_product_filter_options, search_products, peek_data_cached, LIST_PAGE_SIZE
+)
 from components.inline_edit_form import render_inline_edit_form
+from components.update_liquid_form import render_update_liquid_form
+from utils.formatting import format_currency, format_date
+from utils.search import get_search_index
 
-def render_product_list(df):
-    """
-    Renders a list of all financial products with options to edit or delete
-    
-    Parameters:
-    - df: DataFrame containing financial products data
-    """
-    # Verifica se è attiva la modalità modifica in linea
-    if 'inline_edit_mode' not in st.session_state:
-        st.session_state.inline_edit_mode = False
-        st.session_state.inline_edit_product_id = None
-    st.header("📋 Listato Patrimonio")
-    
-    if df.empty or len(df) == 0:
-        st.info("Nessun elemento di patrimonio trovato. Aggiungi un elemento dalla tab 'Aggiungi Patrimonio'.")
-        return
-    
-    # Preparing the data for display
-    # Make a copy of the dataframe to avoid modifying the original
-    display_df = df.copy()
-    
-    # Rimuovi la colonna ID se presente
-    if 'id' in display_df.columns:
-        display_df = display_df.drop(columns=['id'])
+# Colonne mostrate nella tabella, nell'ordine di visualizzazione
+DISPLAY_COLUMNS = [
+    'Nome', 'Fornitore', 'Tipologia', 'Vincolo', 
+    'Capitale Investito', 'Capitale Finale', 'Data Scadenza',
+    'Data Inserimento', 'Data Aggiornamento'
+]
+
+# Dimensioni di pagina selezionabili nell'elenco
+LIST_PAGE_SIZES = [25, 50, 100, 200]
+
+# Ultima tabella formattata (versione dei dati, DataFrame), condivisa tra le sessioni
+_display_cache = None
+_display_cache_lock = threading.Lock()
+
+def _build_display_frame(df):
+    # Formattazione vettoriale di tutte le colonne, indice = ID del prodotto
+    display_df = df.drop(columns=['id'], errors='ignore')
     
     # Format numeric columns
-    if 'capitale_investito' in display_df.columns:
-        display_df['capitale_investito'] = display_df['capitale_investito'].apply(lambda x: f"{x:,.2f} €")
-    
-    if 'capitale_finale' in display_df.columns:
-        display_df['capitale_finale'] = display_df['capitale_finale'].apply(lambda x: f"{x:,.2f} €")
+    for column in ['capitale_investito', 'capitale_finale']:
+        if column in display_df.columns:
+            display_df[column] = format_currency(display_df[column])
     
     # Format dates
-    if 'data_scadenza' in display_df.columns:
-        display_df['data_scadenza'] = pd.to_datetime(display_df['data_scadenza'], errors='coerce')
-        display_df['data_scadenza'] = display_df['data_scadenza'].dt.strftime('%d/%m/%Y').replace('NaT', '-')
-    
-    if 'data_inserimento' in display_df.columns:
-        display_df['data_inserimento'] = pd.to_datetime(display_df['data_inserimento'], errors='coerce').dt.strftime('%d/%m/%Y')
+    for column in ['data_scadenza', 'data_inserimento', 'data_aggiornamento']:
+        if column in display_df.columns:
+            display_df[column] = format_date(display_df[column])
     
-    if 'data_aggiornamento' in display_df.columns:
-        display_df['data_aggiornamento'] = pd.to_datetime(display_df['data_aggiornamento'], errors='coerce').dt.strftime('%d/%m/%Y')
+    if 'vincolo' in display_df.columns:
+        display_df['vincolo'] = display_df['vincolo'].astype(str)
     
     # Rename columns for display
-    display_df = display_df.rename(columns={
+    return display_df.rename(columns={
         'nome': 'Nome',
         'fornitore': 'Fornitore',
         'tipologia': 'Tipologia',
@@ -59,55 +54,151 @@ def render_product_list(df):
         'data_aggiornamento': 'Data Aggiornamento',
         'note': 'Note'
     })
+
+def get_display_frame(df):
+    """
+    Returns the products formatted for display (Italian amounts and dates,
+    display column names), built once per data version
     
-    # Select and reorder columns for display
-    display_columns = [
-        'Nome', 'Fornitore', 'Tipologia', 'Vincolo', 
-        'Capitale Investito', 'Capitale Finale', 'Data Scadenza',
-        'Data Inserimento', 'Data Aggiornamento'
-    ]
-    
-    # Keep only columns that actually exist in the dataframe
-    display_columns = [col for col in display_columns if col in display_df.columns]
-    
-    # Search feature
-    search_term = st.text_input(
-        "🔍 Cerca per nome, fornitore o tipologia", 
-        placeholder="Inizia a digitare per filtrare i prodotti..."
-    )
+    Parameters:
+    - df: DataFrame containing financial products data (from load_data_cached)
     
-    # Filter based on search term
-    if search_term:
-        search_mask = (
-            display_df['Nome'].str.contains(search_term, case=False, na=False) |
-            display_df['Fornitore'].str.contains(search_term, case=False, na=False) |
-            display_df['Tipologia'].str.contains(search_term, case=False, na=False)
+    Returns:
+    - DataFrame: formatted frame indexed by product ID (read-only, shared)
+    """
+    global _display_cache
+    version = df.attrs.get('data_version')
+    if version is None:
+        return _build_display_frame(df)
+    
+    with _display_cache_lock:
+        cached = _display_cache
+    if cached is not None and cached[0] == version:
+        return cached[1]
+    
+    display_df = _build_display_frame(df)
+    with _display_cache_lock:
+        _display_cache = (version, display_df)
+    return display_df
+
+def _search_page(search_term, filters, page, page_size):
+    """
+    Returns one page of search results as (products, display frame, total).
+    Uses the in-memory index when the portfolio is already cached and up to
+    date in this process, the database full-text search otherwise.
+    """
+    portfolio = peek_data_cached()
+    if portfolio is None:
+        page_df, total = search_products(search_term, page, page_size, filters)
+        return page_df, _build_display_frame(page_df), total
+    
+    matching_ids = get_search_index(portfolio).search(search_term)
+    matches = portfolio.loc[matching_ids]
+    for column, value in filters.items():
+        if value:
+            matches = matches[matches[column] == value]
+    start = (page - 1) * page_size
+    page_ids = matches.index[start:start + page_size]
+    return portfolio.loc[page_ids], get_display_frame(portfolio).loc[page_ids], len(matches)
+
+def render_product_list():
+    """
+    Renders a paged list of the financial products with options to edit or delete.
+    Only the visible page (and the counts) is read from the database.
+    """
+    # Verifica se è attiva la modalità modifica in linea
+    if 'inline_edit_mode' not in st.session_state:
+        st.session_state.inline_edit_mode = False
+        st.session_state.inline_edit_product_id = None
+    
+    # Prodotto liquido di cui si sta aggiornando il valore (None se nessuno)
+    if 'update_value_product_id' not in st.session_state:
+        st.session_state.update_value_product_id = None
+    
+    # Stato della paginazione: cursori keyset delle pagine visitate e numero di pagina
+    if 'list_cursors' not in st.session_state:
+        st.session_state.list_cursors = [None]
+        st.session_state.list_page = 1
+        st.session_state.list_query = None
+    st.header("📋 Listato Patrimonio")
+    
+    # Search feature e filtri
+    options = get_product_filter_options()
+    col_search, col_vincolo, col_tipologia, col_fornitore, col_size = st.columns([4, 2, 2, 2, 1])
+    with col_search:
+        search_term = st.text_input(
+            "🔍 Cerca per nome, fornitore, tipologia o note", 
+            placeholder="Inizia a digitare per filtrare i prodotti..."
         )
-        filtered_df = display_df[search_mask]
+    filters = {}
+    for column, label, col in [('vincolo', "Vincolo", col_vincolo),
+                               ('tipologia', "Tipologia", col_tipologia),
+                               ('fornitore', "Fornitore", col_fornitore)]:
+        with col:
+            filters[column] = st.selectbox(label, options=[None] + options[column],
+                                           format_func=lambda x: "Tutti" if x is None else x,
+                                           key=f"list_filter_{column}")
+    with col_size:
+        page_size = st.selectbox("Per pagina", options=LIST_PAGE_SIZES,
+                                 index=LIST_PAGE_SIZES.index(LIST_PAGE_SIZE), key="list_page_size")
+    
+    # Una nuova ricerca o nuovi filtri ripartono dalla prima pagina
+    list_query = (search_term, tuple(sorted(filters.items())), page_size)
+    if st.session_state.list_query != list_query:
+        st.session_state.list_query = list_query
+        st.session_state.list_cursors = [None]
+        st.session_state.list_page = 1
+    page = st.session_state.list_page
+    
+    if search_term:
+        page_df, page_display, total = _search_page(search_term, filters, page, page_size)
+        has_next = page * page_size < total
     else:
-        filtered_df = display_df
+        page_df, next_cursor = list_products(page_size, st.session_state.list_cursors[-1], filters)
+        page_display = _build_display_frame(page_df)
+        total = count_products(filters)
+        has_next = next_cursor is not None
     
-    if len(filtered_df) == 0:
-        st.warning(f"Nessun prodotto trovato con la ricerca: '{search_term}'")
-        return
+    if page_df.empty and page > 1:
+        # La pagina corrente non esiste più (es. dopo un'eliminazione): torniamo all'inizio
+        st.session_state.list_cursors = [None]
+        st.session_state.list_page = 1
+        st.rerun()
     
-    # Add action buttons with unique keys for each row
-    # Store original index/id for actions
-    id_mapping = {}
-    for i, row in filtered_df.iterrows():
-        if 'id' in df.columns:
-            id_mapping[i] = df.loc[i, 'id'] if i in df.index else None
+    if total == 0:
+        if search_term:
+            st.warning(f"Nessun prodotto trovato con la ricerca: '{search_term}'")
+        elif any(filters.values()):
+            st.warning("Nessun prodotto corrisponde ai filtri selezionati.")
+        else:
+            st.info("Nessun elemento di patrimonio trovato. Aggiungi un elemento dalla tab 'Aggiungi Patrimonio'.")
+        return
     
-    # Creare una copia del DataFrame filtrando esplicitamente le colonne da visualizzare
-    # e rimuovendo qualsiasi colonna ID che potrebbe essere visualizzata
-    df_to_display = filtered_df[display_columns].copy()
+    # Navigazione tra le pagine
+    col_prev, col_info, col_next = st.columns([1, 3, 1])
+    with col_prev:
+        if st.button("◀ Precedente", disabled=page == 1, use_container_width=True, key="list_prev"):
+            st.session_state.list_page -= 1
+            if len(st.session_state.list_cursors) > 1:
+                st.session_state.list_cursors.pop()
+            st.rerun()
+    with col_info:
+        pages = (total + page_size - 1) // page_size
+        st.caption(f"Pagina {page} di {pages} · {total} prodotti")
+    with col_next:
+        if st.button("Successiva ▶", disabled=not has_next, use_container_width=True, key="list_next"):
+            st.session_state.list_page += 1
+            if not search_term:
+                st.session_state.list_cursors.append(next_cursor)
+            st.rerun()
     
-    # Reimposta l'indice con numeri progressivi per non mostrare gli ID come indice
-    df_to_display = df_to_display.reset_index(drop=True)
+    # Select and reorder columns for display
+    display_columns = [col for col in DISPLAY_COLUMNS if col in page_display.columns]
+    filtered_df = page_display
     
-    # Rimuovi esplicitamente la colonna ID se presente
-    if 'id' in df_to_display.columns:
-        df_to_display = df_to_display.drop(columns=['id'])
+    # Selezioniamo le colonne da visualizzare e reimpostiamo l'indice
+    # con numeri progressivi per non mostrare gli ID
+    df_to_display = filtered_df[display_columns].reset_index(drop=True)
     
     # Display the products in a table
     st.dataframe(
@@ -141,9 +232,10 @@ def render_product_list(df):
             st.rerun()
         
         # Aggiorna il DataFrame se necessario
-        if render_inline_edit_form(df, st.session_state.inline_edit_product_id, cancel_edit):
-            # Ricarica i dati aggiornati
-            updated_df = load_data()
+        # Il form lavora sulla sola riga del prodotto, letta dal database
+        product_df = get_product(st.session_state.inline_edit_product_id)
+        if render_inline_edit_form(product_df, st.session_state.inline_edit_product_id, cancel_edit):
+            # I dati aggiornati vengono ricaricati da app.py al rerun
             st.session_state.inline_edit_mode = False
             st.session_state.inline_edit_product_id = None
             st.session_state.show_success_message = True
@@ -154,6 +246,24 @@ def render_product_list(df):
         # Non mostrare le altre opzioni se siamo in modalità modifica
         return
     
+    # Aggiornamento del valore di un prodotto liquido, con lo storico dei valori
+    if st.session_state.update_value_product_id is not None:
+        st.divider()
+        if st.button("✖️ Chiudi aggiornamento valore", key="close_update_value"):
+            st.session_state.update_value_product_id = None
+            st.rerun()
+        
+        product_df = get_product(st.session_state.update_value_product_id)
+        if render_update_liquid_form(product_df, st.session_state.update_value_product_id):
+            st.session_state.update_value_product_id = None
+            st.session_state.show_success_message = True
+            st.session_state.success_message = "✅ Valore aggiornato con successo!"
+            st.session_state.active_tab = "list"
+            st.rerun()
+        
+        # Non mostrare le altre opzioni durante l'aggiornamento del valore
+        return
+    
     # Interfaccia semplificata con un unico selectbox e tre pulsanti
     # Selezione prodotto unica
     selected_product_idx = st.selectbox(
@@ -165,12 +275,16 @@ def render_product_list(df):
     # Ottieni l'ID del prodotto selezionato
     product_id = None
     product_name = None
-    if selected_product_idx is not None and selected_product_idx in id_mapping:
-        product_id = id_mapping[selected_product_idx]
+    if selected_product_idx is not None:
+        # L'indice della tabella è l'ID del prodotto
+        product_id = selected_product_idx
         product_name = filtered_df.loc[selected_product_idx, 'Nome']
     
-    # Crea tre pulsanti in una riga
-    col1, col2, col3 = st.columns(3)
+    # Solo i prodotti liquidi hanno un valore da aggiornare
+    selected_is_liquid = product_id is not None and filtered_df.loc[product_id, 'Vincolo'] == 'Liquido'
+    
+    # Crea quattro pulsanti in una riga
+    col1, col2, col3, col4 = st.columns(4)
     
     with col1:
         edit_button = st.button(
@@ -255,6 +369,21 @@ def render_product_list(df):
             st.session_state.active_tab = "add"  # Passa alla tab di inserimento prodotto
             st.rerun()
     
+    with col4:
+        update_value_button = st.button(
+            "📈 Aggiorna Valore",
+            type="secondary",
+            use_container_width=True,
+            disabled=not selected_is_liquid,
+            help="Registra un nuovo valore del prodotto liquido nello storico",
+            key="update_value_button"
+        )
+        
+        if update_value_button and selected_is_liquid:
+            st.session_state.update_value_product_id = product_id
+            st.session_state.active_tab = "list"
+            st.rerun()
+    
     # Separatore
     st.divider()
     
@@ -3,6 +3,8 @@ import pandas as pd
 from utils.data_manager import update_liquid_product, get_product_history
 import plotly.express as px
 from utils.formatting import format_currency, format_number, format_percentage
+from utils.plotting import downsample_indices
+from utils.history_store import get_value_series
 
 
 def render_update_liquid_form(df, product_id):
@@ -263,32 +265,25 @@ def render_update_liquid_form(df, product_id):
         # Crea anche un grafico dello storico valori se ci sono più di un aggiornamento
         if len(history_df) > 0:
             # Prepariamo i dati per il grafico
-            # Aggiungiamo il valore iniziale (capitale investito)
-            chart_data = []
-
-            # Prima riga: valore iniziale
-            chart_data.append({
-                'data':
-                pd.to_datetime(product_info['data_inserimento']),
-                'valore':
-                float(product_info['capitale_investito']),
-                'tipo':
-                'Capitale Investito'
+            # Prima riga: valore iniziale (capitale investito)
+            initial = pd.DataFrame({
+                'data': [pd.to_datetime(product_info['data_inserimento'])],
+                'valore': [float(product_info['capitale_investito'])],
+                'tipo': ['Capitale Investito']
             })
 
-            # Aggiungiamo tutti gli aggiornamenti
-            for _, row in history_df.iterrows():
-                chart_data.append({
-                    'data':
-                    pd.to_datetime(row['data_aggiornamento']),
-                    'valore':
-                    float(row['capitale_nuovo']),
-                    'tipo':
-                    'Valore Aggiornato'
-                })
+            # Aggiornamenti letti dallo storico locale mappato in memoria e ridotti
+            # a un numero di punti costante: vengono copiati solo i punti scelti
+            dates, values = get_value_series(product_id)
+            keep = downsample_indices(dates, values)
+            updates = pd.DataFrame({
+                'data': pd.to_datetime(dates[keep]),
+                'valore': values[keep],
+                'tipo': 'Valore Aggiornato'
+            })
 
             # Converti in DataFrame
-            chart_df = pd.DataFrame(chart_data)
+            chart_df = pd.concat([initial, updates], ignore_index=True)
 
             # Crea il grafico
             fig = px.line(chart_df,
@@ -2,6 +2,11 @@ import streamlit as st
 import pandas as pd
 import time
 from utils.auth import get_all_users, create_user, delete_user, change_password, is_admin
+from utils.db import get_pool_stats, get_connection_status
+from utils.notifications import is_listening
+from components.dashboard import get_projection_cache_stats
+from utils.metrics import get_rerun_stats
+from utils.plotting import get_figure_cache_stats
 
 def render_user_management():
     """
@@ -106,4 +111,63 @@ def render_user_management():
                         time.sleep(1)
                         st.rerun()
                     else:
-                        st.error(message)
\ No newline at end of file
+                        st.error(message)
+    
+    st.divider()
+    
+    # Statistiche del pool di connessioni per dimensionarlo sotto carico
+    with st.expander("🔌 Stato connessioni al database"):
+        stats = get_pool_stats()
+        col1, col2, col3, col4 = st.columns(4)
+        col1.metric("In uso", f"{stats['in_use']} / {stats['max_size']}")
+        col2.metric("Inattive", stats['idle'])
+        col3.metric("In attesa", stats['waiting'])
+        col4.metric("Attesa media", f"{stats['avg_checkout_ms']:.1f} ms")
+        
+        st.caption(
+            f"Richieste totali: {stats['checkouts']} · "
+            f"Attesa massima: {stats['max_checkout_ms']:.1f} ms · "
+            f"Timeout: {stats['timeouts']} · "
+            f"Connessioni non rilasciate: {stats['leaks']} · "
+            f"Connessioni scartate: {stats['discarded']}"
+        )
+        
+        status = get_connection_status()
+        if status['failures'] > 0:
+            st.warning(f"Database non raggiungibile ({status['failures']} tentativi falliti), nuovo tentativo tra {status['retry_in']:.0f}s")
+        elif status['negotiated_mode']:
+            st.caption(f"Modalità di connessione negoziata: {status['negotiated_mode']}")
+        
+        st.caption("Notifiche di modifica tra repliche: " + ("attive" if is_listening() else "non attive (verifica della versione a ogni caricamento)"))
+        
+        cache_stats = get_projection_cache_stats()
+        st.caption(
+            f"Cache dashboard: {cache_stats['entries']} risultati "
+            f"({cache_stats['bytes'] / (1024 * 1024):.1f} MB) · "
+            f"Riutilizzi: {cache_stats['hits']} · Calcoli: {cache_stats['misses']} · "
+            f"Rimossi per spazio: {cache_stats['evictions']}"
+        )
+        
+        figure_stats = get_figure_cache_stats()
+        st.caption(
+            f"Cache figure: {figure_stats['entries']} grafici "
+            f"({figure_stats['bytes'] / (1024 * 1024):.1f} MB di JSON) · "
+            f"Riutilizzi: {figure_stats['hits']} · Costruzioni: {figure_stats['misses']} · "
+            f"Rimossi per spazio: {figure_stats['evictions']}"
+        )
+    
+    with st.expander("⏱️ Tempi di risposta dell'interfaccia"):
+        rerun_stats = get_rerun_stats()
+        if not rerun_stats:
+            st.info("Nessuna misura disponibile.")
+        else:
+            latency_df = pd.DataFrame(rerun_stats).rename(columns={
+                'section': 'Sezione',
+                'count': 'Esecuzioni',
+                'last_ms': 'Ultima (ms)',
+                'avg_ms': 'Media (ms)',
+                'p95_ms': '95° percentile (ms)',
+                'max_ms': 'Massimo (ms)'
+            })
+            st.dataframe(latency_df.round(1), use_container_width=True, hide_index=True)
+            st.caption("Le sezioni della dashboard vengono rieseguite da sole quando cambiano i rispettivi controlli; la pagina completa solo per la navigazione e dopo le modifiche ai dati.")
@@ -40,4 +40,92 @@ def get_db_config():
             "user": "postgres",
             "password": "postgres",
             "database": "finance_app"
-        }
\ No newline at end of file
+        }
+
+def _read_settings(section, env_prefix, defaults):
+    """
+    Legge un gruppo di impostazioni numeriche con priorità: variabili d'ambiente
+    ({env_prefix}_{CHIAVE}), sezione [section] dei segreti di Streamlit, default
+    """
+    overrides = {}
+    try:
+        if hasattr(st, "secrets") and section in st.secrets:
+            overrides = dict(st.secrets[section])
+    except Exception:
+        # Nessun file dei segreti configurato
+        overrides = {}
+
+    config = {}
+    for key, default in defaults.items():
+        value = os.environ.get(f"{env_prefix}_{key.upper()}", overrides.get(key, default))
+        config[key] = type(default)(value)
+    return config
+
+def get_pool_config():
+    """
+    Restituisce la configurazione del pool di connessioni al database.
+    I valori possono essere sovrascritti nella sezione [pool] dei segreti
+    di Streamlit o con variabili d'ambiente DB_POOL_*
+    """
+    return _read_settings("pool", "DB_POOL", {
+        "min_size": 1,
+        "max_size": 10,
+        "checkout_timeout": 10.0,
+        "idle_timeout": 300.0,
+        "health_check_interval": 30.0,
+        "leak_timeout": 300.0
+    })
+
+def get_connection_config():
+    """
+    Restituisce i parametri per l'apertura delle connessioni: durata della cache
+    della modalità SSL negoziata e backoff del circuit breaker.
+    Sovrascrivibili nella sezione [connection] dei segreti o con DB_CONN_*
+    """
+    return _read_settings("connection", "DB_CONN", {
+        "connect_timeout": 5,
+        "negotiation_ttl": 3600.0,
+        "breaker_base_delay": 1.0,
+        "breaker_max_delay": 60.0
+    })
+
+def get_cache_config():
+    """
+    Restituisce i limiti delle cache in memoria condivise tra le sessioni
+    (proiezioni e grafici della dashboard, figure Plotly).
+    Sovrascrivibili nella sezione [cache] dei segreti o con CACHE_*
+    """
+    return _read_settings("cache", "CACHE", {
+        "projection_max_entries": 64,
+        "projection_max_mb": 64.0,
+        "figure_max_entries": 128,
+        "figure_max_mb": 32.0
+    })
+
+def get_chart_config():
+    """
+    Restituisce le soglie usate per la costruzione dei grafici.
+    Sovrascrivibili nella sezione [charts] dei segreti o con CHARTS_*
+    """
+    return _read_settings("charts", "CHARTS", {
+        # Oltre questo numero di prodotti la timeline mostra barre mensili
+        "timeline_bar_threshold": 300,
+        # Punti massimi per serie nei grafici temporali: circa uno per pixel
+        # di un grafico a tutta larghezza
+        "max_points": 1200
+    })
+
+def get_history_store_config():
+    """
+    Restituisce la configurazione della cache su disco degli storici dei valori:
+    cartella dei file, margine di sovrapposizione delle letture incrementali e
+    numero massimo di serie mappate in memoria contemporaneamente.
+    Sovrascrivibili nella sezione [history_store] dei segreti o con HISTORY_STORE_*
+    """
+    return _read_settings("history_store", "HISTORY_STORE", {
+        "path": os.path.join("data", "history_store"),
+        # Le righe registrate da transazioni ancora aperte all'ultima lettura
+        # hanno un orario precedente: vengono rilette entro questo margine
+        "refresh_margin_seconds": 600.0,
+        "max_open_series": 256
+    })
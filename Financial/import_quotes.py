@@ -0,0 +1,44 @@
+import argparse
+import sys
+from utils.quote_import import import_quotes, QUOTE_CHUNK_SIZE
+
+def main():
+    """
+    Importa da un file CSV i valori (NAV, quotazioni) dei prodotti liquidi e
+    stampa il riepilogo: righe lette, importate, scartate e velocità.
+    
+    Returns:
+    - int: codice di uscita (1 se l'importazione non è riuscita)
+    """
+    parser = argparse.ArgumentParser(description="Importa le quotazioni dei prodotti liquidi da un file CSV")
+    parser.add_argument("file", help="File CSV con le colonne prodotto (id o nome), data e valore")
+    parser.add_argument("--sep", default=",", help="Separatore dei campi (predefinito: ',')")
+    parser.add_argument("--decimal", default=".", choices=[".", ","], help="Separatore decimale dei valori")
+    parser.add_argument("--chunk-size", type=int, default=QUOTE_CHUNK_SIZE, help="Righe lette per blocco")
+    parser.add_argument("--rejects", help="File CSV in cui salvare le righe scartate con il motivo")
+    parser.add_argument("--dry-run", action="store_true", help="Verifica il file senza salvare nulla")
+    args = parser.parse_args()
+    
+    report = import_quotes(args.file, sep=args.sep, decimal=args.decimal,
+                           chunk_size=args.chunk_size, dry_run=args.dry_run)
+    
+    print(f"Righe lette: {report['rows']}")
+    print(f"Aggiornamenti importati: {report['imported']} ({report['products_updated']} prodotti con nuovo valore)")
+    print(f"Righe scartate: {report['rejected']}")
+    if not report['rejects'].empty:
+        for reason, count in report['rejects']['motivo'].value_counts().items():
+            print(f"  - {reason}: {count}")
+        if args.rejects:
+            report['rejects'].to_csv(args.rejects, index=False)
+            print(f"Dettaglio degli scarti salvato in {args.rejects}")
+    print(f"Tempo: {report['seconds']:.2f} s ({report['rows_per_second']:,.0f} righe/s)")
+    if args.dry_run:
+        print("Prova senza salvataggio: nessuna modifica registrata")
+    
+    if report['error']:
+        print(f"Importazione non riuscita: {report['error']}")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
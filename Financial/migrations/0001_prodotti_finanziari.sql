@@ -0,0 +1,14 @@
+-- Tabella prodotti finanziari
+CREATE TABLE IF NOT EXISTS prodotti_finanziari (
+    id VARCHAR(36) PRIMARY KEY,
+    nome VARCHAR(255) NOT NULL,
+    fornitore VARCHAR(255) NOT NULL,
+    tipologia VARCHAR(100) NOT NULL,
+    vincolo VARCHAR(50) NOT NULL,
+    capitale_investito DECIMAL(15, 2) NOT NULL,
+    capitale_finale DECIMAL(15, 2) NOT NULL,
+    data_scadenza DATE,
+    note TEXT,
+    data_inserimento DATE NOT NULL,
+    data_aggiornamento DATE NOT NULL
+);
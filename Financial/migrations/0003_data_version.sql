@@ -0,0 +1,10 @@
+-- Versione dei dati per tabella: incrementata da ogni scrittura, permette alle
+-- sessioni di verificare con una sola lettura se i dati in cache sono aggiornati
+CREATE TABLE IF NOT EXISTS data_version (
+    table_name VARCHAR(100) PRIMARY KEY,
+    version BIGINT NOT NULL DEFAULT 0
+);
+
+INSERT INTO data_version (table_name, version)
+VALUES ('prodotti_finanziari', 1)
+ON CONFLICT (table_name) DO NOTHING;
@@ -0,0 +1,14 @@
+-- opzionale: senza la colonna la ricerca resta quella in memoria dell'elenco prodotti
+-- Ricerca testuale lato database: vettore di ricerca con configurazione italiana
+-- calcolato da PostgreSQL a ogni scrittura, con indice GIN.
+-- Pesi: A per il nome, B per fornitore e tipologia, C per le note
+ALTER TABLE prodotti_finanziari ADD COLUMN IF NOT EXISTS search_vector tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('italian', coalesce(nome, '')), 'A') ||
+        setweight(to_tsvector('italian', coalesce(fornitore, '')), 'B') ||
+        setweight(to_tsvector('italian', coalesce(tipologia, '')), 'B') ||
+        setweight(to_tsvector('italian', coalesce(note, '')), 'C')
+    ) STORED;
+
+CREATE INDEX IF NOT EXISTS idx_prodotti_search_vector
+    ON prodotti_finanziari USING gin (search_vector);
@@ -0,0 +1,5 @@
+-- opzionale: solo un indice, le query funzionano anche senza
+-- Indice per la paginazione keyset dell'elenco prodotti, nello stesso ordine
+-- della query (più recenti prima, ID come criterio di parità)
+CREATE INDEX IF NOT EXISTS idx_prodotti_inserimento_id
+    ON prodotti_finanziari (data_inserimento DESC, id DESC);
@@ -0,0 +1,23 @@
+-- opzionale: solo indici, le query funzionano anche senza
+-- Indici secondari per le query più frequenti su prodotti_finanziari.
+-- L'ordinamento per data_inserimento usa già idx_prodotti_inserimento_id (0005),
+-- di cui data_inserimento è la prima colonna.
+
+-- Filtri per vincolo, eventualmente con intervallo sulla data di scadenza
+CREATE INDEX IF NOT EXISTS idx_prodotti_vincolo_scadenza
+    ON prodotti_finanziari (vincolo, data_scadenza);
+
+-- Filtri dell'elenco prodotti
+CREATE INDEX IF NOT EXISTS idx_prodotti_tipologia
+    ON prodotti_finanziari (tipologia);
+
+CREATE INDEX IF NOT EXISTS idx_prodotti_fornitore
+    ON prodotti_finanziari (fornitore);
+
+-- Prodotti vincolati con scadenza ("vincolati che scadono dopo oggi"): il predicato
+-- non può contenere CURRENT_DATE, quindi l'indice copre tutti i vincolati con scadenza
+-- e la condizione data_scadenza > CURRENT_DATE diventa un intervallo sull'indice
+CREATE INDEX IF NOT EXISTS idx_prodotti_vincolati_in_scadenza
+    ON prodotti_finanziari (data_scadenza)
+    INCLUDE (capitale_investito, capitale_finale)
+    WHERE vincolo = 'Vincolato' AND data_scadenza IS NOT NULL;
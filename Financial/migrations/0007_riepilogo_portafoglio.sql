@@ -0,0 +1,40 @@
+-- Aggregati del portafoglio mantenuti ad ogni scrittura (utils/portfolio_summary.py):
+-- la dashboard legge una riga per gruppo invece di aggregare tutti i prodotti
+
+-- Totali per tipologia e vincolo
+CREATE TABLE IF NOT EXISTS portfolio_summary (
+    tipologia VARCHAR(100) NOT NULL,
+    vincolo VARCHAR(50) NOT NULL,
+    prodotti BIGINT NOT NULL DEFAULT 0,
+    capitale_investito DECIMAL(20, 2) NOT NULL DEFAULT 0,
+    capitale_finale DECIMAL(20, 2) NOT NULL DEFAULT 0,
+    PRIMARY KEY (tipologia, vincolo)
+);
+
+-- Calendario delle scadenze: totali per mese di scadenza (primo giorno del mese) e vincolo
+CREATE TABLE IF NOT EXISTS portfolio_maturity_calendar (
+    mese DATE NOT NULL,
+    vincolo VARCHAR(50) NOT NULL,
+    prodotti BIGINT NOT NULL DEFAULT 0,
+    capitale_investito DECIMAL(20, 2) NOT NULL DEFAULT 0,
+    capitale_finale DECIMAL(20, 2) NOT NULL DEFAULT 0,
+    PRIMARY KEY (mese, vincolo)
+);
+
+-- Scadenze del mese in corso, lette dai prodotti per avere i valori esatti al giorno
+CREATE INDEX IF NOT EXISTS idx_prodotti_scadenza
+    ON prodotti_finanziari (data_scadenza);
+
+-- Popolamento iniziale dai prodotti esistenti
+INSERT INTO portfolio_summary (tipologia, vincolo, prodotti, capitale_investito, capitale_finale)
+SELECT tipologia, vincolo, count(*), SUM(capitale_investito), SUM(capitale_finale)
+FROM prodotti_finanziari
+GROUP BY tipologia, vincolo
+ON CONFLICT (tipologia, vincolo) DO NOTHING;
+
+INSERT INTO portfolio_maturity_calendar (mese, vincolo, prodotti, capitale_investito, capitale_finale)
+SELECT date_trunc('month', data_scadenza)::date, vincolo, count(*), SUM(capitale_investito), SUM(capitale_finale)
+FROM prodotti_finanziari
+WHERE data_scadenza IS NOT NULL
+GROUP BY 1, vincolo
+ON CONFLICT (mese, vincolo) DO NOTHING;
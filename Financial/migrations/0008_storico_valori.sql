@@ -0,0 +1,51 @@
+-- opzionale: usa funzionalità solo PostgreSQL (partizioni, trigger plpgsql);
+-- senza lo storico l'aggiornamento dei prodotti liquidi non è disponibile
+-- Storico dei valori dei prodotti liquidi: una riga per ogni aggiornamento,
+-- solo inserimenti. Partizionato per anno della data di aggiornamento, così
+-- le letture su un intervallo di date toccano solo le partizioni interessate
+-- e gli anni passati restano tabelle piccole e stabili.
+-- Nessuna chiave esterna: lo storico resta anche se il prodotto viene eliminato.
+CREATE TABLE IF NOT EXISTS storico_valori (
+    id BIGSERIAL,
+    product_id VARCHAR(36) NOT NULL,
+    data_aggiornamento DATE NOT NULL,
+    capitale_precedente DECIMAL(15, 2) NOT NULL,
+    capitale_nuovo DECIMAL(15, 2) NOT NULL,
+    note TEXT,
+    registrato_il TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (id, data_aggiornamento)
+) PARTITION BY RANGE (data_aggiornamento);
+
+-- Serie di un prodotto in un intervallo di date (creato su ogni partizione)
+CREATE INDEX IF NOT EXISTS idx_storico_valori_prodotto_data
+    ON storico_valori (product_id, data_aggiornamento);
+
+-- Partizioni annuali fino all'anno prossimo; quelle successive vengono create
+-- dall'applicazione al primo aggiornamento dell'anno (utils/data_manager.py)
+DO $$
+DECLARE
+    anno INTEGER;
+BEGIN
+    FOR anno IN 2000..EXTRACT(YEAR FROM CURRENT_DATE)::INTEGER + 1 LOOP
+        EXECUTE format(
+            'CREATE TABLE IF NOT EXISTS %I PARTITION OF storico_valori FOR VALUES FROM (%L) TO (%L)',
+            'storico_valori_' || anno, make_date(anno, 1, 1), make_date(anno + 1, 1, 1)
+        );
+    END LOOP;
+END $$;
+
+-- Nessuna partizione predefinita: le righe di un anno senza partizione vi
+-- finirebbero e impedirebbero poi di creare la partizione di quell'anno.
+-- Un aggiornamento per un anno senza partizione viene invece rifiutato.
+
+-- Tabella in sola aggiunta: modifiche e cancellazioni vengono rifiutate
+CREATE OR REPLACE FUNCTION storico_valori_solo_inserimenti() RETURNS trigger AS $$
+BEGIN
+    RAISE EXCEPTION 'storico_valori accetta solo inserimenti';
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS storico_valori_solo_inserimenti ON storico_valori;
+CREATE TRIGGER storico_valori_solo_inserimenti
+    BEFORE UPDATE OR DELETE ON storico_valori
+    FOR EACH STATEMENT EXECUTE FUNCTION storico_valori_solo_inserimenti();
@@ -0,0 +1,4 @@
+-- opzionale: richiede storico_valori (0008)
+-- Lettura incrementale dello storico per data di registrazione (utils/history_store.py)
+CREATE INDEX IF NOT EXISTS idx_storico_valori_registrato
+    ON storico_valori (registrato_il);
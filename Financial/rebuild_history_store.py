@@ -0,0 +1,22 @@
+import sys
+from utils.history_store import get_history_store
+
+def rebuild_history_store():
+    """
+    Ricostruisce da zero la copia locale degli storici dei valori
+    (utils/history_store.py) leggendo tutto storico_valori, ad esempio dopo
+    averlo svuotato o ripristinato da un backup.
+    
+    Returns:
+    - Boolean: True se la ricostruzione è riuscita
+    """
+    store = get_history_store()
+    written = store.refresh(full=True)
+    if written is None:
+        print("Ricostruzione dello storico locale non riuscita")
+        return False
+    print(f"Storico locale ricostruito in {store.path}: {written} prodotti")
+    return True
+
+if __name__ == "__main__":
+    sys.exit(0 if rebuild_history_store() else 1)
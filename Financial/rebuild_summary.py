@@ -0,0 +1,51 @@
+import sys
+from utils.db import get_db_connection
+from utils.portfolio_summary import verify_summary, rebuild_summary
+
+def rebuild_portfolio_summary(check_only=False):
+    """
+    Confronta gli aggregati del portafoglio (portfolio_summary e
+    portfolio_maturity_calendar) con il ricalcolo completo dai prodotti,
+    stampa le differenze e, se richiesto, ricostruisce gli aggregati.
+    
+    Parameters:
+    - check_only: Boolean, verifica senza ricostruire
+    
+    Returns:
+    - Boolean: True se gli aggregati coincidevano con il ricalcolo
+    """
+    conn = get_db_connection()
+    if conn is None:
+        print("Impossibile connettersi al database")
+        return False
+    
+    cursor = conn.cursor()
+    try:
+        # Blocca le scritture sui prodotti durante il confronto e la ricostruzione
+        cursor.execute("LOCK TABLE prodotti_finanziari IN SHARE MODE;")
+        differences = verify_summary(cursor)
+        for difference in differences:
+            key = ', '.join(f"{name}={value}" for name, value in difference['key'].items())
+            print(f"{difference['table']} ({key}): registrato {difference['stored']}, atteso {difference['expected']}")
+        
+        if not differences:
+            print("Aggregati del portafoglio corretti")
+        
+        if check_only:
+            conn.rollback()
+        else:
+            rebuild_summary(cursor)
+            conn.commit()
+            print("Aggregati del portafoglio ricostruiti")
+        return not differences
+    except Exception as e:
+        print(f"Errore durante la verifica degli aggregati: {e}")
+        conn.rollback()
+        return False
+    finally:
+        cursor.close()
+        conn.close()
+
+if __name__ == "__main__":
+    ok = rebuild_portfolio_summary(check_only='--check' in sys.argv[1:])
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,94 @@
+import numpy as np
+import pandas as pd
+import pytest
+from utils.data_manager import ChangeTracker, prepare_products
+from utils.financial import normalize_portfolio
+
+@pytest.fixture
+def portfolio():
+    # Frame come quelli restituiti da load_data: indicizzato per ID, con la colonna id
+    df = pd.DataFrame({
+        'id': ['LIQ0000001', 'VIN0000001'],
+        'nome': ['Conto deposito', 'Buono fruttifero'],
+        'fornitore': ['Banca A', 'Poste'],
+        'tipologia': ['Conto', 'Buono'],
+        'vincolo': ['Liquido', 'Vincolato'],
+        'capitale_investito': [1000.0, 5000.0],
+        'capitale_finale': [1043.25, 5600.0],
+        'data_scadenza': [None, '2030-06-30'],
+        'note': ['', 'cedola annuale'],
+        'data_inserimento': ['2024-01-10', '2024-02-15'],
+        'data_aggiornamento': ['2024-06-30', '2024-02-15']
+    })
+    df = normalize_portfolio(df.set_index('id', drop=True))
+    df['id'] = df.index
+    return df
+
+def test_update_records_only_the_changed_columns(portfolio):
+    tracker = ChangeTracker(portfolio)
+    assert not tracker.has_changes()
+
+    assert tracker.update('VIN0000001', {'note': 'rinnovato', 'id': 'ALTRO', 'colonna_sconosciuta': 1})
+    assert tracker.update('VIN0000001', {'capitale_finale': 5700})
+
+    assert tracker.has_changes()
+    assert tracker._updated == {'VIN0000001': {'note': 'rinnovato', 'capitale_finale': 5700.0}}
+    assert not tracker._inserted and not tracker._deleted
+
+def test_update_of_unknown_or_deleted_product_fails(portfolio):
+    tracker = ChangeTracker(portfolio)
+    assert not tracker.update('SCONOSCIUTO', {'note': 'x'})
+
+    tracker.update('VIN0000001', {'note': 'x'})
+    tracker.delete('VIN0000001')
+    assert not tracker.update('VIN0000001', {'note': 'y'})
+    assert tracker._deleted == {'VIN0000001'}
+    assert 'VIN0000001' not in tracker._updated
+
+def test_liquid_product_keeps_its_revalued_value(portfolio):
+    tracker = ChangeTracker(portfolio)
+    tracker.update('LIQ0000001', {'note': 'conto principale', 'capitale_investito': 1200})
+    assert tracker._updated['LIQ0000001'] == {'note': 'conto principale', 'capitale_investito': 1200.0}
+
+def test_product_becoming_liquid_starts_from_invested_capital(portfolio):
+    tracker = ChangeTracker(portfolio)
+    tracker.update('VIN0000001', {'vincolo': 'Liquido', 'data_scadenza': None})
+    assert tracker._updated['VIN0000001'] == {'vincolo': 'Liquido', 'data_scadenza': None, 'capitale_finale': 5000.0}
+
+    tracker = ChangeTracker(portfolio)
+    tracker.update('VIN0000001', {'vincolo': 'Liquido', 'capitale_finale': 5150})
+    assert tracker._updated['VIN0000001']['capitale_finale'] == 5150.0
+
+def test_inserted_products_stay_inserts(portfolio):
+    tracker = ChangeTracker(portfolio)
+    new_id = tracker.insert({'nome': 'Fondo', 'vincolo': 'Liquido', 'capitale_investito': 300})
+    assert tracker._inserted[new_id]['capitale_finale'] == 300.0
+
+    assert tracker.update(new_id, {'note': 'PAC mensile'})
+    assert tracker._inserted[new_id]['note'] == 'PAC mensile'
+    assert not tracker._updated
+
+    tracker.delete(new_id)
+    assert not tracker.has_changes()
+
+def test_commit_without_changes_does_not_connect(portfolio, monkeypatch):
+    monkeypatch.setattr('utils.data_manager.get_db_connection', lambda: pytest.fail("connessione non attesa"))
+    assert ChangeTracker(portfolio).commit()
+
+def test_prepare_products_fills_only_missing_liquid_values():
+    products = prepare_products(pd.DataFrame({
+        'id': ['A', 'B', 'C', 'A'],
+        'vincolo': ['Liquido', 'Liquido', 'Vincolato', 'Liquido'],
+        'capitale_investito': [100, 200, 300, 150],
+        'capitale_finale': [90, np.nan, np.nan, 160],
+        'data_scadenza': [None, None, '2030-12-31', None]
+    }))
+    products = products.set_index('id')
+
+    # Per ID ripetuti vale l'ultima riga
+    assert list(products.index) == ['B', 'C', 'A']
+    assert products.loc['A', 'capitale_finale'] == 160.0
+    assert products.loc['B', 'capitale_finale'] == 200.0
+    assert products.loc['C', 'capitale_finale'] == 0.0
+    assert products.loc['B', 'data_scadenza'] is None
+    assert isinstance(products.loc['A', 'data_inserimento'], str)
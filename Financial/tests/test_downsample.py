@@ -0,0 +1,66 @@
+import numpy as np
+import pandas as pd
+from utils.plotting import _lttb_indices, downsample, downsample_indices
+
+def test_lttb_keeps_endpoints_and_peaks():
+    x = np.arange(10000, dtype=float)
+    y = np.sin(x / 300)
+    y[4321] = 50.0
+    y[7000] = -50.0
+
+    indices = _lttb_indices(x, y, 200)
+
+    assert len(indices) == 200
+    assert indices[0] == 0 and indices[-1] == len(x) - 1
+    assert np.all(np.diff(indices) > 0)
+    assert {4321, 7000} <= set(indices)
+
+def test_lttb_short_series_is_unchanged():
+    x = np.arange(5, dtype=float)
+    np.testing.assert_array_equal(_lttb_indices(x, x, 10), np.arange(5))
+
+def test_downsample_small_frame_is_returned_as_is():
+    df = pd.DataFrame({'date': pd.date_range('2024-01-01', periods=50), 'value': np.arange(50.0)})
+    assert downsample(df, 'date', ['value'], max_points=100) is df
+
+def test_downsample_series_within_budget():
+    dates = pd.date_range('2020-01-01', periods=20000, freq='h')
+    steps = np.arange(len(dates))
+    df = pd.DataFrame({
+        'date': dates,
+        'liquid_value': 1000 + 10 * np.sin(steps / 500),
+        'bound_value': 2000 + 10 * np.cos(steps / 700)
+    })
+    df.loc[12345, 'liquid_value'] = 5000.0
+    df.loc[3210, 'bound_value'] = 0.0
+
+    result = downsample(df, 'date', ['liquid_value', 'bound_value'], max_points=500)
+
+    assert len(result) <= 500
+    assert result['date'].is_monotonic_increasing
+    assert result.index[0] == df.index[0] and result.index[-1] == df.index[-1]
+    # I picchi isolati di ciascuna serie restano visibili
+    assert {12345, 3210} <= set(result.index)
+
+def test_step_series_keep_every_change():
+    # Valori a gradini: cambiano solo alle scadenze
+    steps = np.repeat([100.0, 250.0, 180.0, 400.0], [3000, 2000, 4000, 1000])
+    x = np.arange(len(steps))
+
+    indices = downsample_indices(x, steps, max_points=100, step=True)
+
+    assert indices[0] == 0 and indices[-1] == len(steps) - 1
+    # Ridisegnando i punti scelti a gradini si ottiene la serie originale
+    redrawn = steps[indices][np.searchsorted(indices, x, side='right') - 1]
+    np.testing.assert_array_equal(redrawn, steps)
+
+def test_step_series_over_budget_keep_extremes():
+    rng = np.random.default_rng(1)
+    values = np.column_stack([rng.normal(size=50000), rng.normal(size=50000)])
+
+    indices = downsample_indices(np.arange(len(values)), values, max_points=600, step=True)
+
+    assert len(indices) <= 600
+    assert np.all(np.diff(indices) > 0)
+    for column in values.T:
+        assert column.argmax() in indices and column.argmin() in indices
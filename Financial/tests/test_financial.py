@@ -0,0 +1,122 @@
+import numpy as np
+import pandas as pd
+import pytest
+from utils.financial import (
+    normalize_portfolio, calculate_total_values, calculate_current_values, calculate_future_values,
+    calculate_values_at_dates, calculate_portfolios_at_dates, project_values_over_time
+)
+
+def reference_future_values(df, future_date):
+    # Implementazione originale (un filtro per data), usata come riferimento
+    df = df.copy()
+    df['capitale_investito'] = pd.to_numeric(df['capitale_investito'], errors='coerce').astype(float)
+    df['capitale_finale'] = pd.to_numeric(df['capitale_finale'], errors='coerce').astype(float)
+    df['data_scadenza'] = pd.to_datetime(df['data_scadenza'], errors='coerce')
+    future_ts = pd.Timestamp(future_date)
+
+    liquid_products = df[(df['vincolo'] == 'Liquido') |
+                         (pd.isna(df['data_scadenza'])) |
+                         (df['data_scadenza'] <= future_ts)]
+    bound_products = df[(df['vincolo'] == 'Vincolato') &
+                        (~pd.isna(df['data_scadenza'])) &
+                        (df['data_scadenza'] > future_ts)]
+
+    liquid_value = liquid_products['capitale_finale'].sum()
+    bound_value = bound_products['capitale_investito'].sum()
+    return {
+        'liquid_value': liquid_value,
+        'bound_value': bound_value,
+        'total_value': liquid_value + bound_value
+    }
+
+def make_portfolio(n=300, seed=0):
+    # Prodotti liquidi, vincolati e di altro tipo, con scadenze passate, future o assenti
+    rng = np.random.default_rng(seed)
+    today = pd.Timestamp.now().floor('D')
+    offsets = rng.integers(-400, 3000, n)
+    maturities = [
+        None if missing else (today + pd.Timedelta(days=int(days))).strftime('%Y-%m-%d')
+        for days, missing in zip(offsets, rng.random(n) < 0.2)
+    ]
+    # Alcune scadenze coincidono, come i prodotti sottoscritti insieme
+    maturities[1] = maturities[0] = (today + pd.Timedelta(days=90)).strftime('%Y-%m-%d')
+    invested = rng.integers(100, 100000, n) / 100
+    finale = invested * rng.uniform(0.9, 1.3, n)
+    finale[rng.random(n) < 0.05] = np.nan
+    return pd.DataFrame({
+        'id': [f"P{i:04d}" for i in range(n)],
+        'nome': [f"Prodotto {i}" for i in range(n)],
+        'vincolo': rng.choice(['Liquido', 'Vincolato', 'Altro'], n, p=[0.3, 0.6, 0.1]),
+        'capitale_investito': invested.round(2),
+        'capitale_finale': finale.round(2),
+        'data_scadenza': maturities
+    })
+
+@pytest.fixture
+def portfolio():
+    return make_portfolio()
+
+def assert_values_equal(values, expected):
+    for key in ['liquid_value', 'bound_value', 'total_value']:
+        assert values[key] == pytest.approx(expected[key], rel=1e-12, abs=1e-6)
+
+def test_future_values_match_reference(portfolio):
+    today = pd.Timestamp.now().floor('D')
+    dates = [today, today + pd.Timedelta(days=90), today + pd.DateOffset(months=18), today - pd.DateOffset(years=2)]
+    normalized = normalize_portfolio(portfolio.copy())
+    for date in dates:
+        expected = reference_future_values(portfolio, date)
+        assert_values_equal(calculate_future_values(portfolio, date), expected)
+        assert_values_equal(calculate_future_values(normalized, date), expected)
+
+def test_current_values_match_reference(portfolio):
+    expected = reference_future_values(portfolio, pd.Timestamp.now().floor('D'))
+    assert_values_equal(calculate_current_values(portfolio), expected)
+
+def test_values_at_dates_match_single_dates(portfolio):
+    dates = pd.date_range(pd.Timestamp.now().floor('D'), periods=40, freq='MS')
+    values = calculate_values_at_dates(portfolio, dates)
+    for i, date in enumerate(dates):
+        expected = reference_future_values(portfolio, date)
+        assert_values_equal({key: values[key][i] for key in values}, expected)
+
+    many = calculate_portfolios_at_dates([portfolio, portfolio.iloc[:50]], dates)
+    assert many['total_value'].shape == (2, len(dates))
+    np.testing.assert_allclose(many['total_value'][0], values['total_value'])
+    np.testing.assert_allclose(many['total_value'][1], calculate_values_at_dates(portfolio.iloc[:50], dates)['total_value'])
+
+@pytest.mark.parametrize('months_horizon', [0, 24, 180])
+def test_projection_matches_reference(portfolio, months_horizon):
+    projection = project_values_over_time(portfolio, months_horizon)
+
+    assert projection['date'].is_monotonic_increasing
+    assert projection['date'].is_unique
+    np.testing.assert_allclose(projection['invested_capital'], portfolio['capitale_investito'].sum())
+    for row in projection.itertuples():
+        # Con orizzonte 0 i valori sono quelli di oggi a mezzanotte, come i valori attuali
+        date = row.date.floor('D') if months_horizon == 0 else row.date
+        expected = reference_future_values(portfolio, date)
+        assert_values_equal(row._asdict(), expected)
+
+def test_projection_includes_maturity_steps(portfolio):
+    projection = project_values_over_time(portfolio, 24)
+    start = projection['date'].iloc[0]
+    maturities = pd.to_datetime(portfolio['data_scadenza']).dropna()
+    maturities = maturities[(maturities > start) & (maturities <= start + pd.DateOffset(months=24))]
+    dates = set(projection['date'])
+    for maturity in maturities:
+        assert {maturity - pd.Timedelta(days=1), maturity, maturity + pd.Timedelta(days=1)} <= dates
+
+def test_calculations_do_not_modify_the_frame(portfolio):
+    original = portfolio.copy()
+    calculate_total_values(portfolio)
+    calculate_current_values(portfolio)
+    calculate_future_values(portfolio, pd.Timestamp.now() + pd.DateOffset(months=6))
+    project_values_over_time(portfolio, 36)
+    pd.testing.assert_frame_equal(portfolio, original)
+
+def test_empty_portfolio():
+    empty = pd.DataFrame(columns=['capitale_investito', 'capitale_finale', 'vincolo', 'data_scadenza'])
+    assert calculate_total_values(empty) == {'total_invested': 0, 'total_current': 0}
+    assert calculate_current_values(empty)['total_value'] == 0
+    assert project_values_over_time(empty, 12).empty
@@ -0,0 +1,87 @@
+import datetime
+import io
+import pandas as pd
+import pytest
+from utils.quote_import import (
+    DEFAULT_NOTE, ID_COLUMNS, NAME_COLUMNS, DATE_COLUMNS, VALUE_COLUMNS, NOTE_COLUMNS,
+    _find_column, _read_products, _validate_chunk
+)
+
+TODAY = datetime.date(2025, 6, 30)
+
+class ProductsCursor:
+    # Cursore minimo per _read_products: restituisce l'anagrafica dei prodotti
+    def __init__(self, rows):
+        self.rows = rows
+
+    def execute(self, query):
+        pass
+
+    def fetchall(self):
+        return self.rows
+
+@pytest.fixture
+def products():
+    return _read_products(ProductsCursor([
+        ('LIQ1', 'Conto Deposito', 'Liquido', datetime.date(2024, 1, 1)),
+        ('LIQ2', 'Fondo Pensione', 'Liquido', datetime.date(2024, 1, 1)),
+        ('LIQ3', 'Fondo Pensione ', 'Liquido', datetime.date(2024, 1, 1)),
+        ('VIN1', 'Buono Fruttifero', 'Vincolato', datetime.date(2024, 1, 1)),
+        ('LIQ4', 'ETF World', 'Liquido', datetime.date(2025, 3, 1)),
+    ]))
+
+def validate(text, products, sep=',', decimal='.'):
+    chunk = pd.read_csv(io.StringIO(text), sep=sep, dtype=str, keep_default_na=False)
+    columns = {
+        'id': _find_column(chunk.columns, ID_COLUMNS),
+        'name': _find_column(chunk.columns, NAME_COLUMNS),
+        'date': _find_column(chunk.columns, DATE_COLUMNS),
+        'value': _find_column(chunk.columns, VALUE_COLUMNS),
+        'note': _find_column(chunk.columns, NOTE_COLUMNS)
+    }
+    return _validate_chunk(chunk, columns, *products, decimal, TODAY)
+
+def test_rows_are_matched_by_id_or_name(products):
+    staged, rejected = validate(
+        "ID,Nome,Data,Valore,Note\n"
+        "LIQ1,,2025-01-31,1010.456,\n"
+        ",conto deposito ,28/02/2025,1020,rivalutazione\n"
+        "SCONOSCIUTO,ETF World,2025-04-30,99.5,\n",
+        products
+    )
+    assert rejected.empty
+    assert staged['riga'].tolist() == [2, 3, 4]
+    assert staged['product_id'].tolist() == ['LIQ1', 'LIQ1', 'LIQ4']
+    assert staged['data_aggiornamento'].tolist() == ['2025-01-31', '2025-02-28', '2025-04-30']
+    assert staged['valore'].tolist() == [1010.46, 1020.0, 99.5]
+    assert staged['note'].tolist() == [DEFAULT_NOTE, 'rivalutazione', DEFAULT_NOTE]
+
+def test_each_rejected_row_has_one_reason(products):
+    staged, rejected = validate(
+        "nome,data,valore\n"
+        "Fondo Pensione,2025-01-31,100\n"
+        "Non esiste,2025-01-31,100\n"
+        "Buono Fruttifero,2025-01-31,100\n"
+        "Conto Deposito,31-31-2025,100\n"
+        "Conto Deposito,2025-07-01,100\n"
+        "ETF World,2025-02-28,100\n"
+        "Conto Deposito,2025-01-31,cento\n"
+        "Conto Deposito,2025-01-31,-5\n"
+        "Non esiste,data,valore\n",
+        products
+    )
+    assert staged.empty
+    assert rejected['riga'].tolist() == list(range(2, 11))
+    assert rejected['motivo'].tolist() == [
+        'nome ambiguo', 'prodotto sconosciuto', 'prodotto non liquido', 'data non valida',
+        'data futura', "data precedente all'inserimento", 'valore non valido', 'valore negativo',
+        'prodotto sconosciuto'
+    ]
+
+def test_italian_number_format(products):
+    staged, rejected = validate(
+        "id;nav;data\nLIQ1;1.234,56 €;2025-05-31\n",
+        products, sep=';', decimal=','
+    )
+    assert rejected.empty
+    assert staged['valore'].tolist() == [1234.56]
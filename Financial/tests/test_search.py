@@ -0,0 +1,61 @@
+import pandas as pd
+import pytest
+from utils.search import SearchIndex, normalize_text
+
+@pytest.fixture
+def products():
+    return pd.DataFrame({
+        'id': ['AZ', 'OB', 'ETF', 'BTP', 'SOC', 'NOTE'],
+        'nome': ['Fondo azionario Europa', 'Fondo obbligazionario', 'ETF MSCI World', 'BTP Italia 2030',
+                 'Società di gestione', 'Conto deposito'],
+        'fornitore': ['Banca A', 'Banca A', 'Broker B', 'MEF', 'Banca C', 'Banca A'],
+        'tipologia': ['Fondo', 'Fondo', 'ETF', 'Titolo di Stato', 'Azioni', 'Conto'],
+        'note': ['', '', 'accumulazione', '', '', 'parcheggio per il fondo azionario']
+    })
+
+@pytest.fixture
+def index(products):
+    index = SearchIndex()
+    index.sync(products, version=1)
+    return index
+
+def test_normalize_text_removes_case_and_accents():
+    assert normalize_text('Società ÀÉ') == 'societa ae'
+
+def test_prefix_infix_and_accent_insensitive_matches(index):
+    # Anche all'interno delle parole (obbligazionario, accumulazione): prima il nome, poi le note
+    assert index.search('azion') == ['AZ', 'OB', 'SOC', 'ETF', 'NOTE']
+    assert index.search('SOCIETA') == ['SOC']
+
+def test_every_term_must_match(index):
+    assert index.search('fondo banca') == ['AZ', 'OB', 'NOTE']
+    assert index.search('fondo mef') == []
+
+def test_typos_do_not_match_other_words(index):
+    assert index.search('azionrio') == ['AZ', 'NOTE']
+    assert 'OB' not in index.search('azionrio')
+
+def test_short_terms_match_inside_words(index):
+    # "tf" non è l'inizio di nessuna parola: viene cercato come sottostringa
+    assert index.search('tf') == ['ETF']
+    assert index.search('bt') == ['BTP']
+
+def test_name_matches_rank_before_notes(index):
+    results = index.search('azionario')
+    assert results.index('AZ') < results.index('NOTE')
+    assert index.search('fondo', limit=2) == ['AZ', 'OB']
+
+def test_sync_reindexes_only_changes(index, products):
+    changed = products[products['id'] != 'BTP'].copy()
+    changed.loc[changed['id'] == 'ETF', 'nome'] = 'ETC Oro fisico'
+    index.sync(changed, version=2)
+
+    assert len(index) == 5
+    assert index.version == 2
+    assert index.search('btp') == []
+    assert index.search('msci') == []
+    assert index.search('oro') == ['ETF']
+
+    index.sync(products.iloc[0:0], version=3)
+    assert len(index) == 0
+    assert index.search('fondo') == []
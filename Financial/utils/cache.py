@@ -0,0 +1,85 @@
+import threading
+from collections import OrderedDict
+
+class LRUCache:
+    """
+    Thread-safe least-recently-used cache shared by all sessions of the process,
+    bounded both by number of entries and by approximate size in bytes.
+
+    Parameters:
+    - max_entries: Maximum number of entries kept
+    - max_bytes: Maximum total size of the entries (as reported by sizeof)
+    - sizeof: function(value) returning the approximate size of a value in bytes
+    """
+
+    def __init__(self, max_entries, max_bytes, sizeof=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._sizeof = sizeof or (lambda value: 0)
+        self._entries = OrderedDict()  # chiave -> (valore, dimensione)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def get(self, key):
+        """
+        Returns the cached value for key (marking it as recently used), or None
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return entry[0]
+
+    def put(self, key, value):
+        """
+        Stores a value, evicting the least recently used entries over the limits.
+        Values larger than max_bytes on their own are not cached.
+        """
+        size = self._sizeof(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous[1]
+            self._entries[key] = (value, size)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self._evictions += 1
+
+    def discard_if(self, predicate):
+        """
+        Removes the entries whose key satisfies predicate(key)
+        """
+        with self._lock:
+            for key in [key for key in self._entries if predicate(key)]:
+                self._bytes -= self._entries.pop(key)[1]
+
+    def clear(self):
+        """
+        Removes all entries
+        """
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        """
+        Returns a dict with entries, bytes, hits, misses and evictions
+        """
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'hits': self._hits,
+                'misses': self._misses,
+                'evictions': self._evictions
+            }
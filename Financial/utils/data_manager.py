@@ -1,185 +1,702 @@
 import pandas as pd
 import psycopg2
 import os
+import re
 import random
 import string
 import datetime
+import threading
 from psycopg2 import sql
-from config import get_db_config
+from psycopg2.extras import execute_values
+from utils.db import get_db_connection
+from utils.cache import LRUCache
+from utils.financial import normalize_portfolio
+from utils.migrations import run_migrations
+from utils.notifications import notify_change, register_listener, is_listening
+from utils.portfolio_summary import add_to_summary, withdraw_from_summary, read_portfolio_totals
 
-def get_db_connection():
+# Colonne della tabella prodotti_finanziari, nell'ordine usato per le scritture
+PRODUCT_COLUMNS = [
+    'id', 'nome', 'fornitore', 'tipologia', 'vincolo',
+    'capitale_investito', 'capitale_finale', 'data_scadenza',
+    'note', 'data_inserimento', 'data_aggiornamento'
+]
+
+PRODUCTS_TABLE = 'prodotti_finanziari'
+
+# Elenco delle colonne per le letture: la tabella ha anche colonne interne
+# (es. search_vector) che non devono arrivare nei DataFrame
+PRODUCT_SELECT = ', '.join(PRODUCT_COLUMNS)
+
+# Risultati per pagina predefiniti della ricerca lato database
+SEARCH_PAGE_SIZE = 50
+
+# Prodotti per pagina predefiniti dell'elenco paginato
+LIST_PAGE_SIZE = 50
+
+# Colonne su cui l'elenco paginato può essere filtrato (uguaglianza)
+LIST_FILTER_COLUMNS = ['vincolo', 'tipologia', 'fornitore']
+
+# Valori disponibili per i filtri: (versione dei dati, dict), condivisi tra le sessioni
+_filter_options_cache = None
+
+# Filtri presenti anche come chiavi di portfolio_summary: i conteggi che usano solo
+# questi si leggono dagli aggregati, con un costo che non dipende dal numero di prodotti
+SUMMARY_FILTER_COLUMNS = ['vincolo', 'tipologia']
+
+# Conteggi che richiedono la scansione dei prodotti (filtro per fornitore):
+# (versione dei dati, filtri) -> numero di prodotti, condivisi tra le sessioni
+_count_cache = LRUCache(max_entries=256, max_bytes=float('inf'))
+
+# Aggiornamenti restituiti per pagina dallo storico dei valori
+HISTORY_PAGE_SIZE = 1000
+
+# Anni per cui la partizione di storico_valori esiste già
+_history_years = set()
+_history_years_lock = threading.Lock()
+
+# Ultimo portafoglio letto dal processo: (versione, DataFrame), condiviso tra le sessioni
+_portfolio_cache = None
+_portfolio_cache_lock = threading.Lock()
+
+# Prodotti modificati secondo le notifiche ricevute e non ancora riletti
+_stale_ids = set()
+_stale_all = False
+
+def init_database():
+    """
+    Initialize the database schema by applying the pending migrations
+    """
+    return run_migrations()
+
+def generate_id():
+    """
+    Generates a unique ID for a new product
+    """
+    return ''.join(random.choices(string.ascii_uppercase + string.digits, k=10))
+
+def empty_products_frame():
     """
-    Creates a connection to the PostgreSQL database
+    Returns an empty DataFrame with the expected product columns
+    """
+    return pd.DataFrame(columns=PRODUCT_COLUMNS)
+
+def bump_data_version(cursor, ids=None):
+    """
+    Increments the version of the products table inside the caller's transaction,
+    adds the written products to the aggregates (see utils.portfolio_summary)
+    and notifies the other processes of the affected products.
+    Every write to prodotti_finanziari must call it so cached portfolios are refreshed;
+    writes that update or delete existing products must also call
+    withdraw_from_summary with the same IDs before modifying them.
+    
+    Parameters:
+    - cursor: Database cursor of the writing transaction
+    - ids: IDs of the inserted/updated/deleted products, or None for the whole table
     
     Returns:
-    - connection: psycopg2 connection object
+    - int: new version of the table
+    """
+    cursor.execute(
+        "UPDATE data_version SET version = version + 1 WHERE table_name = %s RETURNING version;",
+        (PRODUCTS_TABLE,)
+    )
+    row = cursor.fetchone()
+    version = row[0] if row else None
+    add_to_summary(cursor, ids)
+    notify_change(cursor, PRODUCTS_TABLE, version, ids)
+    return version
+
+def read_data_version(cursor):
+    """
+    Reads the current version of the products table
+    
+    Returns:
+    - int: table version (0 if not initialized)
+    """
+    cursor.execute("SELECT version FROM data_version WHERE table_name = %s;", (PRODUCTS_TABLE,))
+    row = cursor.fetchone()
+    return row[0] if row else 0
+
+def get_data_version():
+    """
+    Returns the current version of the products table, or None if the database is unreachable
     """
+    conn = get_db_connection()
+    if conn is None:
+        return None
+    
+    cursor = conn.cursor()
     try:
-        db_config = get_db_config()
-        
-        # Se abbiamo un URL diretto, usalo
-        if "url" in db_config:
-            try:
-                # Prima prova con verify-full
-                conn = psycopg2.connect(db_config["url"])
-                return conn
-            except Exception as ssl_error:
-                print(f"Errore con SSL verify-full: {ssl_error}")
-                # Modifica l'URL per usare sslmode=require
-                modified_url = db_config["url"].replace("sslmode=verify-full", "sslmode=require")
-                if modified_url == db_config["url"]:  # Se non c'era verify-full nell'URL
-                    if "?" in modified_url:
-                        modified_url += "&sslmode=require"
-                    else:
-                        modified_url += "?sslmode=require"
-                try:
-                    conn = psycopg2.connect(modified_url)
-                    print("Connessione riuscita con sslmode=require")
-                    return conn
-                except Exception as second_error:
-                    print(f"Errore anche con sslmode=require: {second_error}")
-                    # Ultimo tentativo senza SSL
-                    try:
-                        no_ssl_url = modified_url.replace("sslmode=require", "sslmode=disable")
-                        conn = psycopg2.connect(no_ssl_url)
-                        print("Connessione riuscita con sslmode=disable")
-                        return conn
-                    except Exception as final_error:
-                        print(f"Tutti i tentativi di connessione falliti: {final_error}")
-                        return None
-        # Altrimenti, usa i parametri individuali
-        else:
-            connect_params = {
-                "host": db_config["host"],
-                "port": db_config["port"],
-                "user": db_config["user"],
-                "password": db_config["password"],
-                "database": db_config["database"],
-                "sslmode": "require"  # Impostiamo sempre require come default
-            }
-            
-            # Aggiungi parametri opzionali se presenti nel config
-            if "sslmode" in db_config:
-                connect_params["sslmode"] = db_config["sslmode"]
-            if "options" in db_config:
-                connect_params["options"] = db_config["options"]
-                
-            try:
-                conn = psycopg2.connect(**connect_params)
-                return conn
-            except Exception as params_error:
-                print(f"Errore con parametri individuali: {params_error}")
-                # Prova con sslmode=disable come ultima risorsa
-                connect_params["sslmode"] = "disable"
-                try:
-                    conn = psycopg2.connect(**connect_params)
-                    print("Connessione riuscita con sslmode=disable")
-                    return conn
-                except Exception as final_params_error:
-                    print(f"Fallimento finale della connessione: {final_params_error}")
-                    return None
+        return read_data_version(cursor)
     except Exception as e:
-        print(f"Errore generale di connessione al database: {e}")
+        print(f"Errore durante la lettura della versione dei dati: {e}")
         return None
+    finally:
+        cursor.close()
+        conn.close()
 
-def init_database():
+def _read_products(conn):
+    # Read data from the database
+    query = f"SELECT {PRODUCT_SELECT} FROM prodotti_finanziari ORDER BY data_inserimento DESC;"
+    return normalize_portfolio(_index_by_id(pd.read_sql_query(query, conn)))
+
+def _index_by_id(df):
+    # Set id as the index but non visibile come colonna
+    if not df.empty and 'id' in df.columns:
+        # Salviamo l'ID come indice ma impostando drop=True per non mantenerlo come colonna
+        df = df.set_index('id', drop=True)
+        # Ricreaiamo una colonna 'id' nascosta per operazioni interne ma non visibile nell'interfaccia
+        df['id'] = df.index
+    
+    return df
+
+def load_data():
     """
-    Initialize the database schema if tables don't exist
+    Loads financial products data from PostgreSQL database
+    
+    Returns:
+    - DataFrame: containing financial products data
     """
     conn = get_db_connection()
     if conn is None:
-        return False
+        # Return empty DataFrame with expected columns
+        return empty_products_frame()
     
+    try:
+        return _read_products(conn)
+    except Exception as e:
+        print(f"Errore durante il caricamento dei dati: {e}")
+        # Return empty DataFrame with expected columns
+        return empty_products_frame()
+    finally:
+        conn.close()
+
+def _on_data_changed(payload):
+    # Eseguita dal thread in ascolto delle notifiche: annota i prodotti da rileggere
+    global _stale_all
+    if payload.get('table') not in (None, PRODUCTS_TABLE):
+        return
+    with _portfolio_cache_lock:
+        if payload.get('ids') is None:
+            _stale_all = True
+        else:
+            _stale_ids.update(payload['ids'])
+
+def mark_products_stale(ids=None):
+    """
+    Marks the given products of the cached portfolio to be read again.
+    Write paths call it right after their commit, so the writing process sees
+    its own changes without waiting for its notification to come back.
+    
+    Parameters:
+    - ids: IDs of the written products, or None for the whole table
+    """
+    _on_data_changed({'table': PRODUCTS_TABLE, 'ids': None if ids is None else list(ids)})
+
+def _refresh_cached_rows(conn, cached, ids):
+    """
+    Re-reads only the given products and merges them into the cached portfolio
+    
+    Returns:
+    - tuple: (version, DataFrame) for the new cache entry
+    """
     cursor = conn.cursor()
     try:
-        # Check if the products table exists
-        cursor.execute("""
-            SELECT EXISTS (
-               SELECT FROM information_schema.tables 
-               WHERE table_name = 'prodotti_finanziari'
-            );
-        """)
+        version = read_data_version(cursor)
+    finally:
+        cursor.close()
+    
+    changed = pd.read_sql_query(
+        f"SELECT {PRODUCT_SELECT} FROM prodotti_finanziari WHERE id = ANY(%(ids)s);",
+        conn, params={'ids': list(ids)}
+    )
+    changed = _index_by_id(changed)
+    
+    df = cached.drop(index=list(ids), errors='ignore')
+    frames = [frame for frame in (df, changed) if not frame.empty]
+    df = pd.concat(frames) if frames else cached.iloc[0:0]
+    df = df.sort_values('data_inserimento', ascending=False, kind='stable')
+    # La concatenazione può perdere i tipi normalizzati (es. categorie diverse)
+    df = normalize_portfolio(df)
+    df.attrs['data_version'] = version
+    return version, df
+
+def load_data_cached(force_reload=False):
+    """
+    Loads financial products data, reusing the frame cached in this process
+    while the table version stored in the database is unchanged.
+    Each call costs a single-row version lookup; the table is read again
+    only after a write (from any session or replica).
+    
+    The returned frame is normalized (see utils.financial.normalize_portfolio)
+    and shared by all sessions: treat it as read-only and copy it before
+    modifying it.
+    
+    Parameters:
+    - force_reload: Boolean, ignore the cache and read the table again
+    
+    Returns:
+    - DataFrame: containing financial products data; df.attrs['data_version']
+      holds the version the data corresponds to
+    """
+    global _portfolio_cache, _stale_all
+    
+    # Con il thread delle notifiche attivo la cache è valida finché non arriva
+    # una notifica: nessun accesso al database. Altrimenti controlliamo la versione.
+    if is_listening() and not force_reload:
+        with _portfolio_cache_lock:
+            cached = _portfolio_cache
+            stale_all = _stale_all
+            stale_ids = set(_stale_ids)
+            if cached is not None and not stale_all:
+                _stale_ids.clear()
+        if cached is not None and not stale_all:
+            if not stale_ids:
+                return cached[1]
+            
+            # Rileggiamo solo i prodotti indicati dalle notifiche
+            conn = get_db_connection()
+            if conn is not None:
+                try:
+                    entry = _refresh_cached_rows(conn, cached[1], stale_ids)
+                    with _portfolio_cache_lock:
+                        _portfolio_cache = entry
+                    return entry[1]
+                except Exception as e:
+                    print(f"Errore durante l'aggiornamento parziale dei dati: {e}")
+                    conn.rollback()
+                finally:
+                    conn.close()
+            # In caso di errore ripieghiamo sulla rilettura completa
+            with _portfolio_cache_lock:
+                _stale_all = True
+    
+    conn = get_db_connection()
+    if conn is None:
+        # Database non raggiungibile: meglio l'ultima copia nota che una pagina vuota
+        with _portfolio_cache_lock:
+            cached = _portfolio_cache
+        return cached[1] if cached is not None else empty_products_frame()
+    
+    cursor = conn.cursor()
+    try:
+        # La versione va letta PRIMA dei dati: se una scrittura avviene nel mezzo,
+        # la cache risulta più vecchia del database e verrà ricaricata
+        version = read_data_version(cursor)
+        conn.commit()
         
-        table_exists = cursor.fetchone()[0]
+        with _portfolio_cache_lock:
+            cached = _portfolio_cache
+        if not force_reload and cached is not None and cached[0] == version:
+            return cached[1]
         
-        if not table_exists:
-            # Create the table
-            cursor.execute("""
-                CREATE TABLE prodotti_finanziari (
-                    id VARCHAR(36) PRIMARY KEY,
-                    nome VARCHAR(255) NOT NULL,
-                    fornitore VARCHAR(255) NOT NULL,
-                    tipologia VARCHAR(100) NOT NULL,
-                    vincolo VARCHAR(50) NOT NULL,
-                    capitale_investito DECIMAL(15, 2) NOT NULL,
-                    capitale_finale DECIMAL(15, 2) NOT NULL,
-                    data_scadenza DATE,
-                    note TEXT,
-                    data_inserimento DATE NOT NULL,
-                    data_aggiornamento DATE NOT NULL
-                );
-            """)
-            conn.commit()
-            print("Tabella prodotti_finanziari creata con successo")
+        # Le notifiche ricevute da qui in poi riguardano dati non ancora letti
+        with _portfolio_cache_lock:
+            _stale_all = False
+            _stale_ids.clear()
         
-        conn.commit()
-        return True
+        df = _read_products(conn)
+        df.attrs['data_version'] = version
+        with _portfolio_cache_lock:
+            _portfolio_cache = (version, df)
+        return df
     except Exception as e:
-        print(f"Errore durante l'inizializzazione del database: {e}")
-        conn.rollback()
-        return False
+        print(f"Errore durante il caricamento dei dati: {e}")
+        return empty_products_frame()
     finally:
         cursor.close()
         conn.close()
 
-def generate_id():
+def invalidate_data_cache():
     """
-    Generates a unique ID for a new product
+    Drops the cached portfolio of this process
     """
-    return ''.join(random.choices(string.ascii_uppercase + string.digits, k=10))
+    global _portfolio_cache, _stale_all
+    with _portfolio_cache_lock:
+        _portfolio_cache = None
+        _stale_all = False
+        _stale_ids.clear()
 
-def load_data():
+# Le notifiche delle scritture (di qualsiasi replica) aggiornano la cache del portafoglio
+register_listener(_on_data_changed)
+
+def _search_query_text(text):
+    # Ogni parola diventa un prefisso ("parola:*") e tutte devono essere presenti:
+    # estraiamo solo lettere e cifre, così l'input non può alterare la sintassi di tsquery
+    words = re.findall(r'\w+', text.lower())
+    return ' & '.join(f"{word}:*" for word in words)
+
+def search_products(text, page=1, page_size=SEARCH_PAGE_SIZE, filters=None):
     """
-    Loads financial products data from PostgreSQL database
+    Searches the products in the database by nome, fornitore, tipologia and note
+    using the Italian full-text index, without loading the whole table.
+    Every word of the text must match (as a prefix, with Italian stemming);
+    results are ordered by relevance, then by insertion date.
+    
+    Parameters:
+    - text: Text to search
+    - page: Page number, starting from 1
+    - page_size: Number of products per page
+    - filters: dict {column: value} on vincolo, tipologia and fornitore (see list_products)
     
     Returns:
-    - DataFrame: containing financial products data
+    - tuple: (DataFrame with the products of the page, total number of matches)
     """
-    # Initialize the database if needed
-    init_database()
+    query_text = _search_query_text(text)
+    if not query_text:
+        return empty_products_frame(), 0
     
     conn = get_db_connection()
     if conn is None:
-        # Return empty DataFrame with expected columns
-        return pd.DataFrame(columns=[
-            'id', 'nome', 'fornitore', 'tipologia', 'vincolo',
-            'capitale_investito', 'capitale_finale', 'data_scadenza',
-            'note', 'data_inserimento', 'data_aggiornamento'
-        ])
+        return empty_products_frame(), 0
     
+    conditions, filter_params = _filter_conditions(filters)
+    where = sql.SQL(" AND ").join([sql.SQL("search_vector @@ to_tsquery('italian', %s)")] + conditions)
+    params = [query_text] + filter_params
     try:
-        # Read data from the database
-        query = "SELECT * FROM prodotti_finanziari ORDER BY data_inserimento DESC;"
-        df = pd.read_sql_query(query, conn)
+        cursor = conn.cursor()
+        # Il conteggio totale arriva con la pagina stessa grazie alla funzione finestra
+        query = sql.SQL("""
+            SELECT {columns}, count(*) OVER () AS total_count
+            FROM prodotti_finanziari
+            WHERE {where}
+            ORDER BY ts_rank(search_vector, to_tsquery('italian', %s)) DESC,
+                     data_inserimento DESC, id
+            LIMIT %s OFFSET %s;
+        """).format(columns=sql.SQL(PRODUCT_SELECT), where=where)
+        df = pd.read_sql_query(
+            query.as_string(cursor), conn,
+            params=params + [query_text, page_size, (max(page, 1) - 1) * page_size]
+        )
         
-        # Set id as the index but non visibile come colonna
-        if not df.empty and 'id' in df.columns:
-            # Salviamo l'ID come indice ma impostando drop=True per non mantenerlo come colonna
-            df = df.set_index('id', drop=True)
-            # Ricreaiamo una colonna 'id' nascosta per operazioni interne ma non visibile nell'interfaccia
-            df['id'] = df.index
+        if not df.empty:
+            total = int(df['total_count'].iloc[0])
+        else:
+            # Pagina oltre l'ultima: il totale va contato a parte
+            cursor.execute(sql.SQL("SELECT count(*) FROM prodotti_finanziari WHERE {where};").format(where=where), params)
+            total = cursor.fetchone()[0]
+        cursor.close()
         
-        return df
+        df = normalize_portfolio(_index_by_id(df.drop(columns=['total_count'])))
+        return df, total
     except Exception as e:
-        print(f"Errore durante il caricamento dei dati: {e}")
-        # Return empty DataFrame with expected columns
-        return pd.DataFrame(columns=[
-            'id', 'nome', 'fornitore', 'tipologia', 'vincolo',
-            'capitale_investito', 'capitale_finale', 'data_scadenza',
-            'note', 'data_inserimento', 'data_aggiornamento'
-        ])
+        print(f"Errore durante la ricerca dei prodotti: {e}")
+        return empty_products_frame(), 0
+    finally:
+        conn.close()
+
+def peek_data_cached():
+    """
+    Returns the portfolio cached in this process if it is up to date, without
+    ever reading the whole table; None when there is no valid cached copy
+    
+    Returns:
+    - DataFrame or None
+    """
+    with _portfolio_cache_lock:
+        cached = _portfolio_cache
+        stale_all = _stale_all
+    if cached is None:
+        return None
+    
+    if is_listening():
+        # Solo notifiche puntuali: l'aggiornamento parziale rilegge pochi prodotti
+        return None if stale_all else load_data_cached()
+    return cached[1] if get_data_version() == cached[0] else None
+
+def _filter_conditions(filters):
+    # Condizioni di uguaglianza sulle colonne ammesse, con parametri separati dalla query
+    conditions = []
+    params = []
+    for column in LIST_FILTER_COLUMNS:
+        value = (filters or {}).get(column)
+        if value:
+            conditions.append(sql.SQL("{} = %s").format(sql.Identifier(column)))
+            params.append(value)
+    return conditions, params
+
+def list_products(page_size=LIST_PAGE_SIZE, after=None, filters=None):
+    """
+    Reads one page of products, most recently inserted first, with keyset
+    pagination on (data_inserimento, id): the cost of a page does not depend
+    on its position or on the size of the table
+    
+    Parameters:
+    - page_size: Number of products per page
+    - after: Cursor returned for the previous page, None for the first page
+    - filters: dict {column: value} on vincolo, tipologia and fornitore
+    
+    Returns:
+    - tuple: (DataFrame with the page, cursor of the next page or None if this is the last)
+    """
+    conditions, params = _filter_conditions(filters)
+    if after is not None:
+        conditions.append(sql.SQL("(data_inserimento, id) < (%s, %s)"))
+        params.extend(after)
+    
+    where = sql.SQL("WHERE ") + sql.SQL(" AND ").join(conditions) if conditions else sql.SQL("")
+    # Una riga in più per sapere se esiste una pagina successiva
+    query = sql.SQL("""
+        SELECT {columns} FROM prodotti_finanziari {where}
+        ORDER BY data_inserimento DESC, id DESC
+        LIMIT %s;
+    """).format(columns=sql.SQL(PRODUCT_SELECT), where=where)
+    params.append(page_size + 1)
+    
+    conn = get_db_connection()
+    if conn is None:
+        return empty_products_frame(), None
+    
+    try:
+        # as_string richiede la connessione psycopg2 vera e propria: la otteniamo dal cursore
+        cursor = conn.cursor()
+        query_text = query.as_string(cursor)
+        cursor.close()
+        df = pd.read_sql_query(query_text, conn, params=params)
+    except Exception as e:
+        print(f"Errore durante il caricamento della pagina di prodotti: {e}")
+        return empty_products_frame(), None
     finally:
         conn.close()
+    
+    next_cursor = None
+    if len(df) > page_size:
+        df = df.iloc[:page_size]
+        last = df.iloc[-1]
+        next_cursor = (last['data_inserimento'], last['id'])
+    return normalize_portfolio(_index_by_id(df)), next_cursor
+
+def count_products(filters=None):
+    """
+    Counts the products matching the filters of list_products.
+    Without a fornitore filter the count is read from the aggregates
+    (portfolio_summary); otherwise it is computed once per data version.
+    
+    Parameters:
+    - filters: dict {column: value} on vincolo, tipologia and fornitore
+    
+    Returns:
+    - int: number of products (0 if the database is unreachable)
+    """
+    conditions, params = _filter_conditions(filters)
+    where = sql.SQL("WHERE ") + sql.SQL(" AND ").join(conditions) if conditions else sql.SQL("")
+    from_summary = all(column in SUMMARY_FILTER_COLUMNS for column, value in (filters or {}).items() if value)
+    
+    key = None
+    if not from_summary:
+        version = get_data_version()
+        if version is not None:
+            key = (version, tuple(sorted((column, value) for column, value in filters.items() if value)))
+            cached = _count_cache.get(key)
+            if cached is not None:
+                return cached
+    
+    conn = get_db_connection()
+    if conn is None:
+        return 0
+    
+    cursor = conn.cursor()
+    try:
+        if from_summary:
+            query = sql.SQL("SELECT COALESCE(SUM(prodotti), 0) FROM portfolio_summary {where};")
+        else:
+            query = sql.SQL("SELECT count(*) FROM prodotti_finanziari {where};")
+        cursor.execute(query.format(where=where), params)
+        count = int(cursor.fetchone()[0])
+        if key is not None:
+            _count_cache.put(key, count)
+        return count
+    except Exception as e:
+        print(f"Errore durante il conteggio dei prodotti: {e}")
+        return 0
+    finally:
+        cursor.close()
+        conn.close()
+
+def get_product(product_id):
+    """
+    Reads a single product
+    
+    Parameters:
+    - product_id: ID of the product
+    
+    Returns:
+    - DataFrame: one row (indexed by ID) or empty if the product does not exist
+    """
+    conn = get_db_connection()
+    if conn is None:
+        return empty_products_frame()
+    
+    try:
+        df = pd.read_sql_query(
+            f"SELECT {PRODUCT_SELECT} FROM prodotti_finanziari WHERE id = %(id)s;",
+            conn, params={'id': product_id}
+        )
+        return normalize_portfolio(_index_by_id(df))
+    except Exception as e:
+        print(f"Errore durante il caricamento del prodotto: {e}")
+        return empty_products_frame()
+    finally:
+        conn.close()
+
+def get_product_filter_options():
+    """
+    Returns the distinct values available for the list filters, read again
+    only when the data version changes
+    
+    Returns:
+    - dict: {column: sorted list of values} for vincolo, tipologia and fornitore
+    """
+    global _filter_options_cache
+    version = get_data_version()
+    cached = _filter_options_cache
+    if version is not None and cached is not None and cached[0] == version:
+        return cached[1]
+    
+    conn = get_db_connection()
+    if conn is None:
+        return cached[1] if cached is not None else {column: [] for column in LIST_FILTER_COLUMNS}
+    
+    cursor = conn.cursor()
+    try:
+        options = {}
+        for column in LIST_FILTER_COLUMNS:
+            cursor.execute(sql.SQL("SELECT DISTINCT {column} FROM prodotti_finanziari ORDER BY 1;").format(
+                column=sql.Identifier(column)))
+            options[column] = [row[0] for row in cursor.fetchall() if row[0]]
+        if version is not None:
+            _filter_options_cache = (version, options)
+        return options
+    except Exception as e:
+        print(f"Errore durante la lettura dei valori dei filtri: {e}")
+        return {column: [] for column in LIST_FILTER_COLUMNS}
+    finally:
+        cursor.close()
+        conn.close()
+
+# Totali calcolati: (versione dei dati, data) -> dict, condivisi tra le sessioni
+_totals_cache = LRUCache(max_entries=16, max_bytes=float('inf'))
+
+def get_portfolio_totals(as_of=None):
+    """
+    Reads from the aggregates kept by the write paths the figures of the
+    dashboard header and pie charts, without transferring or scanning the
+    products. The result equals utils.financial.calculate_portfolio_totals on
+    the whole table and is reused until the data version or the date change.
+    
+    Parameters:
+    - as_of: Date of the values (default: today)
+    
+    Returns:
+    - dict: count, total_invested, total_current, liquid_value, bound_value,
+      total_value, by_tipologia and by_vincolo (shared: treat as read-only),
+      or None if the database is unreachable or cannot read the aggregates
+    """
+    as_of = datetime.date.today() if as_of is None else pd.Timestamp(as_of).date()
+    
+    conn = get_db_connection()
+    if conn is None:
+        return None
+    
+    cursor = conn.cursor()
+    try:
+        version = read_data_version(cursor)
+        cached = _totals_cache.get((version, as_of))
+        if cached is not None:
+            return cached
+        
+        totals = read_portfolio_totals(cursor, as_of)
+        conn.commit()
+    except Exception as e:
+        # Ad esempio su database senza supporto per GROUPING SETS: si calcola in pandas
+        print(f"Errore durante il calcolo dei totali del portafoglio: {e}")
+        conn.rollback()
+        return None
+    finally:
+        cursor.close()
+        conn.close()
+    
+    _totals_cache.put((version, as_of), totals)
+    return totals
+
+# Numero di righe inviate al database per ogni statement di upsert
+SAVE_PAGE_SIZE = 1000
+
+UPSERT_QUERY = """
+    INSERT INTO prodotti_finanziari (
+        id, nome, fornitore, tipologia, vincolo,
+        capitale_investito, capitale_finale, data_scadenza,
+        note, data_inserimento, data_aggiornamento
+    ) VALUES %s
+    ON CONFLICT (id) DO UPDATE SET
+        nome = EXCLUDED.nome,
+        fornitore = EXCLUDED.fornitore,
+        tipologia = EXCLUDED.tipologia,
+        vincolo = EXCLUDED.vincolo,
+        capitale_investito = EXCLUDED.capitale_investito,
+        capitale_finale = EXCLUDED.capitale_finale,
+        data_scadenza = EXCLUDED.data_scadenza,
+        note = EXCLUDED.note,
+        data_inserimento = EXCLUDED.data_inserimento,
+        data_aggiornamento = EXCLUDED.data_aggiornamento;
+"""
+
+def prepare_products(df):
+    """
+    Normalizes a products DataFrame for writing to the database.
+    Missing columns and IDs are filled in, liquid products without a value
+    get capitale_finale == capitale_investito and dates become 'YYYY-MM-DD'
+    strings (None for missing values). All steps are vectorized.
+    
+    Parameters:
+    - df: DataFrame containing financial products data
+    
+    Returns:
+    - DataFrame: new frame with exactly PRODUCT_COLUMNS, one row per ID
+    """
+    # Make a copy of the dataframe to avoid modifying the original
+    df_copy = df.reset_index(drop=True).reindex(columns=PRODUCT_COLUMNS)
+    today = datetime.datetime.now().strftime('%Y-%m-%d')
+    
+    # Ensure each product has an ID
+    missing_id = df_copy['id'].isna() | (df_copy['id'] == '')
+    if missing_id.any():
+        df_copy.loc[missing_id, 'id'] = [generate_id() for _ in range(int(missing_id.sum()))]
+    
+    for col in ['nome', 'fornitore', 'tipologia', 'vincolo', 'note']:
+        # astype(object): vincolo può arrivare come categoria da un frame normalizzato
+        df_copy[col] = df_copy[col].astype(object).fillna('')
+    
+    # Il valore di un prodotto liquido viene rivalutato da update_liquid_product e
+    # dall'importazione delle quotazioni: si conserva quello ricevuto, e solo se
+    # manca il prodotto parte dal capitale investito
+    df_copy['capitale_investito'] = pd.to_numeric(df_copy['capitale_investito'], errors='coerce').fillna(0.0).astype(float)
+    capitale_finale = pd.to_numeric(df_copy['capitale_finale'], errors='coerce')
+    liquid = (df_copy['vincolo'] == 'Liquido') & capitale_finale.isna()
+    df_copy['capitale_finale'] = capitale_finale.where(~liquid, df_copy['capitale_investito']).fillna(0.0).astype(float)
+    
+    # Gestire correttamente le date per evitare errori di tipo: le convertiamo
+    # in stringhe SQL e usiamo None per i valori nulli
+    for col in ['data_scadenza', 'data_inserimento', 'data_aggiornamento']:
+        dates = pd.to_datetime(df_copy[col], errors='coerce').dt.strftime('%Y-%m-%d')
+        if col != 'data_scadenza':
+            dates = dates.fillna(today)
+        df_copy[col] = dates.astype(object).where(dates.notna(), None)
+    
+    # In caso di ID ripetuti vale l'ultima riga, come per scritture sequenziali
+    return df_copy.drop_duplicates(subset='id', keep='last')
+
+def upsert_products(cursor, products):
+    """
+    Writes prepared products with batched INSERT ... ON CONFLICT statements
+    
+    Parameters:
+    - cursor: Database cursor (the caller handles the transaction)
+    - products: DataFrame returned by prepare_products
+    """
+    rows = products[PRODUCT_COLUMNS].astype(object).itertuples(index=False, name=None)
+    execute_values(cursor, UPSERT_QUERY, rows, page_size=SAVE_PAGE_SIZE)
 
 def save_data(df):
     """
@@ -191,44 +708,7 @@ def save_data(df):
     if df.empty:
         return
     
-    # Make a copy of the dataframe to avoid modifying the original
-    df_copy = df.copy()
-    
-    # Ensure all required columns exist
-    required_columns = [
-        'id', 'nome', 'fornitore', 'tipologia', 'vincolo',
-        'capitale_investito', 'capitale_finale', 'data_scadenza',
-        'note', 'data_inserimento', 'data_aggiornamento'
-    ]
-    
-    for col in required_columns:
-        if col not in df_copy.columns:
-            if col == 'id':
-                df_copy['id'] = [generate_id() for _ in range(len(df_copy))]
-            elif col == 'data_inserimento' or col == 'data_aggiornamento':
-                df_copy[col] = datetime.datetime.now().strftime('%Y-%m-%d')
-            elif col == 'data_scadenza':
-                df_copy[col] = None
-            elif col == 'note':
-                df_copy[col] = ''
-            else:
-                df_copy[col] = ''
-    
-    # Gestire correttamente la colonna data_scadenza per evitare errori di tipo
-    # Convertiamo le date a oggetti datetime e gestisci i valori nulli correttamente
-    df_copy['data_scadenza'] = pd.to_datetime(df_copy['data_scadenza'], errors='coerce')
-    
-    # Creiamo una lista per memorizzare le date in formato corretto per SQL
-    data_scadenze_sql = []
-    
-    for d in df_copy['data_scadenza']:
-        if pd.isna(d):
-            data_scadenze_sql.append(None)  # Usa None per date NULL in SQL
-        else:
-            data_scadenze_sql.append(d.strftime('%Y-%m-%d'))  # Formatta le date valide
-    
-    # Sostituisci la colonna con i dati formattati correttamente
-    df_copy['data_scadenza'] = data_scadenze_sql
+    products = prepare_products(df)
     
     # Connect to the database
     conn = get_db_connection()
@@ -239,71 +719,15 @@ def save_data(df):
     cursor = conn.cursor()
     
     try:
-        # For each record, do an "UPSERT" - update if ID exists, insert if it doesn't
-        for _, row in df_copy.iterrows():
-            # Ensure each product has an ID
-            if pd.isna(row['id']) or row['id'] == '':
-                row['id'] = generate_id()
-            
-            # Assicuriamoci che i prodotti liquidi abbiano capitale_finale == capitale_investito
-            if row['vincolo'] == 'Liquido':
-                row['capitale_finale'] = row['capitale_investito']
-            
-            # First check if this ID already exists
-            cursor.execute("SELECT COUNT(*) FROM prodotti_finanziari WHERE id = %s", (row['id'],))
-            exists = cursor.fetchone()[0] > 0
-            
-            if exists:
-                # Update existing record
-                update_query = sql.SQL("""
-                    UPDATE prodotti_finanziari
-                    SET nome = %s, fornitore = %s, tipologia = %s, vincolo = %s,
-                        capitale_investito = %s, capitale_finale = %s, data_scadenza = %s,
-                        note = %s, data_inserimento = %s, data_aggiornamento = %s
-                    WHERE id = %s;
-                """)
-                
-                cursor.execute(update_query, (
-                    row['nome'],
-                    row['fornitore'],
-                    row['tipologia'],
-                    row['vincolo'],
-                    row['capitale_investito'],
-                    row['capitale_finale'],
-                    row['data_scadenza'],
-                    row['note'],
-                    row['data_inserimento'],
-                    row['data_aggiornamento'],
-                    row['id']
-                ))
-            else:
-                # Insert new record
-                insert_query = sql.SQL("""
-                    INSERT INTO prodotti_finanziari (
-                        id, nome, fornitore, tipologia, vincolo,
-                        capitale_investito, capitale_finale, data_scadenza,
-                        note, data_inserimento, data_aggiornamento
-                    ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s);
-                """)
-                
-                # Execute the query with the row values
-                cursor.execute(insert_query, (
-                    row['id'],
-                    row['nome'],
-                    row['fornitore'],
-                    row['tipologia'],
-                    row['vincolo'],
-                    row['capitale_investito'],
-                    row['capitale_finale'],
-                    row['data_scadenza'],
-                    row['note'],
-                    row['data_inserimento'],
-                    row['data_aggiornamento']
-                ))
+        # Un unico upsert a blocchi: inserisce i nuovi ID e aggiorna quelli esistenti
+        withdraw_from_summary(cursor, products['id'].tolist())
+        upsert_products(cursor, products)
+        bump_data_version(cursor, products['id'].tolist())
         
         # Commit the changes
         conn.commit()
-        print(f"Salvati {len(df_copy)} prodotti nel database")
+        mark_products_stale(products['id'].tolist())
+        print(f"Salvati {len(products)} prodotti nel database")
     except Exception as e:
         print(f"Errore durante il salvataggio dei dati: {e}")
         conn.rollback()
@@ -311,6 +735,159 @@ def save_data(df):
         cursor.close()
         conn.close()
 
+class ChangeTracker:
+    """
+    Records inserted, updated and deleted products on top of a loaded portfolio
+    and writes only that delta to the database in a single transaction.
+    
+    Parameters:
+    - df: DataFrame returned by load_data (used to read the current values)
+    """
+    
+    def __init__(self, df):
+        self._df = df
+        self._inserted = {}   # id -> riga normalizzata (dict)
+        self._updated = {}    # id -> {colonna: valore normalizzato}
+        self._deleted = set()
+    
+    def _current_row(self, product_id):
+        if product_id in self._inserted:
+            return dict(self._inserted[product_id])
+        if self._df.empty or 'id' not in self._df.columns:
+            return None
+        matches = self._df[self._df['id'] == product_id]
+        if matches.empty:
+            return None
+        row = matches.iloc[0].to_dict()
+        row.update(self._updated.get(product_id, {}))
+        return row
+    
+    def has_changes(self):
+        """
+        Returns True if there are changes waiting to be committed
+        """
+        return bool(self._inserted or self._updated or self._deleted)
+    
+    def insert(self, product):
+        """
+        Records a new product
+        
+        Parameters:
+        - product: dict with the product fields (an ID is generated if missing)
+        
+        Returns:
+        - String: ID of the new product
+        """
+        row = prepare_products(pd.DataFrame([product])).iloc[0].to_dict()
+        self._inserted[row['id']] = row
+        self._deleted.discard(row['id'])
+        return row['id']
+    
+    def update(self, product_id, values):
+        """
+        Records changed fields of an existing product
+        
+        Parameters:
+        - product_id: ID of the product to update
+        - values: dict {column: new value}, only these columns are written
+        
+        Returns:
+        - Boolean: False if the product is unknown or deleted
+        """
+        current = self._current_row(product_id)
+        if current is None or product_id in self._deleted:
+            return False
+        
+        merged = dict(current)
+        merged.update({k: v for k, v in values.items() if k in PRODUCT_COLUMNS and k != 'id'})
+        merged['id'] = product_id
+        changed = set(values) & set(PRODUCT_COLUMNS) - {'id'}
+        # Un prodotto che diventa liquido parte dal capitale investito; per quelli
+        # già liquidi il valore rivalutato cambia solo se indicato dal chiamante
+        if merged['vincolo'] == 'Liquido' and current['vincolo'] != 'Liquido' and 'capitale_finale' not in values:
+            merged['capitale_finale'] = merged['capitale_investito']
+            changed.add('capitale_finale')
+        row = prepare_products(pd.DataFrame([merged])).iloc[0].to_dict()
+        
+        if product_id in self._inserted:
+            self._inserted[product_id] = row
+            return True
+        
+        pending = self._updated.setdefault(product_id, {})
+        pending.update({col: row[col] for col in changed})
+        return True
+    
+    def delete(self, product_id):
+        """
+        Records the deletion of a product
+        
+        Parameters:
+        - product_id: ID of the product to delete
+        """
+        if self._inserted.pop(product_id, None) is None:
+            self._deleted.add(product_id)
+        self._updated.pop(product_id, None)
+    
+    def commit(self):
+        """
+        Writes the recorded delta in one transaction
+        
+        Returns:
+        - Boolean: indicating if the changes were saved
+        """
+        if not self.has_changes():
+            return True
+        
+        conn = get_db_connection()
+        if conn is None:
+            print("Impossibile connettersi al database per salvare le modifiche")
+            return False
+        
+        cursor = conn.cursor()
+        
+        try:
+            withdraw_from_summary(cursor, list(self._inserted) + list(self._updated) + list(self._deleted))
+            
+            if self._deleted:
+                cursor.execute(
+                    "DELETE FROM prodotti_finanziari WHERE id = ANY(%s);",
+                    (list(self._deleted),)
+                )
+            
+            if self._inserted:
+                upsert_products(cursor, pd.DataFrame(list(self._inserted.values())))
+            
+            # Aggiorniamo solo le colonne effettivamente modificate
+            for product_id, changes in self._updated.items():
+                if not changes:
+                    continue
+                columns = sorted(changes)
+                update_query = sql.SQL("UPDATE prodotti_finanziari SET {} WHERE id = %s;").format(
+                    sql.SQL(', ').join(
+                        sql.SQL("{} = %s").format(sql.Identifier(col)) for col in columns
+                    )
+                )
+                cursor.execute(update_query, [changes[col] for col in columns] + [product_id])
+            
+            written = list(self._inserted) + list(self._updated) + list(self._deleted)
+            bump_data_version(cursor, written)
+            conn.commit()
+            mark_products_stale(written)
+            print(f"Modifiche salvate: {len(self._inserted)} inseriti, "
+                  f"{len(self._updated)} aggiornati, {len(self._deleted)} eliminati")
+            
+            self._inserted = {}
+            self._updated = {}
+            self._deleted = set()
+            return True
+        except Exception as e:
+            print(f"Errore durante il salvataggio delle modifiche: {e}")
+            conn.rollback()
+            return False
+        finally:
+            cursor.close()
+            conn.close()
+
 def delete_product(product_id):
     """
     Deletes a product from the database
@@ -332,13 +909,18 @@ def delete_product(product_id):
     
     try:
         # Delete the product
+        withdraw_from_summary(cursor, [product_id])
         cursor.execute("DELETE FROM prodotti_finanziari WHERE id = %s;", (product_id,))
         
         # Check if a row was affected
         rows_deleted = cursor.rowcount
+        if rows_deleted > 0:
+            bump_data_version(cursor, [product_id])
         
         # Commit the changes
         conn.commit()
+        if rows_deleted > 0:
+            mark_products_stale([product_id])
         
         return rows_deleted > 0
     except Exception as e:
@@ -399,10 +981,6 @@ def duplicate_product(product_id):
         data_scadenza = product[6]
         note = product[7]
         
-        # Per prodotti liquidi, forza capitale_finale = capitale_investito
-        if vincolo == 'Liquido':
-            capitale_finale = capitale_investito
-        
         # Insert duplicate with new ID and current date
         cursor.execute("""
             INSERT INTO prodotti_finanziari (
@@ -423,9 +1001,11 @@ def duplicate_product(product_id):
             current_date,
             current_date
         ))
+        bump_data_version(cursor, [new_id])
         
         # Commit the changes
         conn.commit()
+        mark_products_stale([new_id])
         
         return True, new_id
     except Exception as e:
@@ -434,4 +1014,206 @@ def duplicate_product(product_id):
         return False, None
     finally:
         cursor.close()
-        conn.close()
\ No newline at end of file
+        conn.close()
+
+def ensure_history_partition(year):
+    """
+    Creates the yearly partition of storico_valori if it does not exist yet.
+    Future years are created on their first update, in a separate transaction
+    (and connection), so the writes never run DDL; each year is checked once
+    per process. storico_valori has no default partition: updates for a year
+    without partition are rejected, so callers must stop when this fails.
+    
+    Parameters:
+    - year: Year of the updates about to be written
+    
+    Returns:
+    - Boolean: True if the partition exists
+    """
+    with _history_years_lock:
+        if year in _history_years:
+            return True
+    
+    conn = get_db_connection()
+    if conn is None:
+        return False
+    
+    cursor = conn.cursor()
+    try:
+        partition = f"storico_valori_{year}"
+        cursor.execute("SELECT to_regclass(%s);", (partition,))
+        if cursor.fetchone()[0] is None:
+            cursor.execute(sql.SQL(
+                "CREATE TABLE IF NOT EXISTS {} PARTITION OF storico_valori FOR VALUES FROM (%s) TO (%s);"
+            ).format(sql.Identifier(partition)), (datetime.date(year, 1, 1), datetime.date(year + 1, 1, 1)))
+        conn.commit()
+        with _history_years_lock:
+            _history_years.add(year)
+        return True
+    except Exception as e:
+        print(f"Errore durante la creazione della partizione {year} dello storico: {e}")
+        conn.rollback()
+        return False
+    finally:
+        cursor.close()
+        conn.close()
+
+def update_liquid_product(product_id, new_value, notes=None, update_date=None):
+    """
+    Records a new value of a liquid product: the history row and the new
+    capitale_finale are written in a single transaction.
+    An update dated before the latest recorded one is added to the history
+    without changing the current value of the product.
+    
+    Parameters:
+    - product_id: ID of the product to update
+    - new_value: New value of the product
+    - notes: Optional notes about the update
+    - update_date: Date of the update (date or 'YYYY-MM-DD' string, default: today)
+    
+    Returns:
+    - tuple: (Boolean success, String message)
+    """
+    if not product_id:
+        return False, "Nessun prodotto selezionato."
+    
+    try:
+        new_value = round(float(new_value), 2)
+        update_date = datetime.date.today() if update_date is None else pd.Timestamp(update_date).date()
+    except (TypeError, ValueError):
+        return False, "Valore o data di aggiornamento non validi."
+    if new_value < 0:
+        return False, "Il nuovo valore non può essere negativo."
+    
+    if not ensure_history_partition(update_date.year):
+        return False, f"Impossibile preparare lo storico dei valori per l'anno {update_date.year}."
+    
+    conn = get_db_connection()
+    if conn is None:
+        return False, "Impossibile connettersi al database."
+    
+    cursor = conn.cursor()
+    
+    try:
+        # Blocca il prodotto fino al commit e ne toglie il contributo dagli aggregati
+        withdraw_from_summary(cursor, [product_id])
+        cursor.execute(
+            "SELECT vincolo, capitale_finale FROM prodotti_finanziari WHERE id = %s;",
+            (product_id,)
+        )
+        product = cursor.fetchone()
+        if product is None:
+            conn.rollback()
+            return False, "Prodotto non trovato."
+        if product[0] != 'Liquido':
+            conn.rollback()
+            return False, "Solo i prodotti liquidi possono essere aggiornati con questo metodo."
+        
+        # Ultimo aggiornamento registrato fino alla data indicata e primo successivo
+        cursor.execute("""
+            SELECT data_aggiornamento, capitale_nuovo FROM storico_valori
+            WHERE product_id = %s AND data_aggiornamento <= %s
+            ORDER BY data_aggiornamento DESC, id DESC LIMIT 1;
+        """, (product_id, update_date))
+        before = cursor.fetchone()
+        cursor.execute("""
+            SELECT capitale_precedente FROM storico_valori
+            WHERE product_id = %s AND data_aggiornamento > %s
+            ORDER BY data_aggiornamento, id LIMIT 1;
+        """, (product_id, update_date))
+        after = cursor.fetchone()
+        
+        if after is None:
+            # Aggiornamento più recente: diventa il valore attuale del prodotto
+            previous_value = product[1]
+            cursor.execute("""
+                UPDATE prodotti_finanziari
+                SET capitale_finale = %s, data_aggiornamento = GREATEST(data_aggiornamento, %s)
+                WHERE id = %s;
+            """, (new_value, update_date, product_id))
+        else:
+            # Aggiornamento retrodatato: il valore precedente è quello in vigore a quella data
+            previous_value = before[1] if before is not None else after[0]
+        
+        cursor.execute("""
+            INSERT INTO storico_valori (product_id, data_aggiornamento, capitale_precedente, capitale_nuovo, note)
+            VALUES (%s, %s, %s, %s, %s);
+        """, (product_id, update_date, previous_value, new_value, notes or None))
+        bump_data_version(cursor, [product_id])
+        conn.commit()
+        mark_products_stale([product_id])
+        
+        if after is not None:
+            return True, (f"Aggiornamento del {update_date.strftime('%d/%m/%Y')} registrato nello storico. "
+                          "Il valore attuale non cambia perché esistono aggiornamenti successivi.")
+        return True, f"Valore aggiornato a {new_value:,.2f} € con data {update_date.strftime('%d/%m/%Y')}."
+    except Exception as e:
+        print(f"Errore durante l'aggiornamento del valore del prodotto: {e}")
+        conn.rollback()
+        return False, f"Errore durante l'aggiornamento del valore: {e}"
+    finally:
+        cursor.close()
+        conn.close()
+
+def get_product_history(product_id, start_date=None, end_date=None, limit=HISTORY_PAGE_SIZE, after=None):
+    """
+    Reads the value updates of a product, most recent first, within a date
+    range and one page at a time (keyset pagination on (data_aggiornamento, id)).
+    Only the yearly partitions overlapping the range are read.
+    
+    Parameters:
+    - product_id: ID of the product
+    - start_date: First date included (None for no lower bound)
+    - end_date: Last date included (None for no upper bound)
+    - limit: Maximum number of updates returned (None for all)
+    - after: (data_aggiornamento, id) of the last update of the previous page
+    
+    Returns:
+    - DataFrame: id, data_aggiornamento, capitale_precedente, capitale_nuovo, note
+    """
+    columns = ['id', 'data_aggiornamento', 'capitale_precedente', 'capitale_nuovo', 'note']
+    conditions = [sql.SQL("product_id = %s")]
+    params = [product_id]
+    if start_date is not None:
+        conditions.append(sql.SQL("data_aggiornamento >= %s"))
+        params.append(pd.Timestamp(start_date).date())
+    if end_date is not None:
+        conditions.append(sql.SQL("data_aggiornamento <= %s"))
+        params.append(pd.Timestamp(end_date).date())
+    if after is not None:
+        conditions.append(sql.SQL("(data_aggiornamento, id) < (%s, %s)"))
+        params.extend(after)
+    
+    query = sql.SQL("""
+        SELECT {columns} FROM storico_valori
+        WHERE {where}
+        ORDER BY data_aggiornamento DESC, id DESC
+        {limit};
+    """).format(
+        columns=sql.SQL(', ').join(map(sql.Identifier, columns)),
+        where=sql.SQL(" AND ").join(conditions),
+        limit=sql.SQL("LIMIT %s") if limit is not None else sql.SQL("")
+    )
+    if limit is not None:
+        params.append(limit)
+    
+    conn = get_db_connection()
+    if conn is None:
+        return pd.DataFrame(columns=columns)
+    
+    cursor = conn.cursor()
+    try:
+        cursor.execute(query, params)
+        history = pd.DataFrame(cursor.fetchall(), columns=columns)
+    except Exception as e:
+        print(f"Errore durante la lettura dello storico dei valori: {e}")
+        conn.rollback()
+        return pd.DataFrame(columns=columns)
+    finally:
+        cursor.close()
+        conn.close()
+    
+    for column in ['capitale_precedente', 'capitale_nuovo']:
+        history[column] = history[column].astype(float)
+    history['data_aggiornamento'] = pd.to_datetime(history['data_aggiornamento'])
+    return history
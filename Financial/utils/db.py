@@ -0,0 +1,444 @@
+import threading
+import time
+import traceback
+import psycopg2
+import psycopg2.extensions
+from config import get_db_config, get_pool_config, get_connection_config
+
+# Pool di connessioni condiviso da tutto il processo.
+# Streamlit esegue ogni sessione in un thread separato, quindi tutte le
+# operazioni sul pool sono protette da un lock/condition.
+_pool = None
+_pool_lock = threading.Lock()
+
+# Parametri di connessione negoziati (description, dsn, kwargs, scadenza) e
+# stato del circuit breaker, condivisi da tutte le sessioni del processo
+_negotiated = None
+_breaker_failures = 0
+_breaker_open_until = 0.0
+_breaker_probing = False
+_connect_lock = threading.Lock()
+
+
+def _connection_candidates(db_config):
+    """
+    Builds the ordered list of connection attempts (verify-full, require, disable)
+
+    Parameters:
+    - db_config: Dictionary returned by get_db_config()
+
+    Returns:
+    - list: tuples (description, dsn, keyword arguments) in order of preference
+    """
+    # Se abbiamo un URL diretto, usalo
+    if "url" in db_config:
+        url = db_config["url"]
+        # Modifica l'URL per usare sslmode=require
+        require_url = url.replace("sslmode=verify-full", "sslmode=require")
+        if require_url == url:  # Se non c'era verify-full nell'URL
+            require_url += "&sslmode=require" if "?" in url else "?sslmode=require"
+        return [
+            ("sslmode dell'URL", url, {}),
+            ("sslmode=require", require_url, {}),
+            # Ultimo tentativo senza SSL
+            ("sslmode=disable", require_url.replace("sslmode=require", "sslmode=disable"), {})
+        ]
+
+    # Altrimenti, usa i parametri individuali
+    connect_params = {
+        "host": db_config["host"],
+        "port": db_config["port"],
+        "user": db_config["user"],
+        "password": db_config["password"],
+        "database": db_config["database"],
+        "sslmode": "require"  # Impostiamo sempre require come default
+    }
+
+    # Aggiungi parametri opzionali se presenti nel config
+    if "sslmode" in db_config:
+        connect_params["sslmode"] = db_config["sslmode"]
+    if "options" in db_config:
+        connect_params["options"] = db_config["options"]
+
+    return [
+        (f"sslmode={connect_params['sslmode']}", None, connect_params),
+        # Prova con sslmode=disable come ultima risorsa
+        ("sslmode=disable", None, dict(connect_params, sslmode="disable"))
+    ]
+
+
+def open_connection():
+    """
+    Opens a new raw connection to the PostgreSQL database.
+
+    The first working entry of the SSL ladder is remembered for negotiation_ttl
+    seconds, so later connections need a single attempt. When every attempt
+    fails a circuit breaker rejects new connections for an exponentially
+    growing delay, so callers fail fast while the database is down.
+
+    Returns:
+    - connection: psycopg2 connection object, or None if unavailable
+    """
+    global _negotiated, _breaker_failures, _breaker_open_until, _breaker_probing
+
+    settings = get_connection_config()
+    now = time.monotonic()
+
+    probing = False
+    with _connect_lock:
+        if _breaker_failures > 0:
+            # Circuito aperto, oppure un altro thread sta già verificando il database
+            if now < _breaker_open_until or _breaker_probing:
+                return None
+            _breaker_probing = probing = True
+        negotiated = _negotiated if _negotiated is not None and _negotiated[3] > now else None
+
+    try:
+        candidates = []
+        if negotiated is not None:
+            candidates.append(negotiated[:3])
+        try:
+            candidates += [c for c in _connection_candidates(get_db_config()) if c not in candidates]
+        except Exception as e:
+            print(f"Errore generale di connessione al database: {e}")
+
+        for description, dsn, kwargs in candidates:
+            try:
+                conn = psycopg2.connect(dsn, connect_timeout=settings["connect_timeout"], **kwargs)
+            except Exception as error:
+                print(f"Errore di connessione con {description}: {error}")
+                continue
+
+            with _connect_lock:
+                if negotiated is None or negotiated[0] != description:
+                    print(f"Connessione riuscita con {description}")
+                _negotiated = (description, dsn, kwargs, now + settings["negotiation_ttl"])
+                _breaker_failures = 0
+                _breaker_open_until = 0.0
+            return conn
+
+        with _connect_lock:
+            _negotiated = None
+            _breaker_failures += 1
+            delay = min(settings["breaker_base_delay"] * 2 ** (_breaker_failures - 1),
+                        settings["breaker_max_delay"])
+            _breaker_open_until = time.monotonic() + delay
+        print(f"Tutti i tentativi di connessione falliti, nuovo tentativo tra {delay:.1f}s")
+        return None
+    finally:
+        if probing:
+            with _connect_lock:
+                _breaker_probing = False
+
+
+def get_connection_status():
+    """
+    Returns the negotiated connection mode and the circuit breaker state
+
+    Returns:
+    - dict: negotiated mode (or None), consecutive failures, seconds until retry
+    """
+    with _connect_lock:
+        return {
+            'negotiated_mode': _negotiated[0] if _negotiated is not None else None,
+            'failures': _breaker_failures,
+            'retry_in': max(_breaker_open_until - time.monotonic(), 0.0)
+        }
+
+
+class PooledConnection:
+    """
+    Wrapper around a pooled psycopg2 connection.
+
+    Behaves like the underlying connection, but close() gives the connection
+    back to the pool instead of closing the socket. A wrapper that is garbage
+    collected without being closed is reported as a leak and reclaimed.
+    Used as a context manager it yields itself, commits (or rolls back on
+    error) at the end of the block and gives the connection back to the pool.
+    """
+
+    def __init__(self, pool, raw):
+        self._pool = pool
+        self._raw = raw
+
+    def close(self):
+        if self._raw is not None:
+            raw, self._raw = self._raw, None
+            self._pool.release(raw)
+
+    @property
+    def closed(self):
+        return 1 if self._raw is None else self._raw.closed
+
+    def __getattr__(self, name):
+        if name == "_raw" or self.__dict__.get("_raw") is None:
+            raise psycopg2.InterfaceError("connection already returned to the pool")
+        return getattr(self._raw, name)
+
+    def __enter__(self):
+        # Restituisce il wrapper, non la connessione grezza: l'uscita dal blocco
+        # passa sempre da close() e dal tracciamento delle connessioni non chiuse
+        self._raw.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        # Come psycopg2: commit se il blocco termina senza errori, altrimenti rollback;
+        # poi la connessione torna al pool
+        try:
+            return self._raw.__exit__(exc_type, exc_value, tb)
+        finally:
+            self.close()
+
+    def __del__(self):
+        if self.__dict__.get("_raw") is not None:
+            raw, self._raw = self._raw, None
+            self._pool.release(raw, leaked=True)
+
+
+class ConnectionPool:
+    """
+    Thread-safe, bounded pool of PostgreSQL connections.
+
+    Parameters:
+    - min_size: Number of idle connections kept open when the pool is quiet
+    - max_size: Maximum number of connections open at the same time
+    - checkout_timeout: Seconds to wait for a free connection before giving up
+    - idle_timeout: Seconds after which idle connections above min_size are closed
+    - health_check_interval: Idle seconds after which a connection is pinged before reuse
+    - leak_timeout: Seconds after which a checked-out connection is reported as leaked
+    - connect: Function opening a new raw connection (returns None on failure)
+    """
+
+    def __init__(self, min_size=1, max_size=10, checkout_timeout=10.0, idle_timeout=300.0,
+                 health_check_interval=30.0, leak_timeout=300.0, connect=open_connection):
+        self.min_size = min_size
+        self.max_size = max(max_size, 1)
+        self.checkout_timeout = checkout_timeout
+        self.idle_timeout = idle_timeout
+        self.health_check_interval = health_check_interval
+        self.leak_timeout = leak_timeout
+        self._connect = connect
+
+        # RLock: il recupero di connessioni non chiuse (__del__) può avvenire durante il GC
+        # mentre lo stesso thread detiene già il lock
+        self._cond = threading.Condition(threading.RLock())
+        self._idle = []       # (raw, last_used) - usata come stack LIFO
+        self._in_use = {}     # id(raw) -> (raw, checkout_time, stack)
+        self._pending = 0     # slot riservati per connessioni in fase di verifica o apertura
+        self._waiting = 0
+
+        # Statistiche
+        self._checkouts = 0
+        self._timeouts = 0
+        self._leaks = 0
+        self._discarded = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+
+    def _size(self):
+        return len(self._idle) + len(self._in_use) + self._pending
+
+    def _is_healthy(self, raw, last_used):
+        if raw.closed:
+            return False
+        if time.monotonic() - last_used < self.health_check_interval:
+            return True
+        try:
+            cursor = raw.cursor()
+            cursor.execute("SELECT 1")
+            cursor.close()
+            raw.rollback()
+            return True
+        except Exception:
+            return False
+
+    def _close_quietly(self, raw):
+        try:
+            raw.close()
+        except Exception:
+            pass
+
+    def _reap_idle(self):
+        """Removes idle connections above min_size that have expired and returns them (lock must be held)"""
+        now = time.monotonic()
+        expired = []
+        while len(self._idle) + len(self._in_use) > self.min_size and self._idle:
+            raw, last_used = self._idle[0]
+            if now - last_used < self.idle_timeout:
+                break
+            self._idle.pop(0)
+            expired.append(raw)
+        return expired
+
+    def _report_leaks(self):
+        """Logs connections held longer than leak_timeout (lock must be held)"""
+        now = time.monotonic()
+        for key, (raw, checkout_time, stack) in list(self._in_use.items()):
+            if now - checkout_time > self.leak_timeout:
+                self._leaks += 1
+                print(f"Possibile connessione non rilasciata da {now - checkout_time:.0f}s, ottenuta in:\n{stack}")
+                # Segnaliamo ogni connessione una sola volta
+                self._in_use[key] = (raw, float("inf"), stack)
+
+    def getconn(self):
+        """
+        Checks a connection out of the pool
+
+        Returns:
+        - PooledConnection: wrapper whose close() returns the connection, or None
+        """
+        start = time.monotonic()
+        deadline = start + self.checkout_timeout
+        expired = []
+        raw = None
+
+        with self._cond:
+            expired = self._reap_idle()
+            self._report_leaks()
+            self._waiting += 1
+            try:
+                while True:
+                    if self._idle:
+                        raw, last_used = self._idle.pop()
+                        self._pending += 1
+                        break
+                    if self._size() < self.max_size:
+                        self._pending += 1
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._timeouts += 1
+                        print(f"Nessuna connessione disponibile nel pool dopo {self.checkout_timeout}s")
+                        return None
+                    self._cond.wait(remaining)
+            finally:
+                self._waiting -= 1
+
+        for old in expired:
+            self._close_quietly(old)
+
+        # Verifica la connessione riutilizzata, altrimenti ne apre una nuova
+        discarded = False
+        if raw is not None and not self._is_healthy(raw, last_used):
+            self._close_quietly(raw)
+            raw = None
+            discarded = True
+        if raw is None:
+            raw = self._connect()
+
+        stack = "".join(traceback.format_stack(limit=8)[:-1])
+        with self._cond:
+            # Lo slot resta riservato fino a qui, così il pool non supera mai max_size
+            self._pending -= 1
+            if discarded:
+                self._discarded += 1
+            if raw is None:
+                self._cond.notify()
+                return None
+            self._in_use[id(raw)] = (raw, time.monotonic(), stack)
+            waited = time.monotonic() - start
+            self._checkouts += 1
+            self._total_wait += waited
+            self._max_wait = max(self._max_wait, waited)
+
+        return PooledConnection(self, raw)
+
+    def release(self, raw, leaked=False):
+        """
+        Returns a raw connection to the pool
+
+        Parameters:
+        - raw: psycopg2 connection previously checked out
+        - leaked: True if the connection was reclaimed from an unclosed wrapper
+        """
+        reusable = not raw.closed
+        if reusable:
+            try:
+                # Annulla eventuali transazioni lasciate aperte dal chiamante
+                if raw.info.transaction_status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                    raw.rollback()
+                if raw.autocommit:
+                    raw.autocommit = False
+            except Exception:
+                reusable = False
+
+        with self._cond:
+            entry = self._in_use.pop(id(raw), None)
+            if entry is None:
+                return
+            if leaked:
+                self._leaks += 1
+                print(f"Connessione non chiusa recuperata dal pool, ottenuta in:\n{entry[2]}")
+            if reusable:
+                self._idle.append((raw, time.monotonic()))
+            else:
+                self._discarded += 1
+            self._cond.notify()
+
+        if not reusable:
+            self._close_quietly(raw)
+
+    def closeall(self):
+        """Closes every idle connection and forgets those in use"""
+        with self._cond:
+            idle, self._idle = self._idle, []
+            in_use, self._in_use = self._in_use, {}
+            self._cond.notify_all()
+        for raw, _ in idle:
+            self._close_quietly(raw)
+        for raw, _, _ in in_use.values():
+            self._close_quietly(raw)
+
+    def stats(self):
+        """
+        Returns a snapshot of the pool usage
+
+        Returns:
+        - dict: sizes, waiting sessions and checkout latency in milliseconds
+        """
+        with self._cond:
+            checkouts = self._checkouts
+            return {
+                'min_size': self.min_size,
+                'max_size': self.max_size,
+                'in_use': len(self._in_use),
+                'idle': len(self._idle),
+                'pending': self._pending,
+                'waiting': self._waiting,
+                'checkouts': checkouts,
+                'timeouts': self._timeouts,
+                'leaks': self._leaks,
+                'discarded': self._discarded,
+                'avg_checkout_ms': (self._total_wait / checkouts * 1000) if checkouts else 0.0,
+                'max_checkout_ms': self._max_wait * 1000
+            }
+
+
+def get_pool():
+    """
+    Returns the process-wide connection pool, creating it on first use
+    """
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(**get_pool_config())
+    return _pool
+
+
+def get_db_connection():
+    """
+    Checks out a connection from the shared pool.
+    Calling close() on the returned connection gives it back to the pool.
+
+    Returns:
+    - connection: pooled psycopg2 connection, or None if unavailable
+    """
+    return get_pool().getconn()
+
+
+def get_pool_stats():
+    """
+    Returns the statistics of the shared connection pool
+    """
+    return get_pool().stats()
@@ -2,12 +2,61 @@ import pandas as pd
 import numpy as np
 import datetime
 
+def normalize_portfolio(df):
+    """
+    Converts a products DataFrame once into the types used by the calculations:
+    float64 amounts, datetime64 data_scadenza (NaT when missing) and categorical
+    vincolo. The functions in this module read normalized frames without
+    conversions or copies and never modify them.
+    
+    Parameters:
+    - df: DataFrame containing financial products data (converted in place)
+    
+    Returns:
+    - DataFrame: the same frame, marked with df.attrs['normalized']
+    """
+    for column in ['capitale_investito', 'capitale_finale']:
+        if column in df.columns and df[column].dtype != np.float64:
+            df[column] = pd.to_numeric(df[column], errors='coerce').astype(np.float64)
+    
+    if 'data_scadenza' in df.columns and not pd.api.types.is_datetime64_dtype(df['data_scadenza']):
+        df['data_scadenza'] = pd.to_datetime(df['data_scadenza'], errors='coerce')
+    
+    if 'vincolo' in df.columns and not isinstance(df['vincolo'].dtype, pd.CategoricalDtype):
+        df['vincolo'] = df['vincolo'].astype('category')
+    
+    df.attrs['normalized'] = True
+    return df
+
+def _amounts(df, column):
+    # Vista sui dati per i frame normalizzati, conversione solo per quelli grezzi
+    if column not in df.columns:
+        return np.zeros(len(df))
+    values = df[column].to_numpy()
+    if values.dtype != np.float64:
+        values = pd.to_numeric(df[column], errors='coerce').to_numpy(dtype=np.float64)
+    return np.nan_to_num(values, nan=0.0) if np.isnan(values).any() else values
+
+def _maturities(df):
+    if 'data_scadenza' not in df.columns:
+        return np.full(len(df), np.datetime64('NaT'), dtype='datetime64[ns]')
+    if pd.api.types.is_datetime64_dtype(df['data_scadenza']):
+        return df['data_scadenza'].to_numpy()
+    return pd.to_datetime(df['data_scadenza'], errors='coerce').to_numpy(dtype='datetime64[ns]')
+
+def _vincolo_is(df, value):
+    # Il confronto sulle colonne categoriche usa i codici, senza materializzare stringhe
+    if 'vincolo' not in df.columns:
+        # Senza colonna vincolo i prodotti sono considerati 'Liquidità'
+        return np.full(len(df), value == 'Liquidità')
+    return (df['vincolo'] == value).to_numpy()
+
 def calculate_total_values(df):
     """
     Calculates the total invested capital and current value
     
     Parameters:
-    - df: DataFrame containing financial products data
+    - df: DataFrame containing financial products data (not modified)
     
     Returns:
     - dict: containing total invested capital and current value
@@ -19,16 +68,9 @@ def calculate_total_values(df):
             'total_current': 0
         }
     
-    # Convert numeric columns to float for calculations
-    df['capitale_investito'] = df['capitale_investito'].astype(float)
-    df['capitale_finale'] = df['capitale_finale'].astype(float)
-    
-    total_invested = df['capitale_investito'].sum()
-    total_current = df['capitale_finale'].sum()
-    
     return {
-        'total_invested': total_invested,
-        'total_current': total_current
+        'total_invested': float(_amounts(df, 'capitale_investito').sum()),
+        'total_current': float(_amounts(df, 'capitale_finale').sum())
     }
 
 def calculate_current_values(df):
@@ -36,59 +78,66 @@ def calculate_current_values(df):
     Calculates current values by separating liquid and bound products
     
     Parameters:
-    - df: DataFrame containing financial products data
+    - df: DataFrame containing financial products data (not modified)
     
     Returns:
     - dict: containing liquid_value, bound_value, and total_value
     """
-    # Default values
-    liquid_value = 0
-    bound_value = 0
-    total_value = 0
-    
     # If DataFrame is empty, return default values
     if df.empty:
         return {
-            'liquid_value': liquid_value,
-            'bound_value': bound_value,
-            'total_value': total_value
+            'liquid_value': 0,
+            'bound_value': 0,
+            'total_value': 0
         }
     
-    # Ensure required columns exist
-    required_columns = ['capitale_investito', 'capitale_finale', 'vincolo', 'data_scadenza']
-    for col in required_columns:
-        if col not in df.columns:
-            df[col] = None if col == 'data_scadenza' else 'Liquidità' if col == 'vincolo' else 0.0
-    
-    # Convert numeric columns to float
-    df['capitale_investito'] = df['capitale_investito'].astype(float)
-    df['capitale_finale'] = df['capitale_finale'].astype(float)
-    
-    # Convert dates to datetime for comparison
-    df['data_scadenza'] = pd.to_datetime(df['data_scadenza'], errors='coerce')
-    today = pd.Timestamp.now().floor('D')
-    
-    # Separate liquid and bound products
-    liquid_products = df[(df['vincolo'] == 'Liquido') | 
-                         (pd.isna(df['data_scadenza'])) | 
-                         (df['data_scadenza'] <= today)]
-    
-    bound_products = df[(df['vincolo'] == 'Vincolato') & 
-                        (~pd.isna(df['data_scadenza'])) & 
-                        (df['data_scadenza'] > today)]
-    
-    # Calculate values - for liquid products use capitale_finale
-    liquid_value = liquid_products['capitale_finale'].sum()
+    # I valori attuali sono quelli alla data di oggi (a mezzanotte):
+    # liquidi al capitale finale, vincolati non scaduti al capitale investito
+    return calculate_future_values(df, pd.Timestamp.now().floor('D'))
+
+def calculate_portfolio_totals(df, as_of=None):
+    """
+    Calculates the figures of the dashboard header and pie charts: the values
+    at a date (as calculate_future_values) and the amounts per tipologia and
+    per vincolo. utils.data_manager.get_portfolio_totals returns the same
+    result computed by the database.
     
-    # Per i prodotti vincolati, usa il capitale_investito (non il capitale a scadenza)
-    bound_value = bound_products['capitale_investito'].sum()
+    Parameters:
+    - df: DataFrame containing financial products data (not modified)
+    - as_of: Date of the values (default: today)
     
-    total_value = liquid_value + bound_value
+    Returns:
+    - dict: count, total_invested, total_current, liquid_value, bound_value,
+      total_value, and the DataFrames by_tipologia and by_vincolo with the
+      columns (group, capitale_investito, capitale_finale) sorted by group
+    """
+    as_of = pd.Timestamp.now().floor('D') if as_of is None else pd.Timestamp(as_of)
+    values = calculate_future_values(df, as_of)
+    totals = calculate_total_values(df)
+    
+    groups = {}
+    for column in ['tipologia', 'vincolo']:
+        if df.empty or column not in df.columns:
+            groups[column] = pd.DataFrame(columns=[column, 'capitale_investito', 'capitale_finale'])
+            continue
+        amounts = pd.DataFrame({
+            column: df[column].to_numpy(),
+            'capitale_investito': _amounts(df, 'capitale_investito'),
+            'capitale_finale': _amounts(df, 'capitale_finale')
+        })
+        groups[column] = amounts.groupby(column).sum().round(2).reset_index()
     
+    # Gli importi sono registrati al centesimo: arrotondando le somme si elimina
+    # l'errore dei float e si ottengono le somme esatte calcolate dal database
     return {
-        'liquid_value': liquid_value,
-        'bound_value': bound_value,
-        'total_value': total_value
+        'count': len(df),
+        'total_invested': round(totals['total_invested'], 2),
+        'total_current': round(totals['total_current'], 2),
+        'liquid_value': round(values['liquid_value'], 2),
+        'bound_value': round(values['bound_value'], 2),
+        'total_value': round(values['total_value'], 2),
+        'by_tipologia': groups['tipologia'],
+        'by_vincolo': groups['vincolo']
     }
 
 def calculate_future_values(df, future_date):
@@ -102,64 +151,127 @@ def calculate_future_values(df, future_date):
     Returns:
     - dict: containing liquid_value, bound_value, and total_value
     """
-    # Default values
-    liquid_value = 0
-    bound_value = 0
-    total_value = 0
-    
     # If DataFrame is empty, return default values
     if df.empty:
         return {
-            'liquid_value': liquid_value,
-            'bound_value': bound_value,
-            'total_value': total_value
+            'liquid_value': 0,
+            'bound_value': 0,
+            'total_value': 0
         }
     
-    # Ensure required columns exist
-    required_columns = ['capitale_investito', 'capitale_finale', 'vincolo', 'data_scadenza']
-    for col in required_columns:
-        if col not in df.columns:
-            df[col] = None if col == 'data_scadenza' else 'Liquidità' if col == 'vincolo' else 0.0
+    values = calculate_values_at_dates(df, [future_date])
+    
+    return {
+        'liquid_value': float(values['liquid_value'][0]),
+        'bound_value': float(values['bound_value'][0]),
+        'total_value': float(values['total_value'][0])
+    }
+
+def calculate_values_at_dates(df, dates):
+    """
+    Calculates liquid, bound and total values of a portfolio at many dates in one pass.
+    At each date, products that have matured (or are liquid) count at capitale_finale,
+    'Vincolato' products not yet matured count at capitale_investito.
+    
+    Parameters:
+    - df: DataFrame containing financial products data (not modified)
+    - dates: array-like of dates
+    
+    Returns:
+    - dict: arrays liquid_value, bound_value and total_value, aligned with dates
+    """
+    liquid_value, bound_value, total_value = _values_at(_maturity_schedule(df), dates)
+    return {
+        'liquid_value': liquid_value,
+        'bound_value': bound_value,
+        'total_value': total_value
+    }
+
+def calculate_portfolios_at_dates(portfolios, dates):
+    """
+    Calculates the values of several portfolios at the same dates
     
-    # Convert numeric columns to float
-    df['capitale_investito'] = df['capitale_investito'].astype(float)
-    df['capitale_finale'] = df['capitale_finale'].astype(float)
+    Parameters:
+    - portfolios: list of DataFrames containing financial products data
+    - dates: array-like of dates
     
-    # Convert dates to datetime for comparison
-    df['data_scadenza'] = pd.to_datetime(df['data_scadenza'], errors='coerce')
-    future_ts = pd.Timestamp(future_date)
+    Returns:
+    - dict: 2D arrays liquid_value, bound_value and total_value
+      with shape (number of portfolios, number of dates)
+    """
+    dates = pd.to_datetime(pd.Series(dates)).to_numpy(dtype='datetime64[ns]')
+    liquid_value = np.zeros((len(portfolios), len(dates)))
+    bound_value = np.zeros((len(portfolios), len(dates)))
     
-    # Create a copy of dataframe for calculations
-    future_df = df.copy()
+    for i, df in enumerate(portfolios):
+        liquid_value[i], bound_value[i], _ = _values_at(_maturity_schedule(df), dates)
     
-    # At the future date:
-    # 1. Products that mature before that date become liquid
-    # 2. For bound products that haven't matured yet, use capitale_investito not capitale_finale
+    return {
+        'liquid_value': liquid_value,
+        'bound_value': bound_value,
+        'total_value': liquid_value + bound_value
+    }
+
+def _maturity_schedule(df):
+    """
+    Precomputes what is needed to value a portfolio at any date.
     
-    # Prodotti già liquidi o che saranno liquidi alla data futura
-    liquid_products = future_df[(future_df['vincolo'] == 'Liquido') | 
-                               (pd.isna(future_df['data_scadenza'])) | 
-                               (future_df['data_scadenza'] <= future_ts)]
+    Products that are liquid at every date (vincolo 'Liquido' or no maturity)
+    are summed once; the others are sorted by maturity with prefix sums of
+    capitale_finale (liquid once matured) and of capitale_investito of the
+    'Vincolato' ones (bound until maturity), so any date is answered with a
+    binary search.
     
-    # Prodotti che rimarranno vincolati alla data futura
-    bound_products = future_df[(future_df['vincolo'] == 'Vincolato') & 
-                              (~pd.isna(future_df['data_scadenza'])) & 
-                              (future_df['data_scadenza'] > future_ts)]
+    Parameters:
+    - df: DataFrame containing financial products data (not modified)
     
-    # Calcola il valore liquido (capitale finale per prodotti maturati)
-    liquid_value = liquid_products['capitale_finale'].sum()
+    Returns:
+    - dict: total_invested, liquid_base, maturities, cum_finale, cum_bound
+    """
+    capitale_investito = _amounts(df, 'capitale_investito')
+    capitale_finale = _amounts(df, 'capitale_finale')
+    scadenze = _maturities(df)
+    is_vincolato = _vincolo_is(df, 'Vincolato')
     
-    # Calcola il valore vincolato (capitale INVESTITO per prodotti non ancora maturati)
-    bound_value = bound_products['capitale_investito'].sum()
+    # Prodotti liquidi a qualsiasi data
+    always_liquid = _vincolo_is(df, 'Liquido') | np.isnat(scadenze)
     
-    total_value = liquid_value + bound_value
+    # Prodotti con scadenza, ordinati per data
+    dated = ~always_liquid
+    order = np.argsort(scadenze[dated], kind='stable')
+    maturities = scadenze[dated][order]
+    dated_finale = capitale_finale[dated][order]
+    dated_bound = np.where(is_vincolato[dated][order], capitale_investito[dated][order], 0.0)
     
     return {
-        'liquid_value': liquid_value,
-        'bound_value': bound_value,
-        'total_value': total_value
+        'total_invested': capitale_investito.sum(),
+        'liquid_base': capitale_finale[always_liquid].sum(),
+        'maturities': maturities,
+        'cum_finale': np.concatenate(([0.0], np.cumsum(dated_finale))),
+        'cum_bound': np.concatenate(([0.0], np.cumsum(dated_bound)))
     }
 
+def _values_at(schedule, dates):
+    """
+    Values a precomputed schedule at many dates at once
+    
+    Parameters:
+    - schedule: dict returned by _maturity_schedule
+    - dates: array-like of dates
+    
+    Returns:
+    - tuple: arrays (liquid_value, bound_value, total_value)
+    """
+    dates = pd.to_datetime(pd.Series(dates)).to_numpy(dtype='datetime64[ns]')
+    # Numero di prodotti già scaduti a ciascuna data
+    matured = np.searchsorted(schedule['maturities'], dates, side='right')
+    
+    # I prodotti scaduti diventano liquidi al capitale finale;
+    # i vincolati non ancora scaduti valgono il capitale investito
+    liquid_value = schedule['liquid_base'] + schedule['cum_finale'][matured]
+    bound_value = schedule['cum_bound'][-1] - schedule['cum_bound'][matured]
+    return liquid_value, bound_value, liquid_value + bound_value
+
 def project_values_over_time(df, months_horizon):
     """
     Projects the values of financial products over time, properly handling
@@ -176,119 +288,49 @@ def project_values_over_time(df, months_horizon):
         # Return empty dataframe with expected columns
         return pd.DataFrame(columns=['date', 'invested_capital', 'liquid_value', 'bound_value', 'total_value'])
     
-    # Se l'orizzonte è 0, restituiamo solo la data attuale
-    if months_horizon == 0:
-        start_date = pd.Timestamp.now()
-        # Calculate start values
-        total_values = calculate_total_values(df)
-        initial_invested = total_values['total_invested']
-        
-        # Calcola valori attuali
-        current_values = calculate_current_values(df)
-        
-        return pd.DataFrame([{
-            'date': start_date,
-            'invested_capital': initial_invested,
-            'liquid_value': current_values['liquid_value'],
-            'bound_value': current_values['bound_value'],
-            'total_value': current_values['total_value']
-        }])
-    
-    # Calculate start values
-    total_values = calculate_total_values(df)
-    initial_invested = total_values['total_invested']
-    
-    # Create date range for projection
+    # Le scadenze vengono ordinate una sola volta; ogni data si valuta con una ricerca binaria
+    schedule = _maturity_schedule(df)
     start_date = pd.Timestamp.now()
     
+    # Se l'orizzonte è 0, restituiamo solo la data attuale (valori ad oggi)
+    if months_horizon == 0:
+        liquid_value, bound_value, total_value = _values_at(schedule, [start_date.floor('D')])
+        return pd.DataFrame({
+            'date': [start_date],
+            'invested_capital': [schedule['total_invested']],
+            'liquid_value': liquid_value,
+            'bound_value': bound_value,
+            'total_value': total_value
+        })
+    
     # Per orizzonte temporale molto lungo (>10 anni), aumentiamo l'intervallo di campionamento
     # in modo da non avere troppe date e rendere il grafico troppo pesante
     if months_horizon > 120:  # Più di 10 anni
         # Per periodi lunghi, campiona ogni 3 mesi fino a 10 anni, poi ogni 6 mesi
-        sampling_dates1 = [start_date + pd.DateOffset(months=m) for m in range(0, min(121, months_horizon + 1), 3)]
-        sampling_dates2 = [start_date + pd.DateOffset(months=m) for m in range(120, months_horizon + 1, 6)]
-        primary_dates = sampling_dates1 + [d for d in sampling_dates2 if d > sampling_dates1[-1]]
+        sampling_months = list(range(0, min(121, months_horizon + 1), 3)) + list(range(126, months_horizon + 1, 6))
     else:
         # Per periodi più brevi, campiona mensilmente
-        primary_dates = [start_date + pd.DateOffset(months=m) for m in range(months_horizon + 1)]
-    
-    # Aggiungiamo le date di scadenza come punti chiave per la proiezione
-    # per mostrare chiaramente i cambiamenti quando i vincolati diventano liquidi
-    extra_dates = []
-    
-    if 'data_scadenza' in df.columns:
-        # Prendi tutte le date di scadenza future
-        expiry_dates = df[~pd.isna(df['data_scadenza'])]
-        if not expiry_dates.empty:
-            expiry_dates['data_scadenza'] = pd.to_datetime(expiry_dates['data_scadenza'], errors='coerce')
-            
-            # Filtriamo le date non-null e future nel range di tempo considerato
-            future_expiry = expiry_dates[
-                (expiry_dates['data_scadenza'] > start_date) & 
-                (expiry_dates['data_scadenza'] <= start_date + pd.DateOffset(months=months_horizon))
-            ]
-            
-            if not future_expiry.empty:
-                # Per ogni data di scadenza, aggiungiamo un punto appena prima e uno appena dopo
-                for exp_date in future_expiry['data_scadenza'].unique():
-                    # Un giorno prima della scadenza
-                    extra_dates.append(exp_date - pd.Timedelta(days=1))
-                    # Giorno esatto della scadenza
-                    extra_dates.append(exp_date)
-                    # Un giorno dopo la scadenza
-                    extra_dates.append(exp_date + pd.Timedelta(days=1))
-    
-    # Combiniamo le date primarie con quelle delle scadenze
-    all_dates = sorted(list(set(primary_dates + extra_dates)))
-    
-    # Ensure we have all necessary columns
-    required_columns = ['capitale_investito', 'capitale_finale', 'vincolo', 'data_scadenza']
-    for col in required_columns:
-        if col not in df.columns:
-            if col == 'data_scadenza':
-                df[col] = None
-            elif col == 'vincolo':
-                df[col] = 'Liquidità'
-            else:
-                df[col] = 0.0
-    
-    # Create a deep copy to avoid modifying the original dataframe
-    projection_df = df.copy()
-    
-    # Convert dates to datetime for comparison
-    projection_df['data_scadenza'] = pd.to_datetime(projection_df['data_scadenza'], errors='coerce')
-    
-    # Make sure numeric columns are float
-    projection_df['capitale_investito'] = projection_df['capitale_investito'].astype(float)
-    projection_df['capitale_finale'] = projection_df['capitale_finale'].astype(float)
-    
-    # Create projection dataframe
-    projection_data = []
-    
-    for date in all_dates:
-        # For each future date, calculate the actual value by considering
-        # which products have matured by that date
-        
-        # Invested capital stays constant
-        invested_capital = initial_invested
-        
-        # Calculate value at this date by determining which products have matured
-        future_values = calculate_future_values(projection_df, date)
-        liquid_value = future_values['liquid_value']
-        bound_value = future_values['bound_value']
-        total_value = future_values['total_value']
-        
-        # Add a row for this date
-        projection_data.append({
-            'date': date,
-            'invested_capital': invested_capital,
-            'liquid_value': liquid_value,
-            'bound_value': bound_value,
-            'total_value': total_value
-        })
-    
-    # Sort by date to ensure proper order
-    result_df = pd.DataFrame(projection_data)
-    result_df = result_df.sort_values('date').reset_index(drop=True)
-    
-    return result_df
\ No newline at end of file
+        sampling_months = list(range(months_horizon + 1))
+    primary_dates = pd.DatetimeIndex([start_date + pd.DateOffset(months=m) for m in sampling_months])
+    
+    # Aggiungiamo le date di scadenza come punti chiave per la proiezione: un giorno prima,
+    # il giorno esatto e un giorno dopo, per mostrare quando i vincolati diventano liquidi
+    extra_dates = pd.DatetimeIndex([])
+    expiry = _maturities(df)
+    expiry = expiry[(expiry > start_date) & (expiry <= start_date + pd.DateOffset(months=months_horizon))]
+    if len(expiry) > 0:
+        expiry = pd.DatetimeIndex(np.unique(expiry))
+        extra_dates = expiry.append([expiry - pd.Timedelta(days=1), expiry + pd.Timedelta(days=1)])
+    
+    # Combiniamo le date primarie con quelle delle scadenze (ordinate, senza duplicati)
+    all_dates = primary_dates.append(extra_dates).unique().sort_values()
+    
+    liquid_value, bound_value, total_value = _values_at(schedule, all_dates)
+    
+    return pd.DataFrame({
+        'date': all_dates,
+        'invested_capital': np.full(len(all_dates), schedule['total_invested']),
+        'liquid_value': liquid_value,
+        'bound_value': bound_value,
+        'total_value': total_value
+    })
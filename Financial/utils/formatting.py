@@ -0,0 +1,94 @@
+import pandas as pd
+import numpy as np
+
+# Formattazione in stile italiano: punto per le migliaia, virgola per i decimali.
+# Le funzioni accettano sia un singolo valore sia una Series intera: le Series
+# vengono formattate con operazioni vettoriali, senza apply per cella.
+
+_THOUSANDS = r'\B(?=(\d{3})+(?!\d))'
+
+def _format_series(values, decimals, suffix, na_rep):
+    numbers = pd.to_numeric(values, errors='coerce')
+    raw = numbers.to_numpy(dtype=float)
+    missing = np.isnan(raw)
+
+    # Arrotondiamo una sola volta ai centesimi (o alla precisione richiesta)
+    scale = 10 ** decimals
+    scaled = np.round(np.abs(np.where(missing, 0.0, raw)) * scale).astype(np.int64)
+    integer_part = pd.Series(scaled // scale, index=values.index).astype(str)
+    integer_part = integer_part.str.replace(_THOUSANDS, '.', regex=True)
+
+    text = integer_part
+    if decimals > 0:
+        fraction = pd.Series(scaled % scale, index=values.index).astype(str).str.zfill(decimals)
+        text = text + ',' + fraction
+
+    # Il segno solo per valori che non si arrotondano a zero
+    negative = (raw < 0) & (scaled > 0)
+    text = text.where(~negative, '-' + text) + suffix
+    return text.where(~missing, na_rep)
+
+def format_number(value, decimals=2, na_rep='-'):
+    """
+    Formats numbers with Italian separators (e.g. 1.234,56)
+
+    Parameters:
+    - value: Number or Series of numbers
+    - decimals: Number of decimal digits
+    - na_rep: Text used for missing values
+
+    Returns:
+    - String, or Series of strings with the same index
+    """
+    if isinstance(value, pd.Series):
+        return _format_series(value, decimals, '', na_rep)
+    return _format_series(pd.Series([value]), decimals, '', na_rep).iloc[0]
+
+def format_currency(value, decimals=2, na_rep='-'):
+    """
+    Formats amounts in euro with Italian separators (e.g. 1.234,56 €)
+
+    Parameters:
+    - value: Number or Series of numbers
+    - decimals: Number of decimal digits
+    - na_rep: Text used for missing values
+
+    Returns:
+    - String, or Series of strings with the same index
+    """
+    if isinstance(value, pd.Series):
+        return _format_series(value, decimals, ' €', na_rep)
+    return _format_series(pd.Series([value]), decimals, ' €', na_rep).iloc[0]
+
+def format_percentage(value, decimals=2, na_rep='-'):
+    """
+    Formats percentages already expressed in hundredths (e.g. 12.5 -> 12,50%)
+
+    Parameters:
+    - value: Number or Series of numbers
+    - decimals: Number of decimal digits
+    - na_rep: Text used for missing values
+
+    Returns:
+    - String, or Series of strings with the same index
+    """
+    if isinstance(value, pd.Series):
+        return _format_series(value, decimals, '%', na_rep)
+    return _format_series(pd.Series([value]), decimals, '%', na_rep).iloc[0]
+
+def format_date(value, na_rep='-'):
+    """
+    Formats dates as dd/mm/yyyy
+
+    Parameters:
+    - value: Date or Series of dates (datetime64, date objects or strings)
+    - na_rep: Text used for missing or invalid dates
+
+    Returns:
+    - String, or Series of strings with the same index
+    """
+    if isinstance(value, pd.Series):
+        dates = value if pd.api.types.is_datetime64_dtype(value) else pd.to_datetime(value, errors='coerce')
+        return dates.dt.strftime('%d/%m/%Y').fillna(na_rep)
+    date = pd.to_datetime(value, errors='coerce')
+    return na_rep if pd.isna(date) else date.strftime('%d/%m/%Y')
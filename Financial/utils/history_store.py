@@ -0,0 +1,290 @@
+import os
+import glob
+import json
+import datetime
+import threading
+from contextlib import contextmanager
+from urllib.parse import quote
+import numpy as np
+import pandas as pd
+from config import get_history_store_config
+from utils.cache import LRUCache
+from utils.db import get_db_connection
+from utils.data_manager import get_data_version, read_data_version
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: gli aggiornamenti sono serializzati solo all'interno del processo
+    fcntl = None
+
+# Righe dello storico lette dal database per blocco durante un aggiornamento
+FETCH_SIZE = 50000
+
+# Righe dei file: giorni dal 1970-01-01, bit dei valori float64, ID dello storico
+DATES, VALUES, IDS = 0, 1, 2
+
+# Righe registrate dopo l'ultimo aggiornamento, raggruppate per prodotto, già
+# nel formato dei file (giorni e float): il client non converte date e DECIMAL
+FETCH_QUERY = """
+    SELECT product_id,
+           data_aggiornamento - DATE '1970-01-01' AS giorno,
+           CAST(capitale_nuovo AS DOUBLE PRECISION) AS valore,
+           id
+    FROM storico_valori
+    WHERE registrato_il > %s
+    ORDER BY product_id;
+"""
+
+# Nessun aggiornamento precedente: tutto lo storico
+EPOCH = datetime.datetime(1970, 1, 1)
+
+class HistoryStore:
+    """
+    Columnar copy of the value histories (storico_valori) on local disk, read
+    through memory maps: the charts and the analytics neither query the
+    database nor copy the series.
+
+    Every product has one .npy file with an int64 array of shape (3, n): the
+    dates (days since 1970-01-01), the values (float64 bits) and the IDs of the
+    history rows, sorted by date and ID. Files are never modified in place: a
+    refresh writes a new file and renames it over the old one, so readers in
+    other sessions or processes keep a consistent mapping of the version they
+    opened and see the new one at their next read.
+
+    Parameters:
+    - path: Directory of the files
+    - refresh_margin_seconds: Overlap of the incremental reads, in seconds
+    - max_open_series: Maximum number of series kept mapped by the process
+    """
+
+    def __init__(self, path, refresh_margin_seconds, max_open_series):
+        self.path = path
+        self.margin = datetime.timedelta(seconds=refresh_margin_seconds)
+        self._maps = LRUCache(max_open_series, float('inf'))  # prodotto -> ((inode, mtime), array)
+        self._lock = threading.Lock()
+        self._version = None  # versione dei dati già riflessa nei file, per questo processo
+
+    def _file(self, product_id):
+        return os.path.join(self.path, quote(str(product_id), safe='') + '.npy')
+
+    @contextmanager
+    def _exclusive(self):
+        # Un solo aggiornamento alla volta, tra i thread del processo e tra processi
+        with self._lock:
+            os.makedirs(self.path, exist_ok=True)
+            if fcntl is None:
+                yield
+                return
+            with open(os.path.join(self.path, '.lock'), 'a') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _replace(self, target, write):
+        # Scrive un file temporaneo e lo rinomina sul file di destinazione:
+        # i lettori trovano il file precedente o quello nuovo, mai uno parziale
+        temp = f"{target}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(temp, 'wb') as f:
+                write(f)
+            os.replace(temp, target)
+        finally:
+            if os.path.exists(temp):
+                os.remove(temp)
+
+    def _read_state(self):
+        try:
+            with open(os.path.join(self.path, 'state.json')) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _write_state(self, state):
+        self._replace(os.path.join(self.path, 'state.json'),
+                      lambda f: f.write(json.dumps(state).encode('utf-8')))
+
+    def _merge(self, product_id, days, values, ids, existing=True):
+        # Aggiunge le righe nuove alla serie del prodotto; le righe rilette nel
+        # margine di sovrapposizione sono già presenti e vengono ignorate
+        if existing and os.path.exists(self._file(product_id)):
+            current = np.load(self._file(product_id), mmap_mode='r')
+            new = ~np.isin(ids, current[IDS])
+            if not new.any():
+                return False
+            days = np.concatenate((current[DATES], days[new]))
+            values = np.concatenate((current[VALUES].view(np.float64), values[new]))
+            ids = np.concatenate((current[IDS], ids[new]))
+
+        order = np.lexsort((ids, days))
+        data = np.stack((days[order], values[order].view(np.int64), ids[order]))
+        self._replace(self._file(product_id), lambda f: np.save(f, data))
+        return True
+
+    def refresh(self, full=False):
+        """
+        Brings the files up to date with storico_valori. Only the rows recorded
+        after the previous refresh (minus the overlap margin, which covers
+        transactions still open at that time) are read, and only the series
+        that received new rows are rewritten.
+
+        Parameters:
+        - full: True to read the whole history and drop the series no longer in
+          the database (e.g. after storico_valori has been emptied)
+
+        Returns:
+        - int: number of series rewritten, or None if the refresh failed
+        """
+        with self._exclusive():
+            state = {} if full else self._read_state()
+            conn = get_db_connection()
+            if conn is None:
+                return None
+
+            version_cursor = conn.cursor()
+            cursor = None
+            try:
+                # Versione letta prima delle righe: le righe lette la comprendono
+                version = read_data_version(version_cursor)
+                if not full and state.get('version') == version:
+                    self._version = version
+                    return 0
+
+                previous = datetime.datetime.fromisoformat(state['last_seen']) if state.get('last_seen') else None
+                since = previous - self.margin if previous is not None else EPOCH
+                # Registrazione più recente letta prima delle righe: quelle registrate nel
+                # frattempo vengono rilette al prossimo aggiornamento e ignorate se presenti
+                version_cursor.execute("SELECT max(registrato_il) FROM storico_valori;")
+                last_seen = version_cursor.fetchone()[0] or previous
+
+                # Cursore lato server: lo storico completo non viene caricato in memoria tutto insieme
+                cursor = conn.cursor(name='history_store_refresh')
+                cursor.itersize = FETCH_SIZE
+                cursor.execute(FETCH_QUERY, (since,))
+
+                written = set()
+                while True:
+                    rows = cursor.fetchmany(FETCH_SIZE)
+                    if not rows:
+                        break
+                    frame = pd.DataFrame(rows, columns=['product_id', 'giorno', 'valore', 'id'])
+                    days = frame['giorno'].to_numpy(dtype=np.int64)
+                    values = frame['valore'].to_numpy(dtype=np.float64)
+                    ids = frame['id'].to_numpy(dtype=np.int64)
+                    for product_id, positions in frame.groupby('product_id', sort=False).indices.items():
+                        # Nella ricostruzione completa i file precedenti vengono sostituiti,
+                        # salvo le righe dello stesso prodotto lette nel blocco precedente
+                        if self._merge(product_id, days[positions], values[positions], ids[positions],
+                                       existing=not full or product_id in written):
+                            written.add(product_id)
+
+                if full:
+                    kept = {self._file(product_id) for product_id in written}
+                    for path in glob.glob(os.path.join(self.path, '*.npy')):
+                        if path not in kept:
+                            os.remove(path)
+
+                self._write_state({
+                    'version': version,
+                    'last_seen': last_seen.isoformat() if last_seen is not None else None
+                })
+                self._version = version
+                return len(written)
+            except Exception as e:
+                print(f"Errore durante l'aggiornamento dello storico locale dei valori: {e}")
+                conn.rollback()
+                return None
+            finally:
+                if cursor is not None:
+                    cursor.close()
+                version_cursor.close()
+                conn.rollback()
+                conn.close()
+
+    def ensure_current(self):
+        """
+        Refreshes the files if the products changed since this process last
+        looked; if the database is unreachable the files are used as they are.
+        """
+        version = get_data_version()
+        if version is not None and version != self._version:
+            self.refresh()
+
+    def _open(self, product_id):
+        # Mappa del file corrente del prodotto; riaperta solo se il file è stato sostituito
+        path = self._file(product_id)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        key = (stat.st_ino, stat.st_mtime_ns)
+        cached = self._maps.get(product_id)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        try:
+            data = np.load(path, mmap_mode='r')
+        except FileNotFoundError:
+            return None
+        self._maps.put(product_id, (key, data))
+        return data
+
+    def series(self, product_id, start_date=None, end_date=None):
+        """
+        Returns the value series of a product as read-only views of the mapped
+        file, without copying it.
+
+        Parameters:
+        - product_id: ID of the product
+        - start_date: First date included (None for no lower bound)
+        - end_date: Last date included (None for no upper bound)
+
+        Returns:
+        - tuple: (dates as a datetime64[D] array, values as a float64 array)
+          sorted by date; empty arrays if the product has no history
+        """
+        data = self._open(product_id)
+        if data is None:
+            return np.empty(0, dtype='datetime64[D]'), np.empty(0, dtype=np.float64)
+
+        dates = data[DATES].view('datetime64[D]')
+        values = data[VALUES].view(np.float64)
+        first, last = 0, len(dates)
+        if start_date is not None:
+            first = np.searchsorted(dates, np.datetime64(pd.Timestamp(start_date).date(), 'D'), side='left')
+        if end_date is not None:
+            last = np.searchsorted(dates, np.datetime64(pd.Timestamp(end_date).date(), 'D'), side='right')
+        return dates[first:last], values[first:last]
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_history_store():
+    """
+    Returns the store shared by all the sessions of the process,
+    configured by get_history_store_config
+    """
+    global _store
+    with _store_lock:
+        if _store is None:
+            config = get_history_store_config()
+            _store = HistoryStore(config['path'], config['refresh_margin_seconds'], config['max_open_series'])
+        return _store
+
+def get_value_series(product_id, start_date=None, end_date=None):
+    """
+    Reads the value updates of a product from the local store, refreshing
+    it first if the data changed since the last read.
+
+    Parameters:
+    - product_id: ID of the product
+    - start_date: First date included (None for no lower bound)
+    - end_date: Last date included (None for no upper bound)
+
+    Returns:
+    - tuple: (dates, values) as HistoryStore.series
+    """
+    store = get_history_store()
+    store.ensure_current()
+    return store.series(product_id, start_date, end_date)
@@ -0,0 +1,64 @@
+import threading
+import time
+import functools
+from collections import deque
+import numpy as np
+
+# Numero di misure recenti conservate per ogni sezione
+SAMPLES_PER_SECTION = 200
+
+_samples = {}
+_samples_lock = threading.Lock()
+
+def record_rerun(section, seconds):
+    """
+    Records how long a rerun of a page section took
+
+    Parameters:
+    - section: Name of the section (e.g. "Pagina completa", "Proiezione")
+    - seconds: Duration of the rerun in seconds
+    """
+    with _samples_lock:
+        if section not in _samples:
+            _samples[section] = deque(maxlen=SAMPLES_PER_SECTION)
+        _samples[section].append(seconds * 1000)
+
+def timed(section):
+    """
+    Decorator recording the duration of every call with record_rerun
+
+    Parameters:
+    - section: Name under which the durations are recorded
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                record_rerun(section, time.perf_counter() - started)
+        return wrapper
+    return decorator
+
+def get_rerun_stats():
+    """
+    Returns the rerun latency of every section over the recent samples
+
+    Returns:
+    - list: dicts with section, count, last_ms, avg_ms, p95_ms, max_ms
+    """
+    with _samples_lock:
+        snapshot = {section: np.array(values) for section, values in _samples.items()}
+
+    stats = []
+    for section, values in snapshot.items():
+        stats.append({
+            'section': section,
+            'count': len(values),
+            'last_ms': float(values[-1]),
+            'avg_ms': float(values.mean()),
+            'p95_ms': float(np.percentile(values, 95)),
+            'max_ms': float(values.max())
+        })
+    return stats
@@ -0,0 +1,131 @@
+import os
+import re
+import threading
+from utils.db import get_db_connection
+
+# Cartella con i file di migrazione, applicati in ordine di versione:
+# NNNN_descrizione.sql
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'migrations')
+
+# Le migrazioni che iniziano con questo commento aggiungono funzionalità non
+# indispensabili: se falliscono (es. su database compatibili come CockroachDB)
+# vengono saltate e ritentate all'avvio successivo, senza bloccare le seguenti
+OPTIONAL_MARKER = '-- opzionale'
+
+# Chiave del lock advisory che serializza le migrazioni tra repliche diverse
+MIGRATION_LOCK_ID = 724170501
+
+_schema_ready = False
+_schema_lock = threading.Lock()
+
+def list_migrations():
+    """
+    Lists the migration files ordered by version
+    
+    Returns:
+    - list: tuples (version, name, path, optional)
+    """
+    migrations = []
+    for filename in os.listdir(MIGRATIONS_DIR):
+        match = re.match(r'^(\d+)_(.+)\.sql$', filename)
+        if match:
+            path = os.path.join(MIGRATIONS_DIR, filename)
+            with open(path, encoding='utf-8') as f:
+                optional = f.readline().startswith(OPTIONAL_MARKER)
+            migrations.append((int(match.group(1)), match.group(2), path, optional))
+    return sorted(migrations)
+
+def run_migrations():
+    """
+    Applies the pending migrations and records them in schema_version.
+    An advisory lock prevents concurrent replicas from migrating at the same time;
+    each migration runs in its own transaction. A failed optional migration is
+    skipped; a failed required one stops the later migrations.
+    
+    Returns:
+    - Boolean: True if all the required migrations are applied
+    """
+    conn = get_db_connection()
+    if conn is None:
+        return False
+    
+    cursor = conn.cursor()
+    locked = False
+    try:
+        try:
+            cursor.execute("SELECT pg_advisory_lock(%s);", (MIGRATION_LOCK_ID,))
+            conn.commit()
+            locked = True
+        except Exception as e:
+            # Alcuni database compatibili (es. CockroachDB) non supportano i lock advisory:
+            # le migrazioni sono comunque idempotenti
+            print(f"Lock advisory non disponibile, migrazioni senza lock: {e}")
+            conn.rollback()
+        
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS schema_version (
+                version INTEGER PRIMARY KEY,
+                name VARCHAR(255) NOT NULL,
+                applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            );
+        """)
+        conn.commit()
+        
+        cursor.execute("SELECT version FROM schema_version;")
+        applied = {row[0] for row in cursor.fetchall()}
+        
+        for version, name, path, optional in list_migrations():
+            if version in applied:
+                continue
+            
+            with open(path, encoding='utf-8') as f:
+                statements = f.read()
+            
+            try:
+                cursor.execute(statements)
+                cursor.execute(
+                    "INSERT INTO schema_version (version, name) VALUES (%s, %s);",
+                    (version, name)
+                )
+                conn.commit()
+                print(f"Migrazione {version:04d}_{name} applicata")
+            except Exception as e:
+                conn.rollback()
+                if optional:
+                    print(f"Migrazione opzionale {version:04d}_{name} non applicata, funzionalità non disponibile: {e}")
+                    continue
+                print(f"Errore durante la migrazione {version:04d}_{name}: {e}")
+                return False
+        
+        return True
+    except Exception as e:
+        print(f"Errore durante l'aggiornamento dello schema: {e}")
+        conn.rollback()
+        return False
+    finally:
+        if locked:
+            try:
+                cursor.execute("SELECT pg_advisory_unlock(%s);", (MIGRATION_LOCK_ID,))
+                conn.commit()
+            except Exception:
+                conn.rollback()
+        cursor.close()
+        conn.close()
+
+def ensure_schema():
+    """
+    Runs the migrations once per process; later calls return immediately.
+    If the database is unreachable or a required migration failed, the
+    migrations are retried on the next call.
+    
+    Returns:
+    - Boolean: True if all the required migrations are applied
+    """
+    global _schema_ready
+    if _schema_ready:
+        return True
+    
+    with _schema_lock:
+        if not _schema_ready:
+            _schema_ready = run_migrations()
+    return _schema_ready
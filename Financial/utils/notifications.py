@@ -0,0 +1,160 @@
+import json
+import select
+import threading
+import time
+import psycopg2
+import psycopg2.errors
+import psycopg2.extensions
+from utils.db import open_connection
+
+# Canale PostgreSQL su cui le scritture annunciano le modifiche ai dati.
+# Ogni processo (replica) ha un thread in ascolto che invalida le proprie cache.
+CHANNEL = 'data_changes'
+
+# Limite di PostgreSQL per il payload di NOTIFY è 8000 byte: oltre questa soglia
+# inviamo un'invalidazione completa senza elenco di ID
+MAX_PAYLOAD_BYTES = 7500
+
+# Ogni quanti secondi senza notifiche verifichiamo che la connessione sia ancora viva
+KEEPALIVE_INTERVAL = 30.0
+
+_callbacks = []
+_callbacks_lock = threading.Lock()
+_listener_thread = None
+_listener_lock = threading.Lock()
+_listening = threading.Event()
+
+# Supporto di NOTIFY/LISTEN nel database (None finché non verificato): CockroachDB
+# non li implementa, e senza notifiche le cache controllano la versione dei dati
+_notify_supported = None
+
+# Errori con cui il database segnala che LISTEN o pg_notify non esistono
+UNSUPPORTED_ERRORS = (psycopg2.errors.FeatureNotSupported, psycopg2.errors.UndefinedFunction, psycopg2.errors.SyntaxError)
+
+def register_listener(callback):
+    """
+    Registers a function called for every data change notification
+
+    Parameters:
+    - callback: function(payload) where payload is a dict with 'table',
+      'version' and 'ids' (None means "everything may have changed").
+      It runs in the listener thread, so it must be thread-safe.
+    """
+    with _callbacks_lock:
+        if callback not in _callbacks:
+            _callbacks.append(callback)
+
+def notify_change(cursor, table, version, ids=None):
+    """
+    Queues a change notification inside the caller's transaction.
+    PostgreSQL delivers it to the listeners only if the transaction commits.
+    Until NOTIFY is known to work it runs under a savepoint: if the database
+    does not support it, the error does not abort the caller's write and
+    notifications are disabled for the process.
+
+    Parameters:
+    - cursor: Database cursor of the writing transaction
+    - table: Name of the modified table
+    - version: New data version of the table
+    - ids: List of affected product IDs, or None for the whole table
+    """
+    payload = json.dumps({'table': table, 'version': version, 'ids': list(ids) if ids is not None else None})
+    if len(payload.encode('utf-8')) > MAX_PAYLOAD_BYTES:
+        payload = json.dumps({'table': table, 'version': version, 'ids': None})
+    global _notify_supported
+    if _notify_supported is False:
+        return
+    if _notify_supported:
+        cursor.execute("SELECT pg_notify(%s, %s);", (CHANNEL, payload))
+        return
+
+    cursor.execute("SAVEPOINT notify_change;")
+    try:
+        cursor.execute("SELECT pg_notify(%s, %s);", (CHANNEL, payload))
+    except psycopg2.Error as e:
+        cursor.execute("ROLLBACK TO SAVEPOINT notify_change;")
+        _notify_supported = False
+        print(f"Notifiche non supportate dal database, le cache controllano la versione dei dati: {e}")
+        return
+    cursor.execute("RELEASE SAVEPOINT notify_change;")
+    _notify_supported = True
+
+def is_listening():
+    """
+    Returns True while the listener thread is connected and receiving notifications
+    (and the writes of this process can send them)
+    """
+    return _listening.is_set() and _notify_supported is not False
+
+def _dispatch(payload):
+    with _callbacks_lock:
+        callbacks = list(_callbacks)
+    for callback in callbacks:
+        try:
+            callback(payload)
+        except Exception as e:
+            print(f"Errore durante la gestione della notifica {payload}: {e}")
+
+def _listen_forever():
+    global _notify_supported
+    delay = 1.0
+    while True:
+        conn = open_connection()
+        if conn is None:
+            time.sleep(delay)
+            delay = min(delay * 2, 60.0)
+            continue
+
+        try:
+            conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+            cursor = conn.cursor()
+            try:
+                cursor.execute(f"LISTEN {CHANNEL};")
+            except UNSUPPORTED_ERRORS as e:
+                # Nessun nuovo tentativo: il database non supporterà LISTEN più avanti
+                _notify_supported = False
+                print(f"LISTEN non supportato dal database, le cache controllano la versione dei dati: {e}")
+                return
+
+            # Le notifiche perse mentre eravamo disconnessi non sono recuperabili:
+            # invalidiamo tutto prima di dichiararci in ascolto
+            _dispatch({'table': None, 'version': None, 'ids': None})
+            _listening.set()
+            delay = 1.0
+
+            while True:
+                if select.select([conn], [], [], KEEPALIVE_INTERVAL) == ([], [], []):
+                    # Nessuna notifica: verifichiamo che la connessione sia ancora attiva
+                    cursor.execute("SELECT 1;")
+                    continue
+
+                conn.poll()
+                while conn.notifies:
+                    notification = conn.notifies.pop(0)
+                    try:
+                        payload = json.loads(notification.payload)
+                    except ValueError:
+                        payload = {'table': None, 'version': None, 'ids': None}
+                    _dispatch(payload)
+        except Exception as e:
+            print(f"Ascolto delle notifiche interrotto, nuovo tentativo tra {delay:.0f}s: {e}")
+        finally:
+            _listening.clear()
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+        time.sleep(delay)
+        delay = min(delay * 2, 60.0)
+
+def start_listener():
+    """
+    Starts the background thread listening for data change notifications
+    (once per process; later calls do nothing)
+    """
+    global _listener_thread
+    with _listener_lock:
+        if _listener_thread is None or not _listener_thread.is_alive():
+            _listener_thread = threading.Thread(target=_listen_forever, name="data-change-listener", daemon=True)
+            _listener_thread.start()
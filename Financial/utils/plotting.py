@@ -1,14 +1,248 @@
 import plotly.express as px
 import plotly.graph_objects as go
+import plotly.io as pio
 import pandas as pd
 import numpy as np
+import datetime
+import hashlib
+import importlib.util
+from config import get_chart_config, get_cache_config
+from utils.cache import LRUCache
 
-def plot_capital_over_time(df):
+# Motore JSON veloce per la serializzazione delle figure (anche quella di st.plotly_chart);
+# orjson è tra le dipendenze, il controllo evita errori in ambienti installati a mano
+if importlib.util.find_spec("orjson") is not None:
+    pio.json.config.default_engine = "orjson"
+
+_cache_config = get_cache_config()
+# Figure già costruite, indicizzate sull'impronta dei dati aggregati che rappresentano
+_figure_cache = LRUCache(
+    max_entries=_cache_config['figure_max_entries'],
+    max_bytes=int(_cache_config['figure_max_mb'] * 1024 * 1024),
+    sizeof=lambda entry: entry[1]
+)
+
+def _fingerprint(parts):
+    """
+    Returns a content hash of the inputs of a figure (strings, numbers and arrays)
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    for part in parts:
+        if isinstance(part, np.ndarray):
+            if part.dtype == object:
+                part = np.array([str(item) for item in part], dtype=str)
+            digest.update(f"{part.dtype}{part.shape}".encode())
+            digest.update(np.ascontiguousarray(part).tobytes())
+        else:
+            digest.update(repr(part).encode())
+        digest.update(b"\x1f")
+    return digest.hexdigest()
+
+# Layout e template di una figura: dimensione circa costante (JSON di una figura senza dati)
+_FIGURE_OVERHEAD_BYTES = 8 * 1024
+
+# Attributi delle tracce che contengono i dati delle serie
+_TRACE_DATA_ATTRIBUTES = ('x', 'y', 'z', 'base', 'labels', 'values', 'text', 'customdata', 'hovertext')
+
+def figure_nbytes(fig):
+    """
+    Estimates the size of a figure from the data of its traces, without
+    serializing it: 8 bytes per number or date, the length of the strings,
+    plus a constant for the layout and the template.
+    
+    Parameters:
+    - fig: Plotly figure object
+    
+    Returns:
+    - int: approximate size in bytes
+    """
+    size = _FIGURE_OVERHEAD_BYTES
+    for trace in fig.data:
+        for attribute in _TRACE_DATA_ATTRIBUTES:
+            values = getattr(trace, attribute, None)
+            if values is None or isinstance(values, str):
+                continue
+            values = np.asarray(values)
+            if values.dtype.kind in 'OUS':
+                size += sum(len(str(value)) for value in values.ravel())
+            else:
+                size += values.size * 8
+    return size
+
+def _cached_figure(key_parts, build):
+    """
+    Returns the figure built by build(), reusing across reruns and sessions the
+    one built for inputs with the same content hash. Returned figures are
+    shared and must not be modified.
+    
+    Parameters:
+    - key_parts: tuple of the aggregated inputs of the figure
+    - build: function without arguments building the figure
+    
+    Returns:
+    - Plotly figure object
+    """
+    key = _fingerprint(key_parts)
+    entry = _figure_cache.get(key)
+    if entry is None:
+        fig = build()
+        # Dimensione stimata dai dati delle tracce: serializzare la figura solo
+        # per misurarla raddoppierebbe il costo di ogni figura non in cache
+        entry = (fig, figure_nbytes(fig))
+        _figure_cache.put(key, entry)
+    return entry[0]
+
+def get_figure_cache_stats():
+    """
+    Returns the statistics of the figure cache (see LRUCache.stats)
+    """
+    return _figure_cache.stats()
+
+def _lttb_indices(x, y, n_out):
+    """
+    Selects n_out points of a series with the Largest-Triangle-Three-Buckets
+    algorithm: first and last points are kept, and from each bucket the point
+    forming the largest triangle with the previous choice and the next bucket mean
+    
+    Parameters:
+    - x, y: float arrays of the series (x ascending)
+    - n_out: Number of points to keep (at least 3)
+    
+    Returns:
+    - array: sorted indices of the selected points
+    """
+    n = len(x)
+    if n <= n_out:
+        return np.arange(n)
+    
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+    selected = np.empty(n_out, dtype=int)
+    selected[0] = 0
+    selected[-1] = n - 1
+    previous = 0
+    for bucket in range(n_out - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        next_start, next_end = end, edges[bucket + 2] if bucket + 2 < len(edges) else n
+        mean_x = x[next_start:next_end].mean()
+        mean_y = y[next_start:next_end].mean()
+        # Area (doppia) dei triangoli tra il punto scelto, i candidati e la media successiva
+        areas = np.abs(
+            (x[previous] - mean_x) * (y[start:end] - y[previous])
+            - (x[previous] - x[start:end]) * (mean_y - y[previous])
+        )
+        previous = start + int(areas.argmax())
+        selected[bucket + 1] = previous
+    return selected
+
+def _minmax_indices(values, n_buckets):
+    """
+    Min/max envelope: for each bucket keeps the first, last, minimum and
+    maximum point of every column
+    
+    Parameters:
+    - values: 2D float array (rows = points, columns = series)
+    - n_buckets: Number of buckets
+    
+    Returns:
+    - array: sorted indices of the selected points
+    """
+    n = len(values)
+    bounds = np.linspace(0, n, n_buckets + 1).astype(int)
+    starts = bounds[:-1][bounds[:-1] < bounds[1:]]
+    keep = [starts, np.append(starts[1:], n) - 1]
+    bucket_of = np.repeat(np.arange(len(starts)), np.diff(np.append(starts, n)))
+    for column in values.T:
+        # reduceat calcola min e max di ogni bucket senza cicli Python
+        minimum = np.minimum.reduceat(column, starts)
+        maximum = np.maximum.reduceat(column, starts)
+        for extreme in (minimum, maximum):
+            # Solo la prima occorrenza per bucket (le serie costanti la raggiungono ovunque)
+            matches = np.flatnonzero(column == extreme[bucket_of])
+            _, first = np.unique(bucket_of[matches], return_index=True)
+            keep.append(matches[first])
+    return np.unique(np.concatenate(keep))
+
+def downsample_indices(x, values, max_points=None, step=False):
+    """
+    Positions of the points kept by downsample, computed directly on arrays
+    (e.g. the memory-mapped series of utils.history_store) so that only the
+    selected points are copied.
+    
+    Parameters:
+    - x: 1-D array of the x values (datetime64 or numbers), sorted
+    - values: 1-D array of one series, or 2-D array with one column per series
+    - max_points: Point budget (default: max_points from get_chart_config)
+    - step: True for step series
+    
+    Returns:
+    - ndarray: sorted positions of the selected points (all of them if already small enough)
+    """
+    if max_points is None:
+        max_points = get_chart_config()['max_points']
+    max_points = max(int(max_points), 4)
+    values = np.asarray(values, dtype=float)
+    if values.ndim == 1:
+        values = values[:, None]
+    if len(values) <= max_points:
+        return np.arange(len(values))
+    
+    if step:
+        # Punti in cui almeno una serie cambia valore, più il primo e l'ultimo
+        changed = np.any(values[1:] != values[:-1], axis=1)
+        candidates = np.unique(np.concatenate(([0], np.flatnonzero(changed) + 1, [len(values) - 1])))
+        if len(candidates) > max_points:
+            per_bucket = 2 + 2 * values.shape[1]
+            chosen = _minmax_indices(values[candidates], max(max_points // per_bucket, 1))
+            candidates = candidates[chosen]
+        return candidates
+    
+    x = np.asarray(x)
+    if np.issubdtype(x.dtype, np.datetime64):
+        x = x.astype('datetime64[ns]').astype(np.int64).astype(float)
+    else:
+        x = x.astype(float)
+    
+    per_series = max(max_points // values.shape[1], 3)
+    return np.unique(np.concatenate([_lttb_indices(x, values[:, i], per_series) for i in range(values.shape[1])]))
+
+def downsample(df, x_column, y_columns, max_points=None, step=False):
+    """
+    Reduces a time series DataFrame to at most about max_points rows before
+    building a figure, so the payload does not grow with the series length.
+    
+    Step series (drawn with shape='hv') keep exactly the points where a value
+    changes, which redraws the same steps; if they are still too many, a
+    min/max envelope is applied to them. Other series use LTTB.
+    
+    Parameters:
+    - df: DataFrame sorted by x_column
+    - x_column: Name of the x column (dates or numbers)
+    - y_columns: List of the y columns plotted
+    - max_points: Point budget (default: max_points from get_chart_config)
+    - step: True for step series
+    
+    Returns:
+    - DataFrame: the selected rows (df itself if already small enough)
+    """
+    if max_points is None:
+        max_points = get_chart_config()['max_points']
+    if len(df) <= max(int(max_points), 4):
+        return df
+    
+    x = df[x_column]
+    if pd.api.types.is_datetime64_any_dtype(x):
+        x = x.to_numpy(dtype='datetime64[ns]')
+    else:
+        x = x.to_numpy(dtype=float)
+    return df.iloc[downsample_indices(x, df[y_columns].to_numpy(dtype=float), max_points, step)]
+
+def plot_capital_over_time(df, max_points=None):
     """
     Creates a line chart showing invested, liquid, bound and total capital over time
     
     Parameters:
     - df: DataFrame with time series data
+    - max_points: Point budget per series (see downsample)
     
     Returns:
     - Plotly figure object
@@ -35,6 +269,15 @@ def plot_capital_over_time(df):
         )
         return fig
     
+    # Riduciamo i punti mantenendo esattamente i gradini delle scadenze
+    df = downsample(df, 'date', ['invested_capital', 'liquid_value', 'bound_value', 'total_value'],
+                    max_points=max_points, step=True)
+    
+    key = ('capital', max_points, df['date'].to_numpy(), df[required_columns[1:]].to_numpy())
+    return _cached_figure(key, lambda: _capital_figure(df))
+
+def _capital_figure(df):
+    # Costruzione del grafico a gradini (dati già ridotti da downsample)
     # Create step-based graph showing capital evolution
     fig = go.Figure()
     
@@ -157,8 +400,31 @@ def plot_product_distribution(df, value_column='capitale_investito', group_colum
         return fig
     
     # Group by the specified column and sum the values
-    grouped_data = df.groupby(group_column)[value_column].sum().reset_index()
+    grouped_data = df.groupby(group_column, observed=True)[value_column].sum().reset_index()
+    return plot_distribution_totals(grouped_data, value_column, group_column, title)
+
+def plot_distribution_totals(grouped_data, value_column='capitale_investito', group_column='tipologia', title='Distribuzione per Tipologia'):
+    """
+    Creates the pie chart of plot_product_distribution from amounts already
+    summed per group (e.g. by the database with get_portfolio_totals)
+    
+    Parameters:
+    - grouped_data: DataFrame with one row per group and the group_column and value_column columns
+    - value_column: Column with the summed values
+    - group_column: Column with the group names
+    - title: Chart title
+    
+    Returns:
+    - Plotly figure object
+    """
+    if grouped_data.empty:
+        return plot_product_distribution(grouped_data, value_column, group_column, title)
     
+    key = ('distribution', value_column, group_column, title,
+           grouped_data[group_column].astype(str).to_numpy(), grouped_data[value_column].to_numpy(dtype=float))
+    return _cached_figure(key, lambda: _distribution_figure(grouped_data, value_column, group_column, title))
+
+def _distribution_figure(grouped_data, value_column, group_column, title):
     # Create pie chart
     fig = px.pie(
         grouped_data, 
@@ -179,12 +445,16 @@ def plot_product_distribution(df, value_column='capitale_investito', group_colum
     
     return fig
 
-def plot_maturity_timeline(df):
+def plot_maturity_timeline(df, bar_threshold=None):
     """
-    Creates a timeline showing when products will mature
+    Creates a timeline showing when products will mature.
+    The figure has a constant number of traces whatever the portfolio size;
+    above bar_threshold products the maturities are summed per month.
     
     Parameters:
     - df: DataFrame containing financial products data
+    - bar_threshold: Product count above which monthly bars are drawn
+      (default: timeline_bar_threshold from get_chart_config)
     
     Returns:
     - Plotly figure object
@@ -218,30 +488,62 @@ def plot_maturity_timeline(df):
     # Sort by expiry date
     has_expiry = has_expiry.sort_values('data_scadenza')
     
+    if bar_threshold is None:
+        bar_threshold = get_chart_config()['timeline_bar_threshold']
+    
+    # Il marcatore "Oggi" dipende dal giorno corrente
+    key = ('timeline', bar_threshold, datetime.date.today(), has_expiry['data_scadenza'].to_numpy(),
+           has_expiry['capitale_finale'].to_numpy(dtype=float), has_expiry['nome'].astype(str).to_numpy())
+    return _cached_figure(key, lambda: _timeline_figure(has_expiry, bar_threshold))
+
+def _timeline_figure(has_expiry, bar_threshold):
+    # Costruzione della timeline a partire dai prodotti con scadenza, ordinati
+    dates = has_expiry['data_scadenza']
+    values = has_expiry['capitale_finale'].to_numpy(dtype=float)
+    
     # Create figure
     fig = go.Figure()
     
-    # Add vertical lines for each product maturity
-    for i, row in has_expiry.iterrows():
+    if len(has_expiry) > bar_threshold:
+        # Troppi prodotti per distinguerli: sommiamo le scadenze per mese
+        months = dates.dt.to_period('M').dt.to_timestamp()
+        monthly = has_expiry.groupby(months.to_numpy())['capitale_finale'].agg(['sum', 'count'])
+        fig.add_trace(go.Bar(
+            x=monthly.index,
+            y=monthly['sum'],
+            customdata=monthly['count'],
+            marker=dict(color='rgba(0, 150, 255, 0.8)'),
+            name='Scadenze mensili',
+            hovertemplate="%{y:,.2f}€<br>%{x|%m/%Y}<br>%{customdata} prodotti<extra></extra>",
+            showlegend=False
+        ))
+        values = monthly['sum'].to_numpy()
+    else:
+        # Linee verticali di tutte le scadenze in un'unica traccia, separate da None
+        stem_x = np.empty(3 * len(has_expiry), dtype=object)
+        stem_x[0::3] = dates.to_numpy()
+        stem_x[1::3] = dates.to_numpy()
+        stem_y = np.empty(3 * len(has_expiry), dtype=object)
+        stem_y[0::3] = 0.0
+        stem_y[1::3] = values
         fig.add_trace(go.Scatter(
-            x=[row['data_scadenza'], row['data_scadenza']],
-            y=[0, row['capitale_finale']],
+            x=stem_x,
+            y=stem_y,
             mode='lines',
-            name=row['nome'],
             line=dict(color='rgba(0, 150, 255, 0.5)', width=2),
+            hoverinfo='skip',
             showlegend=False
         ))
-        
-        # Add markers for the product value
-        fig.add_trace(go.Scatter(
-            x=[row['data_scadenza']],
-            y=[row['capitale_finale']],
+    
+        # Marker del valore dei prodotti in un'unica traccia WebGL
+        fig.add_trace(go.Scattergl(
+            x=dates,
+            y=values,
             mode='markers+text',
             marker=dict(color='rgba(0, 150, 255, 0.8)', size=12),
-            text=[row['nome']],
+            text=has_expiry['nome'],
             textposition="top center",
-            name=row['nome'],
-            hovertemplate="%{y:,.2f}€<br>%{x|%d/%m/%Y}",
+            hovertemplate="%{text}<br>%{y:,.2f}€<br>%{x|%d/%m/%Y}<extra></extra>",
             showlegend=False
         ))
     
@@ -249,7 +551,7 @@ def plot_maturity_timeline(df):
     today = pd.Timestamp.now()
     fig.add_trace(go.Scatter(
         x=[today, today],
-        y=[0, has_expiry['capitale_finale'].max() * 1.1],
+        y=[0, values.max() * 1.1],
         mode='lines',
         name='Oggi',
         line=dict(color='red', width=2, dash='dash'),
@@ -257,7 +559,7 @@ def plot_maturity_timeline(df):
     ))
     
     # Determiniamo il valore massimo per l'asse Y
-    max_value = has_expiry['capitale_finale'].max()
+    max_value = values.max()
     
     # Arrotondiamo il valore massimo al prossimo multiplo di 5000 o 10000 per un aspetto migliore
     if max_value < 50000:
@@ -0,0 +1,228 @@
+import datetime
+import pandas as pd
+from psycopg2 import sql
+
+# Tabelle degli aggregati: colonne chiave (nome, espressione sui prodotti) e
+# prodotti considerati. Ogni riga somma prodotti, capitale investito e finale.
+SUMMARY_TABLES = {
+    'portfolio_summary': {
+        'keys': [('tipologia', 'tipologia'), ('vincolo', 'vincolo')],
+        'where': 'TRUE'
+    },
+    'portfolio_maturity_calendar': {
+        'keys': [('mese', "date_trunc('month', data_scadenza)::date"), ('vincolo', 'vincolo')],
+        'where': 'data_scadenza IS NOT NULL'
+    }
+}
+
+# Totali per tipologia e per vincolo, letti dagli aggregati
+SUMMARY_TOTALS_QUERY = """
+    SELECT GROUPING(tipologia) AS all_tipologie,
+           GROUPING(vincolo) AS all_vincoli,
+           tipologia,
+           vincolo,
+           COALESCE(SUM(prodotti), 0) AS prodotti,
+           COALESCE(SUM(capitale_investito), 0) AS capitale_investito,
+           COALESCE(SUM(capitale_finale), 0) AS capitale_finale
+    FROM portfolio_summary
+    GROUP BY GROUPING SETS ((), (tipologia), (vincolo));
+"""
+
+# Prodotti non ancora scaduti alla data (esclusi i liquidi, sempre disponibili):
+# i mesi successivi dal calendario, il mese in corso dai prodotti per l'esattezza al giorno
+PENDING_QUERY = """
+    SELECT COALESCE(SUM(capitale_finale), 0) AS capitale_finale,
+           COALESCE(SUM(capitale_investito) FILTER (WHERE vincolo = 'Vincolato'), 0) AS bound_value
+    FROM (
+        SELECT vincolo, capitale_investito, capitale_finale
+        FROM portfolio_maturity_calendar
+        WHERE mese > %(month)s AND vincolo <> 'Liquido'
+        UNION ALL
+        SELECT vincolo, capitale_investito, capitale_finale
+        FROM prodotti_finanziari
+        WHERE data_scadenza > %(as_of)s AND data_scadenza < %(next_month)s AND vincolo <> 'Liquido'
+    ) AS in_scadenza;
+"""
+
+def _aggregate_query(table, by_ids=False):
+    # Aggregazione dei prodotti con le stesse colonne della tabella, ordinata per chiave
+    # (gli aggiornamenti concorrenti bloccano le righe nello stesso ordine)
+    definition = SUMMARY_TABLES[table]
+    keys = sql.SQL(', ').join(
+        sql.SQL("{} AS {}").format(sql.SQL(expression), sql.Identifier(name))
+        for name, expression in definition['keys']
+    )
+    where = sql.SQL(definition['where'])
+    if by_ids:
+        where = where + sql.SQL(" AND id = ANY(%(ids)s)")
+    return sql.SQL("""
+        SELECT {keys},
+               %(sign)s * count(*) AS prodotti,
+               %(sign)s * SUM(capitale_investito) AS capitale_investito,
+               %(sign)s * SUM(capitale_finale) AS capitale_finale
+        FROM prodotti_finanziari
+        WHERE {where}
+        GROUP BY {positions}
+        ORDER BY {positions}
+    """).format(
+        keys=keys,
+        where=where,
+        positions=sql.SQL(', ').join(sql.Literal(i + 1) for i in range(len(definition['keys'])))
+    )
+
+def _key_names(table):
+    return [name for name, _ in SUMMARY_TABLES[table]['keys']]
+
+def _apply(cursor, ids, sign):
+    # Somma (sign=1) o sottrae (sign=-1) il contributo dei prodotti indicati
+    for table in SUMMARY_TABLES:
+        keys = sql.SQL(', ').join(map(sql.Identifier, _key_names(table)))
+        cursor.execute(sql.SQL("""
+            INSERT INTO {table} AS s ({keys}, prodotti, capitale_investito, capitale_finale)
+            {select}
+            ON CONFLICT ({keys}) DO UPDATE SET
+                prodotti = s.prodotti + EXCLUDED.prodotti,
+                capitale_investito = s.capitale_investito + EXCLUDED.capitale_investito,
+                capitale_finale = s.capitale_finale + EXCLUDED.capitale_finale;
+        """).format(table=sql.Identifier(table), keys=keys, select=_aggregate_query(table, by_ids=True)),
+            {'ids': list(ids), 'sign': sign})
+        # I gruppi rimasti senza prodotti non devono comparire nei totali
+        cursor.execute(sql.SQL("DELETE FROM {} WHERE prodotti = 0;").format(sql.Identifier(table)))
+
+def withdraw_from_summary(cursor, ids):
+    """
+    Removes the current contribution of existing products from the aggregates.
+    Must be called in the writing transaction BEFORE updating or deleting
+    products; the products are locked until the end of the transaction.
+
+    Parameters:
+    - cursor: Database cursor of the writing transaction
+    - ids: IDs of the products about to be updated or deleted
+    """
+    ids = list(ids)
+    if not ids:
+        return
+    cursor.execute("SELECT id FROM prodotti_finanziari WHERE id = ANY(%s) FOR UPDATE;", (ids,))
+    _apply(cursor, ids, -1)
+
+def add_to_summary(cursor, ids=None):
+    """
+    Adds the contribution of the written products to the aggregates.
+    Called by bump_data_version AFTER the write; without IDs (writes to the
+    whole table) the aggregates are rebuilt.
+
+    Parameters:
+    - cursor: Database cursor of the writing transaction
+    - ids: IDs of the inserted/updated/deleted products, or None for the whole table
+    """
+    if ids is None:
+        rebuild_summary(cursor)
+    elif ids:
+        _apply(cursor, ids, 1)
+
+def rebuild_summary(cursor):
+    """
+    Recomputes the aggregates from all the products
+
+    Parameters:
+    - cursor: Database cursor (the caller commits)
+    """
+    for table in SUMMARY_TABLES:
+        cursor.execute(sql.SQL("DELETE FROM {};").format(sql.Identifier(table)))
+        cursor.execute(sql.SQL("INSERT INTO {table} ({keys}, prodotti, capitale_investito, capitale_finale) {select};").format(
+            table=sql.Identifier(table),
+            keys=sql.SQL(', ').join(map(sql.Identifier, _key_names(table))),
+            select=_aggregate_query(table)
+        ), {'sign': 1})
+
+def verify_summary(cursor):
+    """
+    Compares the stored aggregates with a full recomputation from the products
+
+    Parameters:
+    - cursor: Database cursor
+
+    Returns:
+    - list: dicts (table, key, stored, expected) for every group that differs;
+      stored and expected are (prodotti, capitale_investito, capitale_finale) or None
+    """
+    differences = []
+    for table in SUMMARY_TABLES:
+        names = _key_names(table)
+        values = ['prodotti', 'capitale_investito', 'capitale_finale']
+        query = sql.SQL("""
+            WITH atteso AS ({select})
+            SELECT {keys}, {stored}, {expected}
+            FROM atteso a FULL OUTER JOIN {table} s ON {join}
+            WHERE {differs}
+            ORDER BY {positions};
+        """).format(
+            select=_aggregate_query(table),
+            table=sql.Identifier(table),
+            keys=sql.SQL(', ').join(
+                sql.SQL("COALESCE(a.{0}, s.{0})").format(sql.Identifier(name)) for name in names),
+            stored=sql.SQL(', ').join(sql.SQL("s.{}").format(sql.Identifier(value)) for value in values),
+            expected=sql.SQL(', ').join(sql.SQL("a.{}").format(sql.Identifier(value)) for value in values),
+            join=sql.SQL(' AND ').join(sql.SQL("a.{0} = s.{0}").format(sql.Identifier(name)) for name in names),
+            differs=sql.SQL(' OR ').join(
+                sql.SQL("a.{0} IS DISTINCT FROM s.{0}").format(sql.Identifier(value)) for value in values),
+            positions=sql.SQL(', ').join(sql.Literal(i + 1) for i in range(len(names)))
+        )
+        cursor.execute(query, {'sign': 1})
+        for row in cursor.fetchall():
+            key = row[:len(names)]
+            stored = row[len(names):len(names) + 3]
+            expected = row[len(names) + 3:]
+            differences.append({
+                'table': table,
+                'key': dict(zip(names, key)),
+                'stored': None if stored[0] is None else tuple(stored),
+                'expected': None if expected[0] is None else tuple(expected)
+            })
+    return differences
+
+def _group_totals(rows, column, position):
+    # Righe di un raggruppamento ordinate per valore, come il groupby di pandas
+    groups = sorted((row for row in rows if row[position] is not None), key=lambda row: row[position])
+    return pd.DataFrame({
+        column: [row[position] for row in groups],
+        'capitale_investito': [float(row[5]) for row in groups],
+        'capitale_finale': [float(row[6]) for row in groups]
+    }, columns=[column, 'capitale_investito', 'capitale_finale'])
+
+def read_portfolio_totals(cursor, as_of):
+    """
+    Reads the figures of the dashboard header and pie charts from the
+    aggregates: the cost depends on the number of groups and of the products
+    maturing in the month of as_of, not on the size of the portfolio.
+    Liquid, undated and matured products count at capitale_finale, 'Vincolato'
+    products not yet matured at capitale_investito.
+
+    Parameters:
+    - cursor: Database cursor
+    - as_of: Date of the values (datetime.date)
+
+    Returns:
+    - dict: as utils.financial.calculate_portfolio_totals
+    """
+    cursor.execute(SUMMARY_TOTALS_QUERY)
+    rows = cursor.fetchall()
+
+    month = as_of.replace(day=1)
+    next_month = (month + datetime.timedelta(days=32)).replace(day=1)
+    cursor.execute(PENDING_QUERY, {'as_of': as_of, 'month': month, 'next_month': next_month})
+    pending_finale, bound_value = cursor.fetchone()
+
+    # Somme esatte (DECIMAL) convertite in float solo alla fine
+    overall = next(row for row in rows if row[0] == 1 and row[1] == 1)
+    liquid_value = overall[6] - pending_finale
+    return {
+        'count': int(overall[4]),
+        'total_invested': float(overall[5]),
+        'total_current': float(overall[6]),
+        'liquid_value': float(liquid_value),
+        'bound_value': float(bound_value),
+        'total_value': float(liquid_value + bound_value),
+        'by_tipologia': _group_totals([row for row in rows if row[0] == 0], 'tipologia', 2),
+        'by_vincolo': _group_totals([row for row in rows if row[1] == 0], 'vincolo', 3)
+    }
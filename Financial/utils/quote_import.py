@@ -0,0 +1,317 @@
+import io
+import time
+import datetime
+import numpy as np
+import pandas as pd
+from utils.db import get_db_connection
+from utils.data_manager import bump_data_version, ensure_history_partition, mark_products_stale
+from utils.portfolio_summary import withdraw_from_summary
+
+# Righe del file lette e validate alla volta
+QUOTE_CHUNK_SIZE = 20000
+
+# Nomi accettati per le colonne del file (senza distinzione tra maiuscole e minuscole)
+ID_COLUMNS = ['id', 'product_id', 'id_prodotto']
+NAME_COLUMNS = ['nome', 'name', 'prodotto']
+DATE_COLUMNS = ['data', 'date', 'data_aggiornamento']
+VALUE_COLUMNS = ['valore', 'value', 'nav', 'quotazione']
+NOTE_COLUMNS = ['note', 'notes']
+
+# Nota registrata nello storico per le righe senza note
+DEFAULT_NOTE = 'Importazione quotazioni'
+
+STAGING_TABLE = """
+    CREATE TEMPORARY TABLE import_quotazioni (
+        riga BIGINT NOT NULL,
+        product_id VARCHAR(36) NOT NULL,
+        data_aggiornamento DATE NOT NULL,
+        valore DECIMAL(15, 2) NOT NULL,
+        note TEXT
+    ) ON COMMIT DROP;
+"""
+
+# Per ogni prodotto gli aggiornamenti importati vengono ordinati insieme a quelli
+# già registrati: il valore precedente di ognuno è quello dell'evento prima
+# (o, in mancanza, il valore del prodotto prima di qualsiasi aggiornamento) e
+# il prodotto prende il valore importato solo se è il più recente di tutti.
+# Dello storico esistente si leggono solo le righe dalla prima data importata
+# in poi e l'ultima precedente: un'importazione mensile tocca poche righe.
+APPLY_QUERY = """
+    WITH limiti AS (
+        SELECT product_id, min(data_aggiornamento) AS prima_data
+        FROM import_quotazioni GROUP BY product_id
+    ), eventi AS (
+        SELECT h.product_id, h.data_aggiornamento, h.id AS ordine, h.capitale_nuovo AS valore,
+               FALSE AS nuovo, NULL::TEXT AS note
+        FROM storico_valori h
+        JOIN limiti l ON h.product_id = l.product_id AND h.data_aggiornamento >= l.prima_data
+        UNION ALL
+        SELECT ultimo.product_id, ultimo.data_aggiornamento, ultimo.id, ultimo.capitale_nuovo, FALSE, NULL
+        FROM limiti l CROSS JOIN LATERAL (
+            SELECT h.product_id, h.data_aggiornamento, h.id, h.capitale_nuovo
+            FROM storico_valori h
+            WHERE h.product_id = l.product_id AND h.data_aggiornamento < l.prima_data
+            ORDER BY h.data_aggiornamento DESC, h.id DESC
+            LIMIT 1
+        ) AS ultimo
+        UNION ALL
+        SELECT product_id, data_aggiornamento, riga, valore, TRUE, note
+        FROM import_quotazioni
+    ), ordinati AS (
+        SELECT e.*,
+               lag(valore) OVER (PARTITION BY product_id ORDER BY data_aggiornamento, nuovo, ordine) AS precedente,
+               row_number() OVER (PARTITION BY product_id ORDER BY data_aggiornamento DESC, nuovo DESC, ordine DESC) AS dalla_fine
+        FROM eventi e
+    ), inseriti AS (
+        INSERT INTO storico_valori (product_id, data_aggiornamento, capitale_precedente, capitale_nuovo, note)
+        SELECT o.product_id, o.data_aggiornamento,
+               COALESCE(o.precedente, (
+                   SELECT h.capitale_precedente FROM storico_valori h
+                   WHERE h.product_id = o.product_id
+                   ORDER BY h.data_aggiornamento, h.id
+                   LIMIT 1
+               ), p.capitale_finale),
+               o.valore, o.note
+        FROM ordinati o
+        JOIN prodotti_finanziari p ON p.id = o.product_id
+        WHERE o.nuovo
+        ORDER BY o.product_id, o.data_aggiornamento
+        RETURNING 1
+    ), aggiornati AS (
+        UPDATE prodotti_finanziari p
+        SET capitale_finale = o.valore,
+            data_aggiornamento = GREATEST(p.data_aggiornamento, o.data_aggiornamento)
+        FROM ordinati o
+        WHERE o.product_id = p.id AND o.nuovo AND o.dalla_fine = 1
+        RETURNING p.id
+    )
+    SELECT (SELECT count(*) FROM inseriti), (SELECT count(*) FROM aggiornati);
+"""
+
+def _find_column(columns, candidates):
+    lookup = {column.strip().lower(): column for column in columns}
+    return next((lookup[name] for name in candidates if name in lookup), None)
+
+def _parse_dates(values):
+    # Date ISO (2024-03-31) o italiane (31/03/2024)
+    text = values.fillna('').str.strip()
+    dates = pd.to_datetime(text, format='ISO8601', errors='coerce')
+    missing = dates.isna()
+    if missing.any():
+        dates[missing] = pd.to_datetime(text[missing], format='%d/%m/%Y', errors='coerce')
+    return dates
+
+def _parse_values(values, decimal):
+    text = values.fillna('').str.strip().str.replace('€', '', regex=False).str.strip()
+    if decimal == ',':
+        text = text.str.replace('.', '', regex=False).str.replace(',', '.', regex=False)
+    return pd.to_numeric(text, errors='coerce')
+
+def _read_products(cursor):
+    # Anagrafica dei prodotti per l'abbinamento delle righe: id, nome, vincolo, inserimento
+    cursor.execute("SELECT id, nome, vincolo, data_inserimento FROM prodotti_finanziari;")
+    products = pd.DataFrame(cursor.fetchall(), columns=['id', 'nome', 'vincolo', 'data_inserimento'])
+    products['data_inserimento'] = pd.to_datetime(products['data_inserimento'])
+    names = products['nome'].str.strip().str.casefold()
+    ambiguous = set(names[names.duplicated(keep=False)])
+    by_name = pd.Series(products['id'].to_numpy(), index=names)
+    by_name = by_name[~by_name.index.isin(ambiguous)]
+    return products.set_index('id'), by_name, ambiguous
+
+def _validate_chunk(chunk, columns, products, by_name, ambiguous, decimal, today):
+    """
+    Matches and validates a chunk of rows with vectorized operations
+
+    Returns:
+    - tuple: (DataFrame of the accepted rows, DataFrame riga/motivo of the rejected ones)
+    """
+    rows = chunk.index.to_numpy() + 2  # numero di riga nel file (intestazione = 1)
+
+    product_ids = pd.Series(pd.NA, index=chunk.index, dtype=object)
+    names = None
+    if columns['id'] is not None:
+        ids = chunk[columns['id']].fillna('').str.strip()
+        product_ids = ids.where(ids.isin(products.index), pd.NA)
+    if columns['name'] is not None:
+        names = chunk[columns['name']].fillna('').str.strip().str.casefold()
+        product_ids = product_ids.fillna(names.map(by_name))
+
+    dates = _parse_dates(chunk[columns['date']])
+    values = _parse_values(chunk[columns['value']], decimal)
+    known = product_ids.notna()
+    matched = products.reindex(product_ids.where(known, ''))
+
+    # Un solo motivo per riga, nell'ordine dei controlli
+    reasons = np.select(
+        [
+            (~known & names.isin(ambiguous)).to_numpy() if names is not None else np.zeros(len(chunk), dtype=bool),
+            (~known).to_numpy(),
+            (matched['vincolo'] != 'Liquido').to_numpy(),
+            dates.isna().to_numpy(),
+            (dates > pd.Timestamp(today)).to_numpy(),
+            (dates < matched['data_inserimento'].to_numpy()).to_numpy(),
+            values.isna().to_numpy(),
+            (values < 0).to_numpy()
+        ],
+        [
+            'nome ambiguo', 'prodotto sconosciuto', 'prodotto non liquido', 'data non valida',
+            'data futura', "data precedente all'inserimento", 'valore non valido', 'valore negativo'
+        ],
+        default=''
+    )
+    accepted = reasons == ''
+
+    notes = chunk[columns['note']].fillna('').str.strip() if columns['note'] is not None else pd.Series('', index=chunk.index)
+    staged = pd.DataFrame({
+        'riga': rows[accepted],
+        'product_id': product_ids[accepted].to_numpy(),
+        'data_aggiornamento': dates[accepted].dt.strftime('%Y-%m-%d').to_numpy(),
+        'valore': values[accepted].round(2).to_numpy(),
+        'note': notes[accepted].replace('', DEFAULT_NOTE).to_numpy()
+    })
+    rejected = pd.DataFrame({'riga': rows[~accepted], 'motivo': reasons[~accepted]})
+    return staged, rejected
+
+def _copy_rows(cursor, staged):
+    # COPY nella tabella di appoggio: un solo round trip per blocco
+    buffer = io.StringIO()
+    staged.to_csv(buffer, index=False, header=False)
+    buffer.seek(0)
+    cursor.copy_expert(
+        "COPY import_quotazioni (riga, product_id, data_aggiornamento, valore, note) FROM STDIN WITH (FORMAT csv);",
+        buffer
+    )
+
+def _discard(cursor, query, reason):
+    # Elimina righe dalla tabella di appoggio e le restituisce come scarti
+    cursor.execute(query)
+    return pd.DataFrame({'riga': [row[0] for row in cursor.fetchall()], 'motivo': reason})
+
+def import_quotes(source, sep=',', decimal='.', chunk_size=QUOTE_CHUNK_SIZE, dry_run=False):
+    """
+    Imports the values (NAV, quotes) of liquid products from a CSV file.
+    The file is read in chunks; each chunk is matched and validated with
+    vectorized operations and copied with COPY into a staging table. All the
+    history rows and the new values are then applied with set-based statements
+    in a single transaction: either the whole file is imported or nothing.
+
+    The file needs a product column (id or name), a date column and a value
+    column (see ID_COLUMNS, NAME_COLUMNS, DATE_COLUMNS, VALUE_COLUMNS); an
+    optional note column is recorded in the history.
+
+    Parameters:
+    - source: Path or file-like object of the CSV file
+    - sep: Field separator
+    - decimal: Decimal separator of the values ('.' or ',')
+    - chunk_size: Rows read and validated at a time
+    - dry_run: Boolean, validate and apply, then roll back
+
+    Returns:
+    - dict: rows, imported, rejected, products_updated, seconds, rows_per_second,
+      rejects (DataFrame riga/motivo) and error (None if the import succeeded)
+    """
+    started = time.perf_counter()
+    report = {
+        'rows': 0, 'imported': 0, 'rejected': 0, 'products_updated': 0,
+        'seconds': 0.0, 'rows_per_second': 0.0,
+        'rejects': pd.DataFrame(columns=['riga', 'motivo']), 'error': None
+    }
+
+    conn = get_db_connection()
+    if conn is None:
+        report['error'] = "Impossibile connettersi al database"
+        return report
+
+    cursor = conn.cursor()
+    rejects = []
+    years = set()
+    try:
+        products, by_name, ambiguous = _read_products(cursor)
+        cursor.execute(STAGING_TABLE)
+        today = datetime.date.today()
+
+        reader = pd.read_csv(source, sep=sep, dtype=str, keep_default_na=False, chunksize=chunk_size)
+        columns = None
+        for chunk in reader:
+            if columns is None:
+                columns = {
+                    'id': _find_column(chunk.columns, ID_COLUMNS),
+                    'name': _find_column(chunk.columns, NAME_COLUMNS),
+                    'date': _find_column(chunk.columns, DATE_COLUMNS),
+                    'value': _find_column(chunk.columns, VALUE_COLUMNS),
+                    'note': _find_column(chunk.columns, NOTE_COLUMNS)
+                }
+                if (columns['id'] is None and columns['name'] is None) or columns['date'] is None or columns['value'] is None:
+                    raise ValueError("Il file deve avere le colonne prodotto (id o nome), data e valore")
+
+            staged, rejected = _validate_chunk(chunk, columns, products, by_name, ambiguous, decimal, today)
+            report['rows'] += len(chunk)
+            rejects.append(rejected)
+            if not staged.empty:
+                _copy_rows(cursor, staged)
+                years.update(int(year) for year in pd.unique(staged['data_aggiornamento'].str[:4]))
+
+        # Le partizioni mancanti vanno create prima di accedere allo storico in questa transazione
+        for year in sorted(years):
+            if not ensure_history_partition(year):
+                raise RuntimeError(f"Impossibile creare la partizione {year} dello storico dei valori")
+
+        # Più valori per lo stesso prodotto e data: vale l'ultima riga del file
+        rejects.append(_discard(cursor, """
+            DELETE FROM import_quotazioni WHERE riga IN (
+                SELECT riga FROM (
+                    SELECT riga, row_number() OVER (
+                        PARTITION BY product_id, data_aggiornamento ORDER BY riga DESC) AS n
+                    FROM import_quotazioni
+                ) AS doppie WHERE n > 1
+            ) RETURNING riga;
+        """, 'sostituita da una riga successiva'))
+
+        cursor.execute("SELECT DISTINCT product_id FROM import_quotazioni;")
+        ids = [row[0] for row in cursor.fetchall()]
+        # Blocca i prodotti e ne toglie il contributo dagli aggregati
+        withdraw_from_summary(cursor, ids)
+
+        # Controlli ripetuti sui prodotti bloccati e righe già importate in precedenza
+        rejects.append(_discard(cursor, """
+            DELETE FROM import_quotazioni s WHERE NOT EXISTS (
+                SELECT 1 FROM prodotti_finanziari p WHERE p.id = s.product_id AND p.vincolo = 'Liquido'
+            ) RETURNING riga;
+        """, 'prodotto non liquido'))
+        rejects.append(_discard(cursor, """
+            DELETE FROM import_quotazioni s WHERE EXISTS (
+                SELECT 1 FROM storico_valori h
+                WHERE h.product_id = s.product_id AND h.data_aggiornamento = s.data_aggiornamento
+                  AND h.capitale_nuovo = s.valore
+            ) RETURNING riga;
+        """, 'già presente nello storico'))
+
+        cursor.execute("ANALYZE import_quotazioni;")
+        cursor.execute(APPLY_QUERY)
+        report['imported'], report['products_updated'] = cursor.fetchone()
+        if ids:
+            bump_data_version(cursor, ids)
+
+        if dry_run:
+            conn.rollback()
+        else:
+            conn.commit()
+            if ids:
+                mark_products_stale(ids)
+    except Exception as e:
+        print(f"Errore durante l'importazione delle quotazioni: {e}")
+        conn.rollback()
+        report['error'] = str(e)
+        report['imported'] = 0
+        report['products_updated'] = 0
+    finally:
+        cursor.close()
+        conn.close()
+
+    rejects = [frame for frame in rejects if not frame.empty]
+    if rejects:
+        report['rejects'] = pd.concat(rejects, ignore_index=True).sort_values('riga', ignore_index=True)
+    report['rejected'] = len(report['rejects'])
+    report['seconds'] = time.perf_counter() - started
+    report['rows_per_second'] = report['rows'] / report['seconds'] if report['seconds'] > 0 else 0.0
+    return report
@@ -0,0 +1,250 @@
+import re
+import threading
+import unicodedata
+import numpy as np
+import pandas as pd
+
+# Campi indicizzati e peso nel punteggio: le corrispondenze nel nome contano di più
+SEARCH_FIELDS = {'nome': 1.0, 'fornitore': 0.6, 'tipologia': 0.6, 'note': 0.3}
+
+# Somiglianza minima (quota di trigrammi in comune) perché un termine con errori
+# di battitura corrisponda: "azionrio" trova "azionario" ma non "obbligazionario"
+MIN_SIMILARITY = 0.7
+
+# Termini fino a questa lunghezza non hanno trigrammi interni: oltre all'inizio
+# parola vengono cercati come sottostringa, come nel filtro originale dell'elenco
+SHORT_TERM_LENGTH = 2
+
+# Punteggio di una corrispondenza esatta sommato al peso del campo: supera sempre
+# quello di una corrispondenza con errori (al massimo 1.0), che restano in coda
+EXACT_BONUS = 2.0
+
+# Peso di un termine breve trovato solo all'interno di una parola (es. "tf" in "etf")
+SUBSTRING_WEIGHT = 0.2
+
+_WORD = re.compile(r'\w+')
+
+def normalize_text(text):
+    """
+    Casefolds a text and removes accents, so that "Società" matches "societa"
+    """
+    text = unicodedata.normalize('NFKD', str(text).casefold())
+    return ''.join(ch for ch in text if not unicodedata.combining(ch))
+
+def _word_trigrams(word):
+    # Due spazi iniziali: i trigrammi del prefisso permettono la ricerca per inizio parola
+    padded = f"  {word} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+def _query_trigrams(token):
+    # Trigrammi del termine come prefisso di parola e, se abbastanza lungo,
+    # come sottostringa in qualsiasi punto della parola
+    padded = f"  {token}"
+    prefix = [padded[i:i + 3] for i in range(len(padded) - 2)]
+    infix = [token[i:i + 3] for i in range(len(token) - 2)]
+    return list(dict.fromkeys(prefix)), list(dict.fromkeys(infix))
+
+class SearchIndex:
+    """
+    In-memory trigram index over the text fields of the products.
+    Postings map each trigram to the documents containing it; a query term
+    matches a product when enough of its trigrams are found (prefix, infix and
+    typo-tolerant matching) and results are ranked by similarity and field.
+    The index is kept in sync incrementally: only products whose text changed
+    are re-indexed.
+    """
+
+    def __init__(self):
+        self.version = None
+        self._lock = threading.RLock()
+        self._slots = {}        # id prodotto -> posizione del documento
+        self._ids = []          # posizione -> id prodotto (None se rimosso)
+        self._texts = []        # posizione -> testo indicizzato (normalizzato)
+        self._raw = {}          # id prodotto -> campi originali, per riconoscere le modifiche
+        self._free = []
+        self._postings = {}     # (campo, trigramma) -> set di posizioni
+        self._arrays = {}       # versione numpy delle postings, costruita al bisogno
+
+    def __len__(self):
+        return len(self._slots)
+
+    def _document(self, row):
+        return {field: normalize_text(row.get(field) or '') for field in SEARCH_FIELDS}
+
+    def _trigrams(self, document):
+        grams = set()
+        for field, text in document.items():
+            for word in _WORD.findall(text):
+                grams.update((field, gram) for gram in _word_trigrams(word))
+        return grams
+
+    def _add(self, product_id, document, key):
+        slot = self._free.pop() if self._free else len(self._ids)
+        if slot == len(self._ids):
+            self._ids.append(None)
+            self._texts.append(None)
+        self._ids[slot] = product_id
+        self._texts[slot] = key
+        self._slots[product_id] = slot
+        for posting in self._trigrams(document):
+            self._postings.setdefault(posting, set()).add(slot)
+            self._arrays.pop(posting, None)
+
+    def remove(self, product_id):
+        """
+        Removes a product from the index
+        """
+        with self._lock:
+            slot = self._slots.pop(product_id, None)
+            if slot is None:
+                return
+            document = dict(zip(SEARCH_FIELDS, self._texts[slot].split('\x1f')))
+            for posting in self._trigrams(document):
+                slots = self._postings.get(posting)
+                if slots is not None:
+                    slots.discard(slot)
+                    self._arrays.pop(posting, None)
+                    if not slots:
+                        del self._postings[posting]
+            self._ids[slot] = None
+            self._texts[slot] = None
+            self._raw.pop(product_id, None)
+            self._free.append(slot)
+
+    def update(self, product_id, row):
+        """
+        Indexes a product, replacing its previous text if already present
+
+        Parameters:
+        - product_id: ID of the product
+        - row: dict (or Series) with the searchable fields
+        """
+        document = self._document(row)
+        key = '\x1f'.join(document.values())
+        with self._lock:
+            slot = self._slots.get(product_id)
+            if slot is not None and self._texts[slot] == key:
+                return
+            self.remove(product_id)
+            self._add(product_id, document, key)
+
+    def sync(self, df, version=None):
+        """
+        Brings the index in line with a products DataFrame, re-indexing only
+        added or changed products and dropping the deleted ones
+
+        Parameters:
+        - df: DataFrame containing financial products data (with an 'id' column)
+        - version: Data version the DataFrame corresponds to
+        """
+        with self._lock:
+            if df.empty or 'id' not in df.columns:
+                for product_id in list(self._slots):
+                    self.remove(product_id)
+                self.version = version
+                return
+
+            fields = df.reindex(columns=list(SEARCH_FIELDS)).astype(object).fillna('').astype(str)
+            raw = fields[list(SEARCH_FIELDS)[0]].str.cat(
+                [fields[field] for field in list(SEARCH_FIELDS)[1:]], sep='\x1f')
+            ids = df['id'].tolist()
+            for product_id in set(self._slots) - set(ids):
+                self.remove(product_id)
+            
+            # Confronto vettoriale dei testi: si re-indicizzano solo i prodotti modificati
+            previous = pd.Series([self._raw.get(product_id) for product_id in ids], index=df.index, dtype=object)
+            changed = (previous != raw).to_numpy()
+            positions = np.flatnonzero(changed)
+            records = fields.iloc[positions].to_dict('records')
+            for position, row in zip(positions, records):
+                product_id = ids[position]
+                self.update(product_id, row)
+                self._raw[product_id] = raw.iloc[position]
+            self.version = version
+
+    def _posting_array(self, field, gram):
+        array = self._arrays.get((field, gram))
+        if array is None:
+            slots = self._postings.get((field, gram), ())
+            array = np.fromiter(slots, dtype=np.int64, count=len(slots))
+            self._arrays[(field, gram)] = array
+        return array
+
+    def search(self, query, limit=None, min_similarity=MIN_SIMILARITY):
+        """
+        Returns the IDs of the products matching every term of the query,
+        best matches first
+
+        Parameters:
+        - query: Text typed by the user
+        - limit: Maximum number of results (None for all)
+        - min_similarity: Minimum share of a term's trigrams found in a product
+          for a match with typos; exact matches always rank first
+
+        Returns:
+        - list: product IDs ordered by relevance
+        """
+        tokens = _WORD.findall(normalize_text(query))
+        if not tokens:
+            return []
+
+        with self._lock:
+            if not self._slots:
+                return []
+            score = np.zeros(len(self._ids), dtype=np.float64)
+            matched = np.ones(len(self._ids), dtype=bool)
+            for token in tokens:
+                prefix, infix = _query_trigrams(token)
+                # I termini brevi hanno pochi trigrammi: per loro nessuna tolleranza agli errori
+                required = 1.0 if len(token) <= 3 else min_similarity
+                best = np.zeros(len(self._ids), dtype=np.float64)
+                for field, weight in SEARCH_FIELDS.items():
+                    similarity = self._field_counts(field, prefix) / len(prefix)
+                    if infix:
+                        similarity = np.maximum(similarity, self._field_counts(field, infix) / len(infix))
+                    # Il campo migliore determina il punteggio del termine
+                    term_score = np.where(similarity >= 1.0, EXACT_BONUS + weight, similarity * weight)
+                    best = np.maximum(best, np.where(similarity >= required, term_score, 0.0))
+                if len(token) <= SHORT_TERM_LENGTH:
+                    best = np.where((best == 0) & self._contains(token), EXACT_BONUS + SUBSTRING_WEIGHT, best)
+                matched &= best > 0
+                score += best
+
+            slots = np.flatnonzero(matched)
+            # Ordinamento stabile: a parità di punteggio resta l'ordine di inserimento
+            slots = slots[np.argsort(-score[slots], kind='stable')]
+            if limit is not None:
+                slots = slots[:limit]
+            return [self._ids[slot] for slot in slots]
+
+    def _contains(self, token):
+        # Sottostringa nei testi indicizzati; il separatore dei campi non è una
+        # lettera, quindi un termine non può corrispondere a cavallo di due campi
+        texts = pd.Series(self._texts, dtype=object)
+        return texts.str.contains(token, regex=False, na=False).to_numpy()
+
+    def _field_counts(self, field, grams):
+        counts = np.zeros(len(self._ids), dtype=np.float64)
+        for gram in grams:
+            # Ogni posting contiene posizioni distinte: l'indicizzazione somma senza duplicati
+            counts[self._posting_array(field, gram)] += 1.0
+        return counts
+
+_index = SearchIndex()
+
+def get_search_index(df):
+    """
+    Returns the process-wide search index, synchronized with the given
+    portfolio. The index is updated only when the data version changes, and
+    then only for the products that changed.
+
+    Parameters:
+    - df: DataFrame containing financial products data (from load_data_cached)
+
+    Returns:
+    - SearchIndex
+    """
+    version = df.attrs.get('data_version')
+    if version is None or _index.version != version:
+        _index.sync(df, version)
+    return _index